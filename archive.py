@@ -0,0 +1,405 @@
+import argparse
+import gzip
+import hashlib
+import os
+import queue
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+ARCHIVE_DIR = "archive"
+HTML_DIR = "html"
+WEB_PAGE_METADATA_FILE = "data/web-page-metadata.tsv"
+
+# Start a new segment once the current one grows past this size
+MAX_SEGMENT_SIZE = 1024 * 1024 * 1024
+
+ARCHIVE_INDEX_HEADER = "file_path\turl\ttimestamp\tsha256\tsegment\toffset\tlength\tsize\n"
+
+
+class ArchiveRecord:
+    """Location of a single archived page inside a segment file"""
+
+    __slots__ = ("file_path", "url", "timestamp", "sha256", "segment", "offset", "length", "size")
+
+    def __init__(self, file_path: str, url: str, timestamp: str, sha256: str,
+                 segment: str, offset: int, length: int, size: int):
+        self.file_path = file_path
+        self.url = url
+        self.timestamp = timestamp
+        self.sha256 = sha256
+        self.segment = segment
+        self.offset = offset
+        self.length = length
+        self.size = size
+
+    def to_tsv(self) -> str:
+        return (f"{self.file_path}\t{self.url}\t{self.timestamp}\t{self.sha256}\t"
+                f"{self.segment}\t{self.offset}\t{self.length}\t{self.size}\n")
+
+
+def decompress_page(compressed: bytes) -> str:
+    """HTML content of an archived page from its gzip member"""
+    return gzip.decompress(compressed).decode('utf-8')
+
+
+class HtmlArchive:
+    """
+    Compressed, content-addressed storage for downloaded HTML pages.
+
+    Pages are appended as independent gzip members to large segment files, the same
+    layout WARC files use, so a segment can be read sequentially or one record at a
+    time. Identical pages are stored once and share a record location. The index
+    maps the page path (`html/SYMBOL_TIMESTAMP.html`) and URL + timestamp to the
+    segment, offset and compressed length of the page.
+    """
+
+    def __init__(self, archive_dir: str = ARCHIVE_DIR, max_segment_size: int = MAX_SEGMENT_SIZE):
+        """
+        Args:
+            archive_dir: Directory holding the segment files and the index
+            max_segment_size: Segment size in bytes after which a new segment is started
+        """
+        self.archive_dir = archive_dir
+        self.max_segment_size = max_segment_size
+        self.index_file = os.path.join(archive_dir, "index.tsv")
+
+        self.records: Dict[str, ArchiveRecord] = {}  # file_path -> record
+        self.by_url: Dict[Tuple[str, str], ArchiveRecord] = {}  # (url, timestamp) -> record
+        self.by_hash: Dict[str, ArchiveRecord] = {}  # sha256 -> first record with this content
+        self._lock = threading.Lock()
+
+        os.makedirs(archive_dir, exist_ok=True)
+        if not os.path.exists(self.index_file):
+            with open(self.index_file, 'w', encoding='utf-8') as f:
+                f.write(ARCHIVE_INDEX_HEADER)
+        self._load_index()
+
+        self.segment = self._last_segment()
+
+    def _load_index(self):
+        with open(self.index_file, 'r', encoding='utf-8') as f:
+            next(f, None)  # Skip header line
+            for line in f:
+                parts = line.rstrip('\n').split('\t')
+                if len(parts) != 8:
+                    continue  # Partially written line from an interrupted run
+                file_path, url, timestamp, sha256, segment, offset, length, size = parts
+                self._add_record(ArchiveRecord(file_path, url, timestamp, sha256,
+                                               segment, int(offset), int(length), int(size)))
+
+    def _add_record(self, record: ArchiveRecord):
+        self.records[record.file_path] = record
+        if record.url:
+            self.by_url[(record.url, record.timestamp)] = record
+        self.by_hash.setdefault(record.sha256, record)
+
+    def _last_segment(self) -> str:
+        segments = self.segments()
+        if segments:
+            return segments[-1]
+        return "segment-00000.html.gz"
+
+    def _segment_path(self, segment: str) -> str:
+        return os.path.join(self.archive_dir, segment)
+
+    def segments(self) -> List[str]:
+        """Names of all segment files in order"""
+        return sorted(name for name in os.listdir(self.archive_dir) if name.startswith("segment-"))
+
+    def put(self, file_path: str, html_content: str, url: str = "", timestamp: str = "") -> ArchiveRecord:
+        """
+        Store a page in the archive
+
+        Args:
+            file_path: Path the page is known by (used as `source_file` in the extracted data)
+            html_content: The HTML content to store
+            url: URL the page was downloaded from
+            timestamp: Download timestamp
+
+        Returns:
+            Record describing where the page is stored
+        """
+        data = html_content.encode('utf-8')
+        sha256 = hashlib.sha256(data).hexdigest()
+
+        with self._lock:
+            existing = self.by_hash.get(sha256)
+            if existing is not None:
+                # Same content is already stored, only index it under the new path
+                record = ArchiveRecord(file_path, url, timestamp, sha256,
+                                       existing.segment, existing.offset, existing.length, existing.size)
+            else:
+                compressed = gzip.compress(data, compresslevel=6, mtime=0)
+                segment_path = self._segment_path(self.segment)
+                if os.path.exists(segment_path) and os.path.getsize(segment_path) >= self.max_segment_size:
+                    number = int(self.segment.split('-')[1].split('.')[0]) + 1
+                    self.segment = f"segment-{number:05d}.html.gz"
+                    segment_path = self._segment_path(self.segment)
+
+                with open(segment_path, 'ab') as f:
+                    offset = f.tell()
+                    f.write(compressed)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                record = ArchiveRecord(file_path, url, timestamp, sha256,
+                                       self.segment, offset, len(compressed), len(data))
+
+            # The index line is written after the data, so it never points at a missing record
+            with open(self.index_file, 'a', encoding='utf-8') as f:
+                f.write(record.to_tsv())
+            self._add_record(record)
+
+        return record
+
+    def read_record(self, record: ArchiveRecord) -> str:
+        """Read and decompress a single archived page"""
+        with open(self._segment_path(record.segment), 'rb') as f:
+            f.seek(record.offset)
+            compressed = f.read(record.length)
+        return decompress_page(compressed)
+
+    def get(self, file_path: str) -> Optional[str]:
+        """
+        Read a page by its path
+
+        Args:
+            file_path: Path the page was stored under
+
+        Returns:
+            The HTML content, or None if the page is not archived
+        """
+        record = self.records.get(file_path)
+        if record is None:
+            return None
+        return self.read_record(record)
+
+    def get_by_url(self, url: str, timestamp: str) -> Optional[str]:
+        """Read a page by the URL and timestamp it was downloaded with"""
+        record = self.by_url.get((url, timestamp))
+        if record is None:
+            return None
+        return self.read_record(record)
+
+    def iter_records(self, file_paths: Optional[List[str]] = None) -> Iterator[Tuple[ArchiveRecord, bytes]]:
+        """
+        Iterate over the compressed archived pages in storage order
+
+        Every segment is read from start to end in one pass, so reprocessing the whole
+        archive turns into large sequential reads. Pages are decompressed by the caller,
+        so one corrupt record doesn't end the iteration.
+
+        Args:
+            file_paths: Only yield these pages (all pages if None)
+
+        Yields:
+            (record, compressed page) tuples, see `decompress_page`
+        """
+        if file_paths is None:
+            records = list(self.records.values())
+        else:
+            records = [self.records[path] for path in file_paths if path in self.records]
+        records.sort(key=lambda r: (r.segment, r.offset))
+
+        current_segment = None
+        segment_file = None
+        try:
+            for record in records:
+                if record.segment != current_segment:
+                    if segment_file:
+                        segment_file.close()
+                    segment_file = open(self._segment_path(record.segment), 'rb')
+                    current_segment = record.segment
+                # Reading in storage order keeps the seeks forward-only within a segment
+                segment_file.seek(record.offset)
+                yield record, segment_file.read(record.length)
+        finally:
+            if segment_file:
+                segment_file.close()
+
+    def iter_pages(self, file_paths: Optional[List[str]] = None) -> Iterator[Tuple[str, str]]:
+        """
+        Iterate over archived pages in storage order, see `iter_records`
+
+        Args:
+            file_paths: Only yield these pages (all pages if None)
+
+        Yields:
+            (file_path, html_content) tuples
+        """
+        for record, compressed in self.iter_records(file_paths):
+            yield record.file_path, decompress_page(compressed)
+
+    def stored_bytes(self) -> int:
+        """Total size of the segment files on disk"""
+        return sum(os.path.getsize(self._segment_path(segment)) for segment in self.segments())
+
+    def __contains__(self, file_path: str) -> bool:
+        return file_path in self.records
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+
+class AsyncArchiveWriter:
+    """
+    Writes pages to the archive on a background thread.
+
+    Compressing and fsyncing a page happens off the download path. The number of
+    pages waiting to be written is bounded, so a slow disk slows the downloader down
+    instead of piling pages up in memory. A page is only durable once its
+    `on_done` callback ran without an error, anything that depends on the page being
+    in the archive has to wait for it.
+    """
+
+    def __init__(self, archive: Optional[HtmlArchive] = None, max_pending: int = 256):
+        """
+        Args:
+            archive: Archive to write to (the default archive if None)
+            max_pending: Maximum number of pages waiting to be written
+        """
+        self.archive = archive if archive is not None else get_archive()
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            file_path, html_content, url, timestamp, on_done = item
+            error = None
+            try:
+                self.archive.put(file_path, html_content, url=url, timestamp=timestamp)
+            except Exception as e:
+                print(f"Error archiving {file_path}: {e}")
+                error = e
+            if on_done is not None:
+                try:
+                    on_done(error)
+                except Exception as e:
+                    print(f"Error completing {file_path}: {e}")
+
+    def put(self, file_path: str, html_content: str, url: str = "", timestamp: str = "",
+            on_done: Optional[Callable[[Optional[Exception]], None]] = None):
+        """
+        Queue a page to be written to the archive
+
+        Args:
+            file_path: Path the page is known by
+            html_content: The HTML content to store
+            url: URL the page was downloaded from
+            timestamp: Download timestamp
+            on_done: Called on the writer thread once the page is written, with None, or with the
+                exception if it couldn't be written
+        """
+        self._queue.put((file_path, html_content, url, timestamp, on_done))
+
+    def close(self):
+        """Write the remaining pages and stop the writer thread"""
+        self._queue.put(None)
+        self._thread.join()
+
+
+_archives = {}
+_archives_lock = threading.Lock()
+
+
+def get_archive(archive_dir: str = ARCHIVE_DIR) -> HtmlArchive:
+    """Get the archive instance shared by all callers in this process"""
+    with _archives_lock:
+        archive = _archives.get(archive_dir)
+        if archive is None:
+            archive = HtmlArchive(archive_dir)
+            _archives[archive_dir] = archive
+        return archive
+
+
+def read_html(html_file: str, archive: Optional[HtmlArchive] = None) -> str:
+    """
+    Read a page from the archive, falling back to a loose HTML file on disk
+
+    Args:
+        html_file: Path of the page, e.g. html/AAPL_20251016_142146.html
+        archive: Archive to read from (the default archive if None)
+
+    Returns:
+        The HTML content
+    """
+    if archive is None:
+        archive = get_archive()
+
+    html_content = archive.get(html_file)
+    if html_content is not None:
+        return html_content
+
+    with open(html_file, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def pack_html_dir(html_dir: str = HTML_DIR, archive: Optional[HtmlArchive] = None, delete: bool = False,
+                  metadata_file: str = WEB_PAGE_METADATA_FILE) -> int:
+    """
+    Move loose HTML files into the archive
+
+    Args:
+        html_dir: Directory with the loose HTML files
+        archive: Archive to pack into (the default archive if None)
+        delete: Remove every file once it is archived
+        metadata_file: Page metadata TSV used to look up the URL and timestamp of every file
+
+    Returns:
+        Number of files that were archived
+    """
+    if archive is None:
+        archive = get_archive()
+
+    # file_path -> (url, timestamp)
+    page_metadata = {}
+    if os.path.exists(metadata_file):
+        with open(metadata_file, 'r', encoding='utf-8') as f:
+            next(f, None)  # Skip header line
+            for line in f:
+                parts = line.rstrip('\n').split('\t')
+                if len(parts) >= 3 and parts[1]:
+                    page_metadata[parts[1]] = (parts[0], parts[2])
+
+    packed = 0
+    for filename in sorted(os.listdir(html_dir)):
+        file_path = os.path.join(html_dir, filename)
+        if not os.path.isfile(file_path):
+            continue
+
+        if file_path not in archive:
+            url, timestamp = page_metadata.get(file_path, ("", ""))
+            with open(file_path, 'r', encoding='utf-8') as f:
+                archive.put(file_path, f.read(), url=url, timestamp=timestamp)
+            packed += 1
+
+        if delete:
+            os.remove(file_path)
+
+    print(f"Archived {packed} files from {html_dir}")
+    return packed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compressed HTML archive")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    pack_parser = subparsers.add_parser("pack", help="move loose HTML files into the archive")
+    pack_parser.add_argument("--html-dir", default=HTML_DIR)
+    pack_parser.add_argument("--delete", action="store_true", help="delete files once they are archived")
+
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        archive = get_archive()
+        pack_html_dir(args.html_dir, archive, delete=args.delete)
+        print(f"Archive holds {len(archive)} pages in {len(archive.segments())} segments "
+              f"({round(archive.stored_bytes() / (1024 * 1024), 2)} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,694 @@
+"""
+Benchmarks for the performance-sensitive parts of the project.
+
+Usage:
+    python benchmark.py extract [--limit N]          # Extraction pages/sec on the HTML corpus
+    python benchmark.py index-build [--sizes N,N,..]  # Index build records/sec on synthetic rows
+        [--workers N,N,..]                            # ... with each number of build processes
+    python benchmark.py index-memory [--size N]       # Bytes per posting in memory and on disk
+    python benchmark.py index-open [--sizes N,N,..]   # Time and heap to open a saved index
+    python benchmark.py search [--size N]             # Query latency, top-k pruning vs scoring every match
+    python benchmark.py search-backends [--size N]    # p50/p99 query latency of the python and numpy scorers
+    python benchmark.py search-cache [--size N]       # Repeated query latency with and without the query cache
+    python benchmark.py search-ranges [--size N]      # Range predicate latency, sorted columns vs a full scan
+    python benchmark.py search-shards [--size N]      # Queries/sec of sharded multi-process search
+        [--workers N,N,..] [--clients N]              # ... with each number of search processes, N query threads
+"""
+
+import argparse
+import csv
+import math
+import os
+import pickle
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from archive import get_archive, HTML_DIR
+from extractor import StockDataExtractor, TSV_FIELDNAMES
+from doc_store import DocumentStore
+from indexer import StockIndexer, INDEX_FORMAT_VERSION
+from numeric_fields import numeric_fields, numeric_value
+from query_cache import QueryCache
+from sharded_search import ShardedIndexer
+
+
+def load_corpus(limit: int) -> List[Tuple[str, str]]:
+    """
+    Load up to `limit` pages from the archive and the loose HTML directory
+
+    Returns:
+        List of (file_path, html_content) tuples
+    """
+    pages = []
+    archive = get_archive()
+
+    for file_path, html_content in archive.iter_pages():
+        if len(pages) >= limit:
+            return pages
+        pages.append((file_path, html_content))
+
+    if os.path.isdir(HTML_DIR):
+        for filename in sorted(os.listdir(HTML_DIR)):
+            if len(pages) >= limit:
+                break
+            file_path = os.path.join(HTML_DIR, filename)
+            if os.path.isfile(file_path) and file_path not in archive:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    pages.append((file_path, f.read()))
+
+    return pages
+
+
+def extract_legacy(extractor: StockDataExtractor, html_content: str, filename: str) -> Dict[str, any]:
+    """
+    Extract a record the way it was done before the label-anchored scanner
+
+    Every field runs its own uncompiled regex over the whole page, most of them with
+    `re.findall`, which keeps scanning after the first match.
+    """
+    def first(field_patterns, flags, blank_falls_through=False):
+        for pattern in field_patterns:
+            if flags == re.DOTALL:
+                match = re.search(pattern, html_content, flags)
+                value = match.group(1) if match else None
+            else:
+                matches = re.findall(pattern, html_content, flags)
+                value = matches[0] if matches else None
+            if value is not None and (not blank_falls_through or value.strip()):
+                return value
+        return None
+
+    patterns = extractor.patterns
+    symbol = os.path.basename(filename).split('_')[0]
+    company = first(patterns.COMPANY_NAME, re.IGNORECASE, True)
+    exchange = first(patterns.EXCHANGE, re.IGNORECASE, True)
+    current_price = first(patterns.CURRENT_PRICE, re.DOTALL)
+    market_cap = first(patterns.MARKET_CAP, re.IGNORECASE)
+    founded = first(patterns.FOUNDED_YEAR, re.IGNORECASE)
+    employees = first(patterns.EMPLOYEES, re.IGNORECASE)
+    revenue = first(patterns.REVENUE, re.IGNORECASE)
+    ebitda = first(patterns.EBITDA, re.DOTALL)
+    previous_close = first(patterns.PREVIOUS_CLOSE, re.DOTALL)
+
+    if current_price is not None:
+        current_price = "$" + current_price.replace(',', '').replace('$', '')
+    if previous_close is not None:
+        previous_close = "$" + previous_close.replace(',', '').replace('$', '')
+
+    data = {
+        "company": company.strip() if company else f"{symbol} Corporation",
+        "symbol": symbol,
+        "exchange": exchange.strip().upper() if exchange else None,
+        "source_file": filename,
+    }
+    fields = {
+        "current_price": current_price,
+        "market_cap": market_cap,
+        "founded": founded,
+        "employees": employees.replace(',', '') if employees else None,
+        "revenue": revenue.strip() if revenue else None,
+        "ebitda": ebitda.strip() if ebitda else None,
+        "previous_close": previous_close,
+    }
+    data.update({key: value for key, value in fields.items() if value})
+    data.update(extractor.calculate_price_changes(current_price, previous_close))
+    return data
+
+
+def benchmark_extract(limit: int):
+    pages = load_corpus(limit)
+    if not pages:
+        print("No HTML pages found in the archive or the html directory")
+        return
+
+    total_mb = sum(len(html_content) for _, html_content in pages) / (1024 * 1024)
+    print(f"Benchmarking extraction on {len(pages)} pages ({total_mb:.1f} MB)")
+
+    extractor = StockDataExtractor()
+
+    start = time.perf_counter()
+    before = [extract_legacy(extractor, html_content, file_path) for file_path, html_content in pages]
+    before_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    after = [extractor.extract_stock_data_from_html(html_content, file_path) for file_path, html_content in pages]
+    after_seconds = time.perf_counter() - start
+
+    mismatches = 0
+    for (file_path, _), old, new in zip(pages, before, after):
+        new = {key: value for key, value in new.items() if key != "timestamp"}
+        if old != new:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"MISMATCH {file_path}:\n  before: {old}\n  after:  {new}")
+
+    print(f"Before (per-field regex scans): {len(pages) / before_seconds:.2f} pages/sec")
+    print(f"After (label-anchored scanner): {len(pages) / after_seconds:.2f} pages/sec")
+    print(f"Speedup: {before_seconds / after_seconds:.2f}x")
+    print(f"Mismatches: {mismatches}")
+
+
+COMPANY_WORDS = ["Apple", "Nike", "Global", "Energy", "Bitcoin", "Trust", "Holdings", "Bank", "Pharma",
+                 "Systems", "Capital", "Growth", "Income", "Semiconductor", "Motors", "Foods", "Realty",
+                 "Technologies", "Gold", "Health", "Dividend", "Treasury", "Index", "Airlines", "Media"]
+EXCHANGES = ["NASDAQ", "NYSE", "NYSEARCA", "NSE", "BATS", ""]
+
+
+def synthetic_rows(count: int, symbols: int = 2000, seed: int = 42) -> List[Dict[str, str]]:
+    """
+    Generate extracted-data rows shaped like repeated crawls of `symbols` stocks
+
+    Every symbol keeps its company name and exchange, the numeric fields vary between snapshots.
+    """
+    rng = random.Random(seed)
+    stocks = []
+    for i in range(symbols):
+        name = " ".join(rng.sample(COMPANY_WORDS, rng.randint(2, 4)))
+        stocks.append((f"{name} {i}", f"S{i:05d}", rng.choice(EXCHANGES),
+                       rng.choice(["", str(rng.randint(1850, 2024))]),
+                       rng.choice(["", str(rng.randint(5, 300_000))])))
+
+    rows = []
+    for i in range(count):
+        company, symbol, exchange, founded, employees = stocks[i % symbols]
+        price = rng.lognormvariate(4, 1.2)
+        change = rng.gauss(0, 2.5)
+        previous = price / (1 + change / 100)
+        rows.append({
+            "company": company,
+            "symbol": symbol,
+            "exchange": exchange,
+            "source_file": f"html/{symbol}_{i}.html",
+            "timestamp": f"2025-10-{1 + i * 28 // count:02d} {i % 24:02d}:{i % 60:02d}:00",
+            "current_price": f"${price:.2f}",
+            "previous_close": f"${previous:.2f}",
+            "calculated_percentage_change": f"{change:+.2f}%",
+            "calculated_difference": f"${price - previous:+.2f}",
+            "market_cap": rng.choice(["", f"{rng.uniform(1, 900):.2f}M USD", f"{rng.uniform(1, 3000):.2f}B USD"]),
+            "founded": founded,
+            "employees": employees,
+            "revenue": rng.choice(["", f"{rng.uniform(1, 900):.2f}M", f"{rng.uniform(1, 400):.2f}B"]),
+            "ebitda": "",
+        })
+        rows[-1].update(numeric_fields(rows[-1]))
+    return rows
+
+
+def write_rows(rows: List[Dict[str, str]], output_file: str):
+    with open(output_file, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=TSV_FIELDNAMES, delimiter='\t')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def benchmark_index_build(sizes: List[int], workers: List[int]):
+    print(f"{'records':>10} {'workers':>8} {'postings':>12} {'seconds':>9} {'records/sec':>12} {'postings/sec':>13} "
+          f"{'speedup':>8}")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in sizes:
+            data_file = os.path.join(temp_dir, f"synthetic_{size}.tsv")
+            write_rows(synthetic_rows(size), data_file)
+
+            baseline = None
+            for processes in workers:
+                indexer = StockIndexer(data_file=data_file)
+                indexer.load_data()
+
+                start = time.perf_counter()
+                indexer.build_index(workers=processes)
+                seconds = time.perf_counter() - start
+                baseline = baseline or seconds
+
+                postings = sum(len(postings) for postings in indexer.index.values())
+                print(f"{size:>10} {processes:>8} {postings:>12} {seconds:>9.2f} {size / seconds:>12.0f} "
+                      f"{postings / seconds:>13.0f} {baseline / seconds:>7.2f}x")
+                del indexer
+
+
+def benchmark_index_memory(size: int):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_file = os.path.join(temp_dir, f"synthetic_{size}.tsv")
+        write_rows(synthetic_rows(size), data_file)
+        indexer = StockIndexer(data_file=data_file)
+        indexer.load_data()
+        indexer.build_index()
+
+        # Documents as csv.DictReader rows, the way they were kept before the columnar store
+        with open(data_file, encoding='utf-8', newline='') as f:
+            tracemalloc.start()
+            rows = list(csv.DictReader(f, delimiter='\t'))
+            row_bytes, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        tracemalloc.start()
+        store = DocumentStore()
+        store.extend(rows)
+        store_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del rows, store
+
+    postings = sum(len(posting_list) for posting_list in indexer.index.values())
+
+    array_bytes = sum(
+        sys.getsizeof(posting_list) + sum(sys.getsizeof(values) for values in
+                                          (posting_list.doc_ids, posting_list.weights, posting_list.tfs))
+        for posting_list in indexer.index.values()
+    )
+
+    # The previous layout: {term: {doc_id: tf-idf}} plus {term: {doc_id: raw count}}
+    tracemalloc.start()
+    legacy_index = {term: dict(zip(p.doc_ids, p.weights)) for term, p in indexer.index.items()}
+    legacy_tfs = {term: dict(zip(p.doc_ids, p.tfs)) for term, p in indexer.index.items()}
+    dict_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    encoded_bytes = sum(len(posting_list.encode()) for posting_list in indexer.index.values())
+    pickled_bytes = len(pickle.dumps((legacy_index, legacy_tfs)))
+
+    print(f"\n{size} records, {postings} postings")
+    print(f"In memory, dicts:     {dict_bytes / postings:6.1f} bytes/posting")
+    print(f"In memory, arrays:    {array_bytes / postings:6.1f} bytes/posting ({dict_bytes / array_bytes:.1f}x smaller)")
+    print(f"On disk, pickle:      {pickled_bytes / postings:6.1f} bytes/posting")
+    print(f"On disk, varint:      {encoded_bytes / postings:6.1f} bytes/posting ({pickled_bytes / encoded_bytes:.1f}x smaller)")
+    print(f"Documents, row dicts: {row_bytes / size:6.1f} bytes/document")
+    print(f"Documents, columnar:  {store_bytes / size:6.1f} bytes/document ({row_bytes / store_bytes:.1f}x smaller)")
+
+
+def save_pickled_index(indexer: StockIndexer, filepath: str):
+    """Save an index in the pickle layout used before segment files"""
+    index_data = {
+        'format_version': INDEX_FORMAT_VERSION,
+        'documents': list(indexer.documents),
+        'index': {term: postings.encode() for term, postings in indexer.index.items()},
+        'doc_frequencies': dict(indexer.doc_frequencies),
+        'doc_norms': indexer.doc_norms,
+        'doc_lengths': indexer.doc_lengths,
+        'avg_doc_length': indexer.avg_doc_length,
+        'latest_snapshots': indexer.latest_snapshots,
+        'data_file': indexer.data_file,
+        'half_life_days': indexer.half_life_days,
+        'timestamps': indexer.timestamps,
+    }
+    with open(filepath, 'wb') as f:
+        pickle.dump(index_data, f)
+
+
+def disk_size(path: str) -> int:
+    """Size of a file, or of all files in a directory"""
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def measure_open(filepath: str, query: str) -> Tuple[float, int, float]:
+    """
+    Returns:
+        (seconds to load, bytes allocated by the load, seconds for the first query) tuple
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    indexer = StockIndexer()
+    indexer.load_index(filepath)
+    seconds = time.perf_counter() - start
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    indexer.search(query, top_k=10)
+    query_seconds = time.perf_counter() - start
+    indexer.close()
+    return seconds, allocated, query_seconds
+
+
+def benchmark_index_open(sizes: List[int]):
+    query = "exchange_nasdaq cap_large"
+    results = []
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in sizes:
+            data_file = os.path.join(temp_dir, f"synthetic_{size}.tsv")
+            write_rows(synthetic_rows(size), data_file)
+            indexer = StockIndexer(data_file=data_file)
+            indexer.load_data()
+            indexer.build_index()
+
+            pickle_file = os.path.join(temp_dir, f"synthetic_{size}.pkl")
+            segment_dir = os.path.join(temp_dir, f"synthetic_{size}_index")
+            save_pickled_index(indexer, pickle_file)
+            indexer.save_index(segment_dir)
+            indexer.close()
+            del indexer
+
+            for label, filepath in (("pickle", pickle_file), ("segment", segment_dir)):
+                seconds, allocated, query_seconds = measure_open(filepath, query)
+                results.append((size, label, disk_size(filepath), seconds, allocated, query_seconds))
+
+    print(f"\n{'records':>10} {'format':>8} {'file MB':>8} {'open ms':>10} {'heap MB':>8} {'1st query ms':>13}")
+    for size, label, file_bytes, seconds, allocated, query_seconds in results:
+        print(f"{size:>10} {label:>8} {file_bytes / 2 ** 20:>8.1f} {seconds * 1000:>10.1f} "
+              f"{allocated / 2 ** 20:>8.1f} {query_seconds * 1000:>13.1f}")
+
+
+def search_exhaustive(indexer: StockIndexer, query: str, top_k: int, require_all_terms: bool,
+                      ranking_method: str) -> List[Tuple[int, float]]:
+    """
+    Rank documents the way it was done before top-k pruning
+
+    Every posting of every query term is scored into a dict, which is then
+    filtered and fully sorted.
+    """
+    query_terms = indexer._query_terms(query)
+    scores = defaultdict(float)
+    doc_term_counts = Counter()
+
+    if ranking_method == 'bm25':
+        k1, b = 1.5, 0.75
+        for term in set(query_terms):
+            if term not in indexer.doc_frequencies:
+                continue
+            df = indexer.doc_frequencies[term]
+            idf = math.log((len(indexer.doc_norms) - df + 0.5) / (df + 0.5) + 1)
+            postings = indexer.index[term]
+            for doc_id, tf in zip(postings.doc_ids, postings.tfs):
+                doc_length = indexer.doc_lengths[doc_id]
+                denominator = tf + k1 * (1 - b + b * (doc_length / indexer.avg_doc_length))
+                scores[doc_id] += query_terms.count(term) * idf * ((k1 + 1) * tf / denominator)
+                doc_term_counts[doc_id] += 1
+        num_query_terms = len(set(query_terms))
+    else:
+        query_tf = Counter(query_terms)
+        query_vector = {}
+        for term in set(query_terms):
+            if term in indexer.doc_frequencies:
+                idf = math.log(len(indexer.doc_norms) / indexer.doc_frequencies[term])
+                query_vector[term] = (query_tf[term] / len(query_terms) * idf, idf)
+        query_norm = math.sqrt(sum(weight ** 2 for weight, _ in query_vector.values()))
+        if query_norm == 0:
+            return []
+        for term, (query_weight, idf) in query_vector.items():
+            postings = indexer.index[term]
+            for doc_id, tf in zip(postings.doc_ids, postings.weights):
+                scores[doc_id] += query_weight * tf * idf
+                doc_term_counts[doc_id] += 1
+        for doc_id in scores:
+            if indexer.doc_norms[doc_id] > 0:
+                scores[doc_id] /= query_norm * indexer.doc_norms[doc_id]
+        num_query_terms = len(query_vector)
+
+    if require_all_terms:
+        scores = {doc_id: score for doc_id, score in scores.items() if doc_term_counts[doc_id] == num_query_terms}
+    now = time.time()
+    ranked = sorted(((doc_id, score * indexer.recency_weight(doc_id, now)) for doc_id, score in scores.items()),
+                    key=lambda item: (-item[1], item[0]))
+    return ranked[:top_k]
+
+
+def benchmark_search(size: int, repeat: int = 5):
+    # (label, query, require_all_terms)
+    queries = [
+        ("broad", "move_flat", True),
+        ("broad", "exchange_nasdaq price_low", True),
+        ("broad", "exchange_nasdaq move_flat", True),
+        ("broad OR", "exchange_nasdaq move_flat price_low", False),
+        ("narrow", "symbol_s00042", True),
+        ("narrow", "symbol_s00042 exchange_nasdaq", True),
+        ("narrow OR", "symbol_s00042 move_surge", False),
+    ]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_file = os.path.join(temp_dir, f"synthetic_{size}.tsv")
+        write_rows(synthetic_rows(size), data_file)
+        # Repeated queries would be answered from the cache
+        indexer = StockIndexer(data_file=data_file, query_cache_size=0)
+        indexer.load_data()
+        indexer.build_index()
+
+    print(f"\n{'query':<45} {'method':>6} {'matches':>8} {'all ms':>9} {'top-k ms':>9} {'speedup':>8} {'same':>5}")
+    for label, query, require_all_terms in queries:
+        for method in ('tfidf', 'bm25'):
+            timings = []
+            for search in (lambda: search_exhaustive(indexer, query, 10, require_all_terms, method),
+                           lambda: [(doc_id, score) for doc_id, score, _ in
+                                    indexer.search(query, 10, require_all_terms, method)]):
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    ranked = search()
+                timings.append(((time.perf_counter() - start) / repeat, ranked))
+
+            (all_seconds, expected), (top_seconds, ranked) = timings
+            same = ([doc_id for doc_id, _ in expected] == [doc_id for doc_id, _ in ranked] and
+                    all(math.isclose(a, b, rel_tol=1e-6) for (_, a), (_, b) in zip(expected, ranked)))
+            matches = sum(len(indexer.index[term]) for term in set(indexer._query_terms(query))
+                          if term in indexer.doc_frequencies)
+            name = f"{label}: {query}"
+            print(f"{name:<45} {method:>6} {matches:>8} {all_seconds * 1000:>9.2f} {top_seconds * 1000:>9.2f} "
+                  f"{all_seconds / top_seconds:>7.1f}x {'yes' if same else 'NO':>5}")
+
+
+def percentile(samples: List[float], percent: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(samples)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+def benchmark_search_backends(size: int, rounds: int = 20):
+    import vector_scoring
+    if not vector_scoring.available():
+        print("NumPy is not installed, run `pip install numpy` first")
+        return
+
+    # (query, require_all_terms, ranking_method)
+    queries = [
+        ("move_flat", True, 'tfidf'),
+        ("exchange_nasdaq move_flat", True, 'tfidf'),
+        ("exchange_nasdaq move_flat price_low", False, 'tfidf'),
+        ("cap_large price_medium", True, 'bm25'),
+        ("exchange_nyse move_up_weak size_small", False, 'bm25'),
+        ("symbol_s00042 exchange_nasdaq", True, 'tfidf'),
+        ("symbol_s00042 move_surge", False, 'bm25'),
+    ]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_file = os.path.join(temp_dir, f"synthetic_{size}.tsv")
+        write_rows(synthetic_rows(size), data_file)
+        indexer = StockIndexer(data_file=data_file, query_cache_size=0)
+        indexer.load_data()
+        indexer.build_index()
+
+    latencies = {}
+    results = {}
+    for backend in ('python', 'numpy'):
+        indexer.scoring_backend = backend
+        latencies[backend] = []
+        for _ in range(rounds):
+            for query, require_all_terms, method in queries:
+                start = time.perf_counter()
+                ranked = indexer.search(query, 10, require_all_terms, method)
+                latencies[backend].append(time.perf_counter() - start)
+                results[backend, query] = [(doc_id, score) for doc_id, score, _ in ranked]
+
+    mismatches = sum(
+        1 for query, _, _ in queries
+        if [doc_id for doc_id, _ in results['python', query]] != [doc_id for doc_id, _ in results['numpy', query]]
+        or not all(math.isclose(a, b, rel_tol=1e-6)
+                   for (_, a), (_, b) in zip(results['python', query], results['numpy', query]))
+    )
+
+    print(f"\n{size} records, {len(queries)} queries x {rounds} rounds, {mismatches} rankings differ")
+    print(f"{'backend':>8} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+    for backend, samples in latencies.items():
+        mean = sum(samples) / len(samples)
+        print(f"{backend:>8} {percentile(samples, 50) * 1000:>9.2f} {percentile(samples, 99) * 1000:>9.2f} "
+              f"{mean * 1000:>9.2f}")
+
+
+def benchmark_search_cache(size: int, rounds: int = 20, updates_every: int = 5):
+    """Latency of repeated dashboard queries with and without the query cache, rows are added every few rounds"""
+    queries = [
+        ("cap_mega move_surge", False, 'tfidf'),
+        ("exchange_nasdaq move_flat", True, 'tfidf'),
+        ("cap_large price_medium", True, 'bm25'),
+        ("move_crash", True, 'bm25'),
+    ]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_file = os.path.join(temp_dir, f"synthetic_{size}.tsv")
+        write_rows(synthetic_rows(size), data_file)
+        indexer = StockIndexer(data_file=data_file)
+        indexer.load_data()
+        indexer.build_index()
+
+    print(f"\n{size} records, {len(queries)} queries x {rounds} rounds, 10 rows added every {updates_every} rounds")
+    print(f"{'cache':>6} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9} {'hit rate':>9}")
+    for cache_size in (0, 1024):
+        indexer.query_cache = QueryCache(cache_size)
+        new_rows = synthetic_rows(rounds // updates_every * 10, seed=cache_size)
+        samples = []
+        for round_number in range(rounds):
+            if round_number and round_number % updates_every == 0:
+                indexer.add_documents(new_rows[:10])
+                del new_rows[:10]
+            for query, require_all_terms, method in queries:
+                start = time.perf_counter()
+                indexer.search(query, 10, require_all_terms, method)
+                samples.append(time.perf_counter() - start)
+        mean = sum(samples) / len(samples)
+        print(f"{'on' if cache_size else 'off':>6} {percentile(samples, 50) * 1000:>9.2f} "
+              f"{percentile(samples, 99) * 1000:>9.2f} {mean * 1000:>9.2f} "
+              f"{indexer.query_cache.stats()['hit_rate']:>8.0%}")
+
+
+def benchmark_search_ranges(size: int, repeat: int = 5):
+    """Range predicate latency from the sorted numeric columns vs a scan over every document"""
+    queries = [
+        "price:100..250",
+        "cap:>50B",
+        "change:<-3% cap:>1B",
+        "price:10..10.5 exchange_nasdaq",
+    ]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_file = os.path.join(temp_dir, f"synthetic_{size}.tsv")
+        write_rows(synthetic_rows(size), data_file)
+        indexer = StockIndexer(data_file=data_file, query_cache_size=0)
+        indexer.load_data()
+        indexer.build_index()
+        indexer.save_index(os.path.join(temp_dir, "index"))
+
+        print(f"\n{'query':<35} {'matches':>8} {'scan ms':>9} {'index ms':>9} {'speedup':>8}")
+        for query in queries:
+            ranges = indexer._query_ranges(query)
+            start = time.perf_counter()
+            matches = [doc_id for doc_id in range(len(indexer.documents))
+                       if all(numeric_value(indexer.documents[doc_id], numeric_range.column) in numeric_range
+                              for numeric_range in ranges)]
+            scan_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                indexer.search(query, 10, True)
+            index_seconds = (time.perf_counter() - start) / repeat
+            print(f"{query:<35} {len(matches):>8} {scan_seconds * 1000:>9.1f} {index_seconds * 1000:>9.2f} "
+                  f"{scan_seconds / index_seconds:>7.0f}x")
+        indexer.close()
+
+
+def benchmark_search_shards(size: int, workers: List[int], clients: int = 4, rounds: int = 5):
+    """
+    Queries/sec of a single process vs the sharded search, and whether their results are identical
+
+    Queries are sent from `clients` threads at once, so several are in flight.
+    """
+    queries = [
+        ("move_flat", True, 'tfidf'),
+        ("exchange_nasdaq price_low", True, 'tfidf'),
+        ("exchange_nasdaq move_flat price_low", False, 'tfidf'),
+        ("cap_large price_medium", True, 'bm25'),
+        ("exchange_nyse move_up_weak size_small", False, 'bm25'),
+        ("symbol_s00042 move_surge", False, 'bm25'),
+        ("price:100..250 exchange_nasdaq", True, 'tfidf'),
+    ]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_file = os.path.join(temp_dir, f"synthetic_{size}.tsv")
+        write_rows(synthetic_rows(size), data_file)
+        index_path = os.path.join(temp_dir, "index")
+        writer = StockIndexer(data_file=data_file)
+        writer.load_data()
+        writer.build_index()
+        writer.save_index(index_path)
+        writer.close()
+
+        def run(indexer, now):
+            def rank(arguments):
+                query, require_all_terms, method = arguments
+                return indexer.rank(query, 10, require_all_terms, method, now=now)
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(clients) as executor:
+                ranked = list(executor.map(rank, queries * rounds))
+            return rounds * len(queries) / (time.perf_counter() - start), ranked
+
+        now = time.time()
+        single = StockIndexer(query_cache_size=0)
+        single.open_segments(index_path)
+        single_qps, expected = run(single, now)
+
+        print(f"\n{size} records, {len(queries)} queries x {rounds} rounds from {clients} threads, "
+              f"{os.cpu_count()} CPUs")
+        print(f"{'workers':>8} {'qps':>9} {'speedup':>8} {'same':>5}")
+        print(f"{'single':>8} {single_qps:>9.1f} {1:>7.2f}x {'yes':>5}")
+        for processes in workers:
+            sharded = ShardedIndexer(index_path, processes, query_cache_size=0)
+            qps, ranked = run(sharded, now)
+            sharded.close()
+            print(f"{processes:>8} {qps:>9.1f} {qps / single_qps:>7.2f}x {'yes' if ranked == expected else 'NO':>5}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Project benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    extract_parser = subparsers.add_parser("extract", help="extraction pages/sec before and after the label-anchored scanner")
+    extract_parser.add_argument("--limit", type=int, default=500, help="number of pages to benchmark")
+
+    index_parser = subparsers.add_parser("index-build", help="index build records/sec on synthetic rows")
+    index_parser.add_argument("--sizes", default="10000,100000,1000000",
+                              help="comma separated numbers of synthetic rows to index")
+    index_parser.add_argument("--workers", default="1", help="comma separated numbers of build processes to compare")
+
+    memory_parser = subparsers.add_parser("index-memory", help="bytes per posting in memory and on disk")
+    memory_parser.add_argument("--size", type=int, default=100000, help="number of synthetic rows to index")
+
+    open_parser = subparsers.add_parser("index-open", help="time and heap to open a saved index")
+    open_parser.add_argument("--sizes", default="10000,100000", help="comma separated numbers of synthetic rows")
+
+    search_parser = subparsers.add_parser("search", help="query latency with top-k pruning vs scoring every match")
+    search_parser.add_argument("--size", type=int, default=100000, help="number of synthetic rows to index")
+
+    backends_parser = subparsers.add_parser("search-backends", help="p50/p99 query latency of the python and numpy scorers")
+    backends_parser.add_argument("--size", type=int, default=1000000, help="number of synthetic rows to index")
+
+    cache_parser = subparsers.add_parser("search-cache", help="repeated query latency with and without the query cache")
+    cache_parser.add_argument("--size", type=int, default=100000, help="number of synthetic rows to index")
+
+    ranges_parser = subparsers.add_parser("search-ranges", help="range predicate latency vs scanning every document")
+    ranges_parser.add_argument("--size", type=int, default=100000, help="number of synthetic rows to index")
+
+    shards_parser = subparsers.add_parser("search-shards", help="queries/sec of sharded multi-process search")
+    shards_parser.add_argument("--size", type=int, default=200000, help="number of synthetic rows to index")
+    shards_parser.add_argument("--workers", default="1,2,4", help="comma separated numbers of search processes")
+    shards_parser.add_argument("--clients", type=int, default=4, help="number of threads sending queries")
+
+    args = parser.parse_args()
+
+    if args.benchmark == "extract":
+        benchmark_extract(args.limit)
+    elif args.benchmark == "index-build":
+        benchmark_index_build([int(size) for size in args.sizes.split(',')],
+                              [int(workers) for workers in args.workers.split(',')])
+    elif args.benchmark == "index-memory":
+        benchmark_index_memory(args.size)
+    elif args.benchmark == "index-open":
+        benchmark_index_open([int(size) for size in args.sizes.split(',')])
+    elif args.benchmark == "search":
+        benchmark_search(args.size)
+    elif args.benchmark == "search-backends":
+        benchmark_search_backends(args.size)
+    elif args.benchmark == "search-cache":
+        benchmark_search_cache(args.size)
+    elif args.benchmark == "search-ranges":
+        benchmark_search_ranges(args.size)
+    elif args.benchmark == "search-shards":
+        benchmark_search_shards(args.size, [int(workers) for workers in args.workers.split(',')], args.clients)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+from array import array
+from collections.abc import Sequence
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from numeric_fields import NUMERIC_FIELDS, format_number, numeric_value
+
+# Columns that repeat across every snapshot of a stock, stored as codes into a table of their distinct values
+DICTIONARY_COLUMNS = ("company", "symbol", "exchange")
+
+# Columns kept only as float64 arrays, NaN where the value is missing
+NUMERIC_COLUMNS = tuple(NUMERIC_FIELDS)
+
+
+class DocumentStore(Sequence):
+    """
+    Column-oriented storage of stock records.
+
+    A row dict costs a hash table plus a string object for every one of its
+    fields. Here company, symbol and exchange are dictionary-encoded into uint32
+    codes, so every snapshot of a stock shares one copy of each string, and the
+    remaining fields of a row are kept as one tab separated UTF-8 entry of a
+    shared blob. The numeric columns are kept as float64 arrays only. A row is
+    materialized as a dict only when it is accessed, e.g. for the hits of a
+    search.
+
+    Like the documents of a segment file, a row has every column of the store,
+    empty where it had no value, including columns discovered after it was added.
+    """
+
+    def __init__(self):
+        self.columns: List[str] = []  # in the order of the first row that had them
+        self._known_columns = set()
+        self._text_columns: List[str] = []
+        self._values: Dict[str, List[Optional[str]]] = {column: [None] for column in DICTIONARY_COLUMNS}
+        self._codes: Dict[str, Dict[Optional[str], int]] = {column: {None: 0} for column in DICTIONARY_COLUMNS}
+        self._column_codes: Dict[str, array] = {column: array('I') for column in DICTIONARY_COLUMNS}
+        self._numbers: Dict[str, array] = {column: array('d') for column in NUMERIC_COLUMNS}
+        self._text_offsets = array('q', [0])
+        self._text_blob = bytearray()
+
+    def __len__(self) -> int:
+        return len(self._text_offsets) - 1
+
+    def append(self, row: Dict[str, str], numbers: Optional[Iterable[float]] = None):
+        """
+        Add a row
+
+        Args:
+            row: Stock record
+            numbers: Values of the NUMERIC_COLUMNS if the caller already parsed them
+        """
+        if not self._known_columns.issuperset(row):
+            for column in row:
+                if column is not None and column not in self._known_columns:
+                    # Rows added earlier report the new column as empty
+                    self._known_columns.add(column)
+                    self.columns.append(column)
+                    if column not in DICTIONARY_COLUMNS and column not in NUMERIC_COLUMNS:
+                        self._text_columns.append(column)
+
+        for column in DICTIONARY_COLUMNS:
+            value = row.get(column)
+            codes = self._codes[column]
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(self._values[column])
+                self._values[column].append(value)
+            self._column_codes[column].append(code)
+
+        if numbers is None:
+            numbers = (numeric_value(row, column) for column in NUMERIC_COLUMNS)
+        for column, value in zip(NUMERIC_COLUMNS, numbers):
+            self._numbers[column].append(value)
+
+        values = [row.get(column) or "" for column in self._text_columns]
+        self._text_blob += "\t".join(values).encode('utf-8')
+        self._text_offsets.append(len(self._text_blob))
+
+    def extend(self, rows: Iterable[Dict[str, str]]):
+        for row in rows:
+            self.append(row)
+
+    def append_store(self, other: "DocumentStore"):
+        """
+        Append every row of another store, e.g. one filled by a worker process
+
+        Codes of the dictionary columns are translated to this store's tables and
+        the text entries are copied as they are, rows are only decoded again if
+        the text columns of the two stores were discovered in a different order.
+        """
+        if (self._text_columns != other._text_columns[:len(self._text_columns)] and
+                other._text_columns != self._text_columns[:len(other._text_columns)]):
+            for index, row in enumerate(other):
+                self.append(row, [other._numbers[column][index] for column in NUMERIC_COLUMNS])
+            return
+
+        for column in other.columns:
+            if column not in self._known_columns:
+                self._known_columns.add(column)
+                self.columns.append(column)
+        if len(other._text_columns) > len(self._text_columns):
+            # Earlier rows report the columns at the end as empty
+            self._text_columns = list(other._text_columns)
+
+        for column in DICTIONARY_COLUMNS:
+            codes = self._codes[column]
+            translation = []
+            for value in other._values[column]:
+                code = codes.get(value)
+                if code is None:
+                    code = codes[value] = len(self._values[column])
+                    self._values[column].append(value)
+                translation.append(code)
+            self._column_codes[column].extend(map(translation.__getitem__, other._column_codes[column]))
+
+        for column in NUMERIC_COLUMNS:
+            self._numbers[column].extend(other._numbers[column])
+
+        shift = self._text_offsets[-1]
+        self._text_blob += other._text_blob
+        self._text_offsets.extend(map(shift.__add__, other._text_offsets[1:]))
+
+    def numbers(self, column: str) -> array:
+        """Parsed values of a numeric column, indexed by position"""
+        return self._numbers[column]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("document index out of range")
+
+        text = self._text_blob[self._text_offsets[index]:self._text_offsets[index + 1]].decode('utf-8')
+        row = dict(zip(self._text_columns, text.split('\t')))
+        for column in DICTIONARY_COLUMNS:
+            value = self._values[column][self._column_codes[column][index]]
+            if value is not None:
+                row[column] = value
+        for column in NUMERIC_COLUMNS:
+            if column in self._known_columns:
+                row[column] = format_number(self._numbers[column][index])
+        return {column: row.get(column, "") for column in self.columns}
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        return (self[index] for index in range(len(self)))
@@ -0,0 +1,140 @@
+import functools
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from downloader import ConcurrentDownloader, SessionPool
+from scraper import download_stock_page
+
+# Simulated server latency for every page
+RESPONSE_DELAY = 0.2
+
+
+class StubQuoteHandler(BaseHTTPRequestHandler):
+    """Serves a tiny quote page for every path after a short delay"""
+
+    # Keep connections open so the session pool can reuse them
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        time.sleep(RESPONSE_DELAY)
+        body = f'<html><title>Stub ({self.path})</title><a href="./quote/NEXT:NASDAQ"></a></html>'.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubQuoteHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_url_source(urls):
+    remaining = list(urls)
+
+    def next_urls(count):
+        batch = remaining[:count]
+        del remaining[:count]
+        return batch
+
+    return next_urls
+
+
+def test_concurrent_download(port):
+    success = True
+    urls = [f"http://127.0.0.1:{port}/finance/quote/S{i}:NASDAQ" for i in range(8)]
+
+    downloader = ConcurrentDownloader(download_stock_page, concurrency=4, host_rate=0)
+    stats = downloader.run(make_url_source(urls))
+
+    if stats["pages_ok"] != len(urls):
+        print(f"ERROR: Downloaded {stats['pages_ok']} of {len(urls)} pages")
+        success = False
+    # Serially this takes len(urls) * RESPONSE_DELAY
+    if stats["elapsed_seconds"] >= len(urls) * RESPONSE_DELAY * 0.75:
+        print(f"ERROR: Concurrent download took {stats['elapsed_seconds']:.2f} s")
+        success = False
+    if stats["pages_per_second"] <= 0:
+        print("ERROR: Pages per second was not reported")
+        success = False
+
+    return success
+
+
+def test_host_rate_limit(port):
+    success = True
+    rate = 5.0
+    # Two host names for the same server get separate budgets
+    urls = [f"http://127.0.0.1:{port}/finance/quote/A{i}:NASDAQ" for i in range(3)]
+    urls += [f"http://localhost:{port}/finance/quote/B{i}:NASDAQ" for i in range(3)]
+
+    downloader = ConcurrentDownloader(download_stock_page, concurrency=6, host_rate=rate, host_burst=1)
+    stats = downloader.run(make_url_source(urls))
+
+    # Each host gets its first request immediately and then one every 1 / rate seconds
+    min_elapsed = 2 / rate
+    if stats["elapsed_seconds"] < min_elapsed:
+        print(f"ERROR: Host rate limit not enforced ({stats['elapsed_seconds']:.2f} s < {min_elapsed:.2f} s)")
+        success = False
+    # A global limit would need 5 / rate seconds
+    if stats["elapsed_seconds"] >= 5 / rate:
+        print(f"ERROR: Rate limit applied across hosts ({stats['elapsed_seconds']:.2f} s)")
+        success = False
+
+    return success
+
+
+def test_connection_reuse(port):
+    success = True
+    urls = [f"http://127.0.0.1:{port}/finance/quote/C{i}:NASDAQ" for i in range(8)]
+
+    session_pool = SessionPool(size=2)
+    downloader = ConcurrentDownloader(
+        functools.partial(download_stock_page, session_pool=session_pool),
+        concurrency=2,
+        host_rate=0
+    )
+    stats = downloader.run(make_url_source(urls))
+    connections = session_pool.connection_stats()
+    session_pool.close()
+
+    if stats["pages_ok"] != len(urls):
+        print(f"ERROR: Downloaded {stats['pages_ok']} of {len(urls)} pages")
+        success = False
+    # At most one handshake per session, every other request reuses a connection
+    if connections["new_connections"] > session_pool.size:
+        print(f"ERROR: Opened {connections['new_connections']} connections for {session_pool.size} sessions")
+        success = False
+    if connections["new_connections"] + connections["reused_connections"] != len(urls):
+        print(f"ERROR: Connection counters {connections} don't add up to {len(urls)} requests")
+        success = False
+
+    return success
+
+
+def main():
+    server = start_stub_server()
+    port = server.server_address[1]
+
+    tests = [test_concurrent_download, test_host_rate_limit, test_connection_reuse]
+    failed_tests = 0
+
+    for test in tests:
+        if not test(port):
+            failed_tests += 1
+
+    server.shutdown()
+
+    print(f"Total tests: {len(tests)}")
+    print(f"Failed tests: {failed_tests}")
+    print(f"Success rate: {100 - (failed_tests / len(tests)) * 100}%")
+
+
+if __name__ == "__main__":
+    main()
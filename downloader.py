@@ -0,0 +1,290 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+
+class HostRateLimiter:
+    """
+    Token bucket rate limiter with a separate bucket for every host.
+
+    Each host gets `rate` requests per second with bursts of up to `burst` requests,
+    so politeness delays are enforced per host instead of for the whole crawler.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Args:
+            rate: Allowed requests per second for a single host (0 disables limiting)
+            burst: Maximum number of requests a host can receive back to back
+        """
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._buckets: Dict[str, List[float]] = {}  # host -> [tokens, last refill time]
+        self._host_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _host_lock(self, host: str) -> threading.Lock:
+        with self._lock:
+            if host not in self._host_locks:
+                self._host_locks[host] = threading.Lock()
+                self._buckets[host] = [float(self.burst), time.monotonic()]
+            return self._host_locks[host]
+
+    def acquire(self, url: str) -> float:
+        """
+        Block until the host of `url` may receive another request
+
+        Args:
+            url: URL that is about to be requested
+
+        Returns:
+            Number of seconds spent waiting
+        """
+        if self.rate <= 0:
+            return 0.0
+
+        host = urlsplit(url).netloc
+        waited = 0.0
+
+        # Waiting while holding the host lock queues other requests for the same host behind us
+        with self._host_lock(host):
+            bucket = self._buckets[host]
+            while True:
+                now = time.monotonic()
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+
+                if bucket[0] >= 1:
+                    bucket[0] -= 1
+                    return waited
+
+                delay = (1 - bucket[0]) / self.rate
+                time.sleep(delay)
+                waited += delay
+
+
+class ConnectionCounters:
+    """Thread-safe counters of new and reused HTTP connections"""
+
+    def __init__(self):
+        self.new_connections = 0
+        self.checkouts = 0
+        self._lock = threading.Lock()
+
+    def count_new(self):
+        with self._lock:
+            self.new_connections += 1
+
+    def count_checkout(self):
+        with self._lock:
+            self.checkouts += 1
+
+    @property
+    def reused_connections(self) -> int:
+        return max(self.checkouts - self.new_connections, 0)
+
+
+def _counting_pool_class(base: type, counters: ConnectionCounters) -> type:
+    """Subclass a urllib3 connection pool so it reports connection checkouts and handshakes"""
+
+    class CountingConnectionPool(base):
+        def _new_conn(self):
+            counters.count_new()
+            return super()._new_conn()
+
+        def _get_conn(self, timeout=None):
+            counters.count_checkout()
+            return super()._get_conn(timeout=timeout)
+
+    return CountingConnectionPool
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools update a shared ConnectionCounters"""
+
+    def __init__(self, counters: ConnectionCounters, **kwargs):
+        self.counters = counters
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool_class(HTTPConnectionPool, self.counters),
+            "https": _counting_pool_class(HTTPSConnectionPool, self.counters),
+        }
+
+
+class SessionPool:
+    """
+    Pool of long-lived requests sessions shared by the downloader threads.
+
+    Sessions keep their connections alive between downloads, so only the first
+    request to a host pays for the TCP and TLS handshake. Headers and cookies are
+    set once when a session is created. Connection errors and throttling responses
+    are retried with exponential backoff.
+    """
+
+    def __init__(self, size: int = 4, headers_factory: Optional[Callable[[], Dict[str, str]]] = None,
+                 cookies: Optional[Dict[str, str]] = None, max_retries: int = 3, backoff_factor: float = 1.0):
+        """
+        Args:
+            size: Number of sessions, one is needed for every concurrent download
+            headers_factory: Returns the headers for a new session
+            cookies: Cookies set on every session
+            max_retries: Number of retries for connection errors and 429/5xx responses
+            backoff_factor: Base of the exponential backoff between retries in seconds
+        """
+        self.size = max(size, 1)
+        self.counters = ConnectionCounters()
+        self._sessions = queue.Queue()
+        self._all_sessions = []
+
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET", "HEAD"],
+            raise_on_status=False,
+        )
+
+        for _ in range(self.size):
+            session = requests.Session()
+            adapter = CountingHTTPAdapter(self.counters, max_retries=retry)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            if headers_factory:
+                session.headers.update(headers_factory())
+            if cookies:
+                session.cookies.update(cookies)
+            self._sessions.put(session)
+            self._all_sessions.append(session)
+
+    @contextmanager
+    def session(self):
+        """Borrow a session for a single download"""
+        session = self._sessions.get()
+        try:
+            yield session
+        finally:
+            self._sessions.put(session)
+
+    def connection_stats(self) -> Dict[str, int]:
+        """Number of new and reused connections since the pool was created"""
+        return {
+            "new_connections": self.counters.new_connections,
+            "reused_connections": self.counters.reused_connections,
+        }
+
+    def close(self):
+        """Close every session and its connections"""
+        for session in self._all_sessions:
+            session.close()
+
+
+class ConcurrentDownloader:
+    """
+    Downloads URLs with a bounded pool of worker threads.
+
+    URLs are pulled from a source in batches and handed to `process_url` in the
+    pool, with every request passing through the per-host rate limiter first.
+    """
+
+    def __init__(self, process_url: Callable[[str], Dict[str, any]], concurrency: int = 4,
+                 host_rate: float = 0.5, host_burst: int = 1, report_every: int = 50):
+        """
+        Args:
+            process_url: Downloads and handles a single URL, returns a result dict with a "success" key
+            concurrency: Maximum number of downloads in flight
+            host_rate: Allowed requests per second for a single host
+            host_burst: Maximum burst of requests for a single host
+            report_every: Print throughput after this many pages
+        """
+        self.process_url = process_url
+        self.concurrency = max(concurrency, 1)
+        self.limiter = HostRateLimiter(host_rate, host_burst)
+        self.report_every = report_every
+
+        self.pages_ok = 0
+        self.pages_failed = 0
+        self.started_at = None
+        self._stats_lock = threading.Lock()
+
+    @property
+    def pages_per_second(self) -> float:
+        """Completed downloads per second since `run` started"""
+        if self.started_at is None:
+            return 0.0
+        elapsed = time.monotonic() - self.started_at
+        return (self.pages_ok + self.pages_failed) / elapsed if elapsed > 0 else 0.0
+
+    def _download(self, url: str) -> Dict[str, any]:
+        self.limiter.acquire(url)
+
+        try:
+            result = self.process_url(url)
+        except Exception as e:
+            print(f"Error downloading {url}: {e}")
+            result = {"success": False, "url": url, "error": str(e)}
+
+        with self._stats_lock:
+            if result and result.get("success"):
+                self.pages_ok += 1
+            else:
+                self.pages_failed += 1
+            done = self.pages_ok + self.pages_failed
+
+        if self.report_every and done % self.report_every == 0:
+            print(f"Downloaded {done} pages ({self.pages_per_second:.2f} pages/sec)")
+
+        return result
+
+    def run(self, next_urls: Callable[[int], List[str]]) -> Dict[str, float]:
+        """
+        Download until the URL source is exhausted and all downloads have finished
+
+        Args:
+            next_urls: Returns up to the requested number of URLs, or an empty list when there are none left
+
+        Returns:
+            Dictionary with download statistics
+        """
+        self.started_at = time.monotonic()
+        in_flight = set()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            while True:
+                # Keep the pool busy, URLs are only taken from the source once a worker can use them
+                free_slots = self.concurrency * 2 - len(in_flight)
+                urls = next_urls(free_slots) if free_slots > 0 else []
+
+                for url in urls:
+                    in_flight.add(pool.submit(self._download, url))
+
+                if not in_flight:
+                    break
+
+                # Running downloads may add new URLs to the source, so check again after each one
+                _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+
+        elapsed = time.monotonic() - self.started_at
+        stats = {
+            "pages_ok": self.pages_ok,
+            "pages_failed": self.pages_failed,
+            "elapsed_seconds": elapsed,
+            "pages_per_second": self.pages_per_second,
+        }
+        print(f"Downloaded {self.pages_ok + self.pages_failed} pages in {elapsed:.1f} s "
+              f"({stats['pages_per_second']:.2f} pages/sec, {self.pages_failed} failed)")
+        return stats
@@ -0,0 +1,159 @@
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class ExtractionQueue:
+    """
+    In-process handoff of saved pages from the downloader to the extractor.
+
+    Pages are passed through a `queue.Queue`, so the extractor wakes up as soon as a
+    page is downloaded. The downloader hands over the page content itself, so the
+    extractor doesn't have to read it back from disk. Every page is also recorded in
+    an append-only journal, `+` when it is queued and `-` once it is extracted. On
+    startup the journal is replayed and the pages that were queued but never
+    extracted are queued again.
+
+    A page can be handed over before it is archived, so extraction doesn't wait for
+    the archive write. Such a page is journaled only once `archived` is called, a
+    crash before that leaves nothing to recover from and the page has to be
+    downloaded again.
+    """
+
+    def __init__(self, journal_file: str):
+        """
+        Args:
+            journal_file: Path to the journal file, plain lines with one path each are read as queued pages
+        """
+        self.journal_file = journal_file
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._unarchived: Dict[str, bool] = {}  # html_file -> already extracted, for pages not archived yet
+
+        pending = self._replay()
+        self._compact(pending)
+        # Recovered pages are read back from the archive by the extractor
+        for html_file in pending:
+            self._queue.put((html_file, None, time.monotonic()))
+
+        if pending:
+            print(f"Recovered {len(pending)} pages waiting for extraction")
+
+        self._journal = open(journal_file, 'a', encoding='utf-8')
+
+    def _replay(self) -> List[str]:
+        """Return the pages that were queued but not extracted, in queue order"""
+        pending = {}
+        if not os.path.exists(self.journal_file):
+            return []
+
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.rstrip('\n')
+                if line.startswith('-\t'):
+                    pending.pop(line[2:], None)
+                elif line.startswith('+\t'):
+                    pending[line[2:]] = True
+                elif line.strip():
+                    pending[line.strip()] = True
+
+        return list(pending)
+
+    def _compact(self, pending: List[str]):
+        """Rewrite the journal so it only holds the pending pages"""
+        directory = os.path.dirname(self.journal_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        temp_file = self.journal_file + ".tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            for html_file in pending:
+                f.write(f"+\t{html_file}\n")
+        os.replace(temp_file, self.journal_file)
+
+    def _append(self, line: str):
+        with self._lock:
+            self._write(line)
+
+    def _write(self, line: str):
+        self._journal.write(line)
+        self._journal.flush()
+
+    def put(self, html_file: str, html_content: Optional[str] = None, archived: bool = True):
+        """
+        Queue a page for extraction
+
+        Args:
+            html_file: Path the page is stored under
+            html_content: The downloaded page, if None the extractor reads it from the archive
+            archived: False if the page is still being written to the archive, it is journaled
+                once `archived` is called
+        """
+        if archived:
+            self._append(f"+\t{html_file}\n")
+        else:
+            with self._lock:
+                self._unarchived[html_file] = False
+        self._queue.put((html_file, html_content, time.monotonic()))
+
+    def archived(self, html_file: str, stored: bool = True):
+        """
+        Record that a page queued with `archived=False` was written to the archive
+
+        Args:
+            html_file: Path the page is stored under
+            stored: False if the page couldn't be archived, it is then never journaled
+        """
+        with self._lock:
+            extracted = self._unarchived.pop(html_file, False)
+            # A page extracted already has nothing left to recover
+            if stored and not extracted:
+                self._write(f"+\t{html_file}\n")
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Tuple[str, Optional[str], float]]:
+        """
+        Wait for the next page to extract
+
+        Args:
+            timeout: Maximum number of seconds to wait (waits forever if None)
+
+        Returns:
+            (html_file, html_content, queued_at) tuple, or None if the queue was closed or the timeout expired.
+            html_content is None when the page has to be read from the archive.
+        """
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def task_done(self, html_file: str):
+        """Record that a page has been extracted"""
+        with self._lock:
+            if html_file in self._unarchived:
+                # Never journaled, so there is nothing to take back
+                self._unarchived[html_file] = True
+            else:
+                self._write(f"-\t{html_file}\n")
+
+    def close(self):
+        """Wake up the extractor and tell it no more pages will be queued"""
+        self._queue.put(None)
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_extraction_queue(journal_file: str) -> ExtractionQueue:
+    """Get the extraction queue shared by all threads in this process"""
+    with _queues_lock:
+        extraction_queue = _queues.get(journal_file)
+        if extraction_queue is None:
+            extraction_queue = ExtractionQueue(journal_file)
+            _queues[journal_file] = extraction_queue
+        return extraction_queue
@@ -1,11 +1,11 @@
+from archive import read_html
 from extractor import StockDataExtractor
 
 
 def test_extraction(path):
     success = True
 
-    with open(path, 'r') as file:
-        html = file.read()
+    html = read_html(path)
         
     # Extract the stock data from the HTML file
     extractor = StockDataExtractor()
@@ -1,9 +1,15 @@
 import os
 import re
+import math
 import csv
 import glob
+import time
+import argparse
+import multiprocessing
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Set
+from archive import decompress_page, get_archive, read_html
+from numeric_fields import NUMERIC_FIELDS, numeric_fields, parse_number
  
 class RegexPatterns:
     """Class containing all regex patterns for data extraction"""
@@ -56,94 +62,221 @@ class RegexPatterns:
         r'Previous close.*?class="P6K39c">([\$]?\d{1,3}(?:,\d{3})*(?:\.\d+)?)',
     ]
 
+# Regex flags for every RegexPatterns field, and whether a blank match falls through to the next pattern
+FIELD_MATCHING = {
+    "COMPANY_NAME": (re.IGNORECASE, True),
+    "EXCHANGE": (re.IGNORECASE, True),
+    "CURRENT_PRICE": (re.DOTALL, False),
+    "PREVIOUS_CLOSE": (re.DOTALL, False),
+    "MARKET_CAP": (re.IGNORECASE, False),
+    "FOUNDED_YEAR": (re.IGNORECASE, False),
+    "EMPLOYEES": (re.IGNORECASE, False),
+    "REVENUE": (re.IGNORECASE, False),
+    "EBITDA": (re.DOTALL, False),
+}
+
+
+def literal_prefix(pattern: str) -> str:
+    """
+    Return the literal text every match of a regex pattern starts with
+    
+    An empty string is returned when the pattern doesn't start with a fixed label.
+    """
+    if '|' in pattern:
+        return ''
+    
+    prefix = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            if i + 1 >= len(pattern) or pattern[i + 1].isalnum():
+                break  # Character class such as \d or \s
+            prefix.append(pattern[i + 1])
+            i += 2
+        elif char in '.^$*+?{}[]()':
+            break
+        else:
+            prefix.append(char)
+            i += 1
+    
+    # A quantifier makes the last literal character optional
+    if i < len(pattern) and pattern[i] in '*+?{' and prefix:
+        prefix.pop()
+    
+    return ''.join(prefix)
+
+
+# Non-ASCII characters that IGNORECASE matches against ASCII letters (İ, ı, ſ and the Kelvin sign)
+ASCII_CASE_EQUIVALENTS = '\u0130\u0131\u017f\u212a'
+
+
+class FieldScanner:
+    """
+    Finds every extraction field with precompiled, label-anchored passes over a page.
+    
+    Each pattern starts with a literal label (`Market cap`, `<title>`, ...). The page
+    is case-folded once into an ASCII byte string with the same offsets, label
+    occurrences are located there with plain substring search, and the compiled
+    pattern is only tried, anchored, at those offsets. A pass stops at the first
+    occurrence where its pattern matches, so the result is the same match
+    `pattern.search` would return without running `.*?` scans from every position.
+    """
+    
+    def __init__(self, fields: Dict[str, List[re.Pattern]], blank_falls_through: Dict[str, bool]):
+        """
+        Args:
+            fields: Field name -> compiled patterns in priority order
+            blank_falls_through: Field name -> whether a match with a blank group moves on to the next pattern
+        """
+        self.fields = fields
+        self.blank_falls_through = blank_falls_through
+        self.labels = {
+            field: [literal_prefix(pattern.pattern) for pattern in patterns]
+            for field, patterns in fields.items()
+        }
+    
+    def _first_match(self, pattern: re.Pattern, label: str, html_content: str,
+                     folded: Optional[bytes]) -> Optional[re.Match]:
+        """Find the first match of a pattern by trying it at each occurrence of its label"""
+        if not label:
+            return pattern.search(html_content)
+        
+        if pattern.flags & re.IGNORECASE:
+            if folded is None or not label.isascii():
+                return pattern.search(html_content)
+            find = folded.find
+            needle = label.lower().encode('ascii')
+        else:
+            find = html_content.find
+            needle = label
+        
+        position = find(needle)
+        while position != -1:
+            match = pattern.match(html_content, position)
+            if match:
+                return match
+            position = find(needle, position + 1)
+        
+        return None
+    
+    def scan(self, html_content: str) -> Dict[str, Optional[re.Match]]:
+        """
+        Find the match of every field
+        
+        Args:
+            html_content: The HTML content to scan
+        
+        Returns:
+            Dictionary of field name -> selected match, or None if the field wasn't found
+        """
+        # Every non-ASCII character becomes a single '?' byte, so offsets stay the same as in the page
+        folded = None
+        if not any(char in html_content for char in ASCII_CASE_EQUIVALENTS):
+            folded = html_content.encode('ascii', 'replace').lower()
+        
+        matches = {}
+        for field, patterns in self.fields.items():
+            matches[field] = None
+            for pattern, label in zip(patterns, self.labels[field]):
+                match = self._first_match(pattern, label, html_content, folded)
+                if match and (not self.blank_falls_through[field] or match.group(1).strip()):
+                    matches[field] = match
+                    break
+        
+        return matches
+
+
 class StockDataExtractor:
     """Main class for extracting stock data from HTML content"""
     
     def __init__(self):
         self.patterns = RegexPatterns()
+        
+        # All patterns are compiled once per extractor
+        self.compiled_patterns = {
+            field: [re.compile(pattern, flags) for pattern in getattr(self.patterns, field)]
+            for field, (flags, _) in FIELD_MATCHING.items()
+        }
+        self.scanner = FieldScanner(
+            self.compiled_patterns,
+            {field: falls_through for field, (_, falls_through) in FIELD_MATCHING.items()}
+        )
     
-    def extract_company_name(self, html_content: str, symbol: str) -> str:
-        """Extract company name from the HTML content"""
-        for pattern in self.patterns.COMPANY_NAME:
-            matches = re.findall(pattern, html_content, re.IGNORECASE)
-            if matches:
-                company_name = matches[0].strip()
-                if company_name:
-                    return company_name
-                
+    def search_field(self, field: str, html_content: str) -> Optional[re.Match]:
+        """Search the patterns of a single field in priority order"""
+        _, blank_falls_through = FIELD_MATCHING[field]
+        for pattern in self.compiled_patterns[field]:
+            match = pattern.search(html_content)
+            if match and (not blank_falls_through or match.group(1).strip()):
+                return match
+        return None
+    
+    @staticmethod
+    def _company_name(match: Optional[re.Match], symbol: str) -> str:
+        if match:
+            return match.group(1).strip()
         # Default value
         return f"{symbol} Corporation"
     
+    @staticmethod
+    def _exchange(match: Optional[re.Match]) -> Optional[str]:
+        return match.group(1).strip().upper() if match else None
+    
+    @staticmethod
+    def _price(match: Optional[re.Match]) -> Optional[str]:
+        if match:
+            price = match.group(1).replace(',', '').replace('$', '')
+            return f"${price}"
+        return None
+    
+    @staticmethod
+    def _raw_value(match: Optional[re.Match]) -> Optional[str]:
+        return match.group(1) if match else None
+    
+    @staticmethod
+    def _stripped_value(match: Optional[re.Match]) -> Optional[str]:
+        return match.group(1).strip() if match else None
+    
+    @staticmethod
+    def _employees(match: Optional[re.Match]) -> Optional[str]:
+        return match.group(1).replace(',', '') if match else None
+    
+    def extract_company_name(self, html_content: str, symbol: str) -> str:
+        """Extract company name from the HTML content"""
+        return self._company_name(self.search_field("COMPANY_NAME", html_content), symbol)
+    
     def extract_exchange(self, html_content: str, symbol: str) -> Optional[str]:
         """Extract exchange from the HTML content"""
-        for pattern in self.patterns.EXCHANGE:
-            matches = re.findall(pattern, html_content, re.IGNORECASE)
-            if matches:
-                exchange = matches[0].strip().upper()
-                if exchange:
-                    return exchange
-        
-        # Default value
-        return None
+        return self._exchange(self.search_field("EXCHANGE", html_content))
     
     def extract_current_price(self, html_content: str) -> Optional[str]:
         """Extract current stock price from HTML content"""
-        for pattern in self.patterns.CURRENT_PRICE:
-            matches = re.search(pattern, html_content, re.DOTALL)
-            if matches:
-                price = matches.group(1).replace(',', '').replace('$', '')
-                return f"${price}"
-        return None
+        return self._price(self.search_field("CURRENT_PRICE", html_content))
     
     def extract_previous_close(self, html_content: str) -> Optional[str]:
         """Extract previous close price from HTML content"""
-        for pattern in self.patterns.PREVIOUS_CLOSE:
-            matches = re.search(pattern, html_content, re.DOTALL)
-            if matches:
-                previous_close = matches.group(1).replace(',', '').replace('$', '')
-                return f"${previous_close}"
-        return None
+        return self._price(self.search_field("PREVIOUS_CLOSE", html_content))
     
     def extract_market_cap(self, html_content: str) -> Optional[str]:
         """Extract market cap from HTML content"""
-        for pattern in self.patterns.MARKET_CAP:
-            matches = re.findall(pattern, html_content, re.IGNORECASE)
-            if matches:
-                return matches[0]
-        return None
+        return self._raw_value(self.search_field("MARKET_CAP", html_content))
     
     def extract_founded_year(self, html_content: str) -> Optional[str]:
         """Extract founded year from HTML content"""
-        for pattern in self.patterns.FOUNDED_YEAR:
-            matches = re.findall(pattern, html_content, re.IGNORECASE)
-            if matches:
-                return matches[0]
-        return None
+        return self._raw_value(self.search_field("FOUNDED_YEAR", html_content))
     
     def extract_employees(self, html_content: str) -> Optional[str]:
         """Extract number of employees from HTML content"""
-        for pattern in self.patterns.EMPLOYEES:
-            matches = re.findall(pattern, html_content, re.IGNORECASE)
-            if matches:
-                employees = matches[0].replace(',', '')
-                return f"{employees}"
-        return None
+        return self._employees(self.search_field("EMPLOYEES", html_content))
     
     def extract_revenue(self, html_content: str) -> Optional[str]:
         """Extract revenue from HTML content"""
-        for pattern in self.patterns.REVENUE:
-            matches = re.findall(pattern, html_content, re.IGNORECASE)
-            if matches:
-                return matches[0].strip()
-        return None
+        return self._stripped_value(self.search_field("REVENUE", html_content))
     
     def extract_ebitda(self, html_content: str) -> Optional[str]:
         """Extract EBITDA from HTML content"""
-        for pattern in self.patterns.EBITDA:
-            matches = re.search(pattern, html_content, re.DOTALL)
-            if matches:
-                return matches.group(1).strip()
-        return None
+        return self._stripped_value(self.search_field("EBITDA", html_content))
     
     def calculate_price_changes(self, current_price: Optional[str], previous_close: Optional[str]) -> Dict[str, str]:
         """Calculate percentage change and difference between current price and previous close"""
@@ -151,11 +284,10 @@ class StockDataExtractor:
         
         if current_price and previous_close:
             try:
-                current_price_str = current_price.replace('$', '').replace(',', '')
-                previous_close_str = previous_close.replace('$', '').replace(',', '')
-                
-                current_price_val = float(current_price_str)
-                previous_close_val = float(previous_close_str)
+                current_price_val = parse_number(current_price)
+                previous_close_val = parse_number(previous_close)
+                if math.isnan(current_price_val) or math.isnan(previous_close_val):
+                    raise ValueError(f"could not parse {current_price!r} or {previous_close!r}")
                 
                 raw_difference = current_price_val - previous_close_val
                 
@@ -169,56 +301,61 @@ class StockDataExtractor:
         
         return changes
     
-    def extract_stock_data_from_html(self, html_content: str, filename: str) -> Dict[str, any]:
+    def extract_stock_data_from_html(self, html_content: str, filename: str,
+                                     timestamp: Optional[str] = None) -> Dict[str, any]:
         """
         Extract stock data from Google Finance HTML content
         
         Args:
             html_content: The HTML content to parse
             filename: The filename (used to extract symbol)
+            timestamp: When the page was downloaded ('%Y-%m-%d %H:%M:%S'), defaults to now
         
         Returns:
             Dictionary containing extracted stock data
         """
         # Extract symbol from filename
         symbol = os.path.basename(filename).split('_')[0]
-        company_name = self.extract_company_name(html_content, symbol)
-        exchange = self.extract_exchange(html_content, symbol)
+        
+        # Find every field with the precompiled, label-anchored scanner
+        matches = self.scanner.scan(html_content)
+        
+        company_name = self._company_name(matches["COMPANY_NAME"], symbol)
+        exchange = self._exchange(matches["EXCHANGE"])
         
         data = {
             "company": company_name,
             "symbol": symbol,
             "exchange": exchange,
             "source_file": filename,
-            "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            "timestamp": timestamp or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
         
-        # Extract all financial data using regex patterns
-        current_price = self.extract_current_price(html_content)
+        current_price = self._price(matches["CURRENT_PRICE"])
         if current_price:
             data["current_price"] = current_price
         
-        market_cap = self.extract_market_cap(html_content)
+        market_cap = self._raw_value(matches["MARKET_CAP"])
         if market_cap:
             data["market_cap"] = market_cap
         
-        founded_year = self.extract_founded_year(html_content)
+        founded_year = self._raw_value(matches["FOUNDED_YEAR"])
         if founded_year:
             data["founded"] = founded_year
         
-        employees = self.extract_employees(html_content)
+        employees = self._employees(matches["EMPLOYEES"])
         if employees:
             data["employees"] = employees
         
-        revenue = self.extract_revenue(html_content)
+        revenue = self._stripped_value(matches["REVENUE"])
         if revenue:
             data["revenue"] = revenue
         
-        ebitda = self.extract_ebitda(html_content)
+        ebitda = self._stripped_value(matches["EBITDA"])
         if ebitda:
             data["ebitda"] = ebitda
         
-        previous_close = self.extract_previous_close(html_content)
+        previous_close = self._price(matches["PREVIOUS_CLOSE"])
         if previous_close:
             data["previous_close"] = previous_close
         
@@ -226,46 +363,54 @@ class StockDataExtractor:
         price_changes = self.calculate_price_changes(current_price, previous_close)
         data.update(price_changes)
         
+        # Numeric values are parsed here once, so the indexer doesn't have to parse the formatted columns
+        data.update(numeric_fields(data))
+        
         return data
 
 
-def save_to_tsv(stock_data: Dict[str, any], filename: str) -> bool:
+# Order of the columns in the extracted data TSV
+TSV_FIELDNAMES = [
+    "company",
+    "symbol", 
+    "exchange",
+    "source_file",
+    "timestamp",
+    "current_price",
+    "previous_close",
+    "calculated_percentage_change",
+    "calculated_difference",
+    "market_cap",
+    "founded",
+    "employees",
+    "revenue",
+    "ebitda",
+    *NUMERIC_FIELDS,
+]
+
+
+def save_rows_to_tsv(rows: List[Dict[str, any]], filename: str) -> bool:
     """
-    Save stock data to TSV file with tab delimiter and header columns
+    Append many stock data rows to the TSV file with a single open and write
     
     Args:
-        stock_data: Dictionary containing stock data
+        rows: Dictionaries containing stock data
         filename: Output TSV filename
     
     Returns:
         True if successful, False otherwise
     """
-    if not stock_data:
-        return False
-    
     try:
-        # Define the order of columns for the TSV
-        fieldnames = [
-            "company",
-            "symbol", 
-            "exchange",
-            "source_file",
-            "timestamp",
-            "current_price",
-            "previous_close",
-            "calculated_percentage_change",
-            "calculated_difference",
-            "market_cap",
-            "founded",
-            "employees",
-            "revenue",
-            "ebitda"
-        ]
+        # Files created before the numeric columns were added keep their columns
+        fieldnames = TSV_FIELDNAMES
+        if os.path.exists(filename) and os.path.getsize(filename) > 0:
+            with open(filename, 'r', newline='', encoding='utf-8') as tsvfile:
+                fieldnames = next(csv.reader(tsvfile, delimiter='\t'))
         
         # Write data to TSV with tab delimiter
         with open(filename, 'a', newline='', encoding='utf-8') as tsvfile:
-            writer = csv.DictWriter(tsvfile, fieldnames=fieldnames, delimiter='\t')
-            writer.writerow(stock_data)
+            writer = csv.DictWriter(tsvfile, fieldnames=fieldnames, delimiter='\t', extrasaction='ignore')
+            writer.writerows(rows)
         
         return True
         
@@ -273,12 +418,31 @@ def save_to_tsv(stock_data: Dict[str, any], filename: str) -> bool:
         print(f"Error saving to TSV: {e}")
         return False
 
-def process_html_file(html_file: str, output_file: str = "data/extracted_data.tsv", extractor: Optional[StockDataExtractor] = None) -> Dict[str, any]:
+
+def save_to_tsv(stock_data: Dict[str, any], filename: str) -> bool:
     """
-    Process a single HTML file and extract stock data
+    Save stock data to TSV file with tab delimiter and header columns
     
     Args:
-        html_file: Path to HTML file to process
+        stock_data: Dictionary containing stock data
+        filename: Output TSV filename
+    
+    Returns:
+        True if successful, False otherwise
+    """
+    if not stock_data:
+        return False
+    
+    return save_rows_to_tsv([stock_data], filename)
+
+def process_html_content(html_content: str, html_file: str, output_file: str = "data/extracted_data.tsv",
+                         extractor: Optional[StockDataExtractor] = None) -> Dict[str, any]:
+    """
+    Extract stock data from a page that is already in memory
+    
+    Args:
+        html_content: The HTML content of the page
+        html_file: Path the page is stored under (recorded as source_file)
         output_file: Output TSV filename
         extractor: Optional StockDataExtractor instance to reuse (creates new one if None)
     
@@ -290,9 +454,6 @@ def process_html_file(html_file: str, output_file: str = "data/extracted_data.ts
         extractor = StockDataExtractor()
     
     try:
-        with open(html_file, 'r', encoding='utf-8') as f:
-            html_content = f.read()
-                
         stock_data = extractor.extract_stock_data_from_html(html_content, html_file)
         
         if stock_data:
@@ -309,3 +470,189 @@ def process_html_file(html_file: str, output_file: str = "data/extracted_data.ts
     except Exception as e:
         print(f"Error processing {html_file}: {e}")
         return None
+
+
+def process_html_file(html_file: str, output_file: str = "data/extracted_data.tsv", extractor: Optional[StockDataExtractor] = None) -> Dict[str, any]:
+    """
+    Process a single HTML file and extract stock data
+    
+    Args:
+        html_file: Path to HTML file to process
+        output_file: Output TSV filename
+        extractor: Optional StockDataExtractor instance to reuse (creates new one if None)
+    
+    Returns:
+        Dictionary containing extracted stock data
+    """
+    
+    try:
+        html_content = read_html(html_file)
+    except Exception as e:
+        print(f"Error processing {html_file}: {e}")
+        return None
+    
+    return process_html_content(html_content, html_file, output_file, extractor)
+
+
+
+# Extractor owned by a bulk extraction worker process
+_worker_extractor: Optional[StockDataExtractor] = None
+
+
+def _init_bulk_worker():
+    global _worker_extractor
+    _worker_extractor = StockDataExtractor()
+
+
+def download_timestamp(html_file: str) -> Optional[str]:
+    """
+    Download time of a page from its path, e.g. html/AAPL_20251016_142146.html -> '2025-10-16 14:21:46'
+    
+    Returns None if the path doesn't end in a download time.
+    """
+    parts = os.path.splitext(os.path.basename(html_file))[0].rsplit('_', 2)
+    if len(parts) != 3:
+        return None
+    try:
+        return datetime.strptime(f"{parts[1]}_{parts[2]}", '%Y%m%d_%H%M%S').strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return None
+
+
+def _extract_shard(html_files: List[str]) -> List[Dict[str, any]]:
+    """
+    Extract every page of a shard in a worker process, archived pages are read in storage order
+    
+    Rows are stamped with the time the page was downloaded, not the time of the re-extraction.
+    """
+    archive = get_archive()
+    rows = []
+    
+    archived = [html_file for html_file in html_files if html_file in archive]
+    loose = [html_file for html_file in html_files if html_file not in archive]
+    
+    for record, compressed in archive.iter_records(archived):
+        try:
+            html_content = decompress_page(compressed)
+            timestamp = record.timestamp or download_timestamp(record.file_path)
+            rows.append(_worker_extractor.extract_stock_data_from_html(html_content, record.file_path, timestamp))
+        except Exception as e:
+            print(f"Error processing {record.file_path}: {e}")
+    
+    for html_file in loose:
+        try:
+            html_content = read_html(html_file, archive)
+            rows.append(_worker_extractor.extract_stock_data_from_html(html_content, html_file,
+                                                                       download_timestamp(html_file)))
+        except Exception as e:
+            print(f"Error processing {html_file}: {e}")
+    
+    return rows
+
+
+def list_html_files(html_dir: str = "html") -> List[str]:
+    """
+    List every downloaded page, archived pages first in storage order, then loose files
+    
+    Args:
+        html_dir: Directory with loose HTML files
+    
+    Returns:
+        List of page paths
+    """
+    archive = get_archive()
+    records = sorted(archive.records.values(), key=lambda r: (r.segment, r.offset))
+    html_files = [record.file_path for record in records]
+    
+    if os.path.isdir(html_dir):
+        for filename in sorted(os.listdir(html_dir)):
+            html_file = os.path.join(html_dir, filename)
+            if os.path.isfile(html_file) and html_file not in archive:
+                html_files.append(html_file)
+    
+    return html_files
+
+
+def read_extracted_source_files(output_file: str) -> Set[str]:
+    """Return the source_file of every row already present in the extracted data TSV"""
+    source_files = set()
+    if os.path.exists(output_file):
+        with open(output_file, 'r', encoding='utf-8') as f:
+            reader = csv.DictReader(f, delimiter='\t')
+            for row in reader:
+                source_files.add(row.get('source_file', ''))
+    return source_files
+
+
+def extract_all(output_file: str = "data/extracted_data.tsv", workers: Optional[int] = None,
+                shard_size: int = 200, batch_size: int = 2000) -> int:
+    """
+    Extract every downloaded page with a pool of worker processes
+    
+    Pages whose source_file is already in the output TSV are skipped, so an interrupted
+    run continues where it stopped. Each worker keeps its own StockDataExtractor and
+    all rows are written by this process in large batches.
+    
+    Args:
+        output_file: Output TSV filename
+        workers: Number of worker processes (defaults to the number of CPUs)
+        shard_size: Number of pages sent to a worker at once
+        batch_size: Number of rows collected before they are appended to the TSV
+    
+    Returns:
+        Number of extracted rows
+    """
+    workers = workers or os.cpu_count() or 1
+    
+    done = read_extracted_source_files(output_file)
+    html_files = [html_file for html_file in list_html_files() if html_file not in done]
+    print(f"Extracting {len(html_files)} pages with {workers} workers ({len(done)} already extracted)")
+    
+    if not html_files:
+        return 0
+    
+    if not os.path.exists(output_file):
+        with open(output_file, 'w', newline='', encoding='utf-8') as tsvfile:
+            csv.DictWriter(tsvfile, fieldnames=TSV_FIELDNAMES, delimiter='\t').writeheader()
+    
+    shards = [html_files[i:i + shard_size] for i in range(0, len(html_files), shard_size)]
+    start = time.perf_counter()
+    extracted = 0
+    pending_rows = []
+    
+    with multiprocessing.Pool(workers, initializer=_init_bulk_worker) as pool:
+        for rows in pool.imap_unordered(_extract_shard, shards):
+            pending_rows.extend(rows)
+            if len(pending_rows) >= batch_size:
+                save_rows_to_tsv(pending_rows, output_file)
+                extracted += len(pending_rows)
+                pending_rows = []
+                elapsed = time.perf_counter() - start
+                print(f"Extracted {extracted}/{len(html_files)} pages ({extracted / elapsed:.1f} pages/sec)")
+    
+    if pending_rows:
+        save_rows_to_tsv(pending_rows, output_file)
+        extracted += len(pending_rows)
+    
+    elapsed = time.perf_counter() - start
+    print(f"Extracted {extracted} pages in {elapsed:.1f} s ({extracted / elapsed:.1f} pages/sec)")
+    return extracted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract stock data from downloaded pages")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    extract_parser = subparsers.add_parser(
+        "extract", help="extract every downloaded page that is not in the TSV file yet")
+    extract_parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    extract_parser.add_argument("--output", default="data/extracted_data.tsv", help="output TSV file")
+    
+    args = parser.parse_args()
+    
+    if args.command == "extract":
+        extract_all(output_file=args.output, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import os
+import sqlite3
+import threading
+from typing import Iterable, List, Optional, Set
+
+
+class URLFrontier:
+    """
+    Persistent LIFO frontier of URLs waiting to be downloaded.
+
+    The frontier lives in a small SQLite database, so push and pop touch a single
+    B-tree entry instead of rewriting a text file. Popped URLs are leased rather
+    than deleted and are only removed once `complete` is called. Leases left behind
+    by a crash are returned to the frontier the next time it is opened, so no URL
+    is lost, and the UNIQUE constraint on `url` keeps it from being queued twice.
+    A released URL goes to the bottom of the stack and counts its attempts, so a
+    URL that keeps failing doesn't come straight back and can be given up on.
+
+    The frontier also remembers every URL that was ever queued or fetched. The seen
+    set is loaded into memory once and extended as URLs are pushed, so filtering
+    newly discovered links costs a set lookup per URL.
+    """
+
+    def __init__(self, db_file: str, seed_file: Optional[str] = None, seen_seed_file: Optional[str] = None):
+        """
+        Open (or create) the frontier database
+
+        Args:
+            db_file: Path to the SQLite database file
+            seed_file: Optional text stack (one URL per line) imported when the database is first created
+            seen_seed_file: Optional page metadata TSV (URL in the first column) imported into an empty seen set
+        """
+        self.db_file = db_file
+        self._lock = threading.Lock()
+
+        is_new = not os.path.exists(db_file)
+        directory = os.path.dirname(db_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS frontier ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " url TEXT NOT NULL UNIQUE,"
+            " leased INTEGER NOT NULL DEFAULT 0,"
+            " attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(frontier)")]
+        if 'attempts' not in columns:
+            # Databases created before attempts were counted
+            self._conn.execute("ALTER TABLE frontier ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS frontier_pending ON frontier (leased, id)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS seen (url TEXT PRIMARY KEY) WITHOUT ROWID")
+
+        self.seen: Set[str] = set(url for (url,) in self._conn.execute("SELECT url FROM seen"))
+        if not self.seen:
+            self._seed_seen(seen_seed_file)
+
+        # Return URLs that were leased by a run that never completed them
+        recovered = self._conn.execute("UPDATE frontier SET leased = 0 WHERE leased = 1").rowcount
+        if recovered:
+            print(f"Recovered {recovered} unfinished URLs into the frontier")
+
+        if is_new and seed_file and os.path.exists(seed_file):
+            with open(seed_file, 'r', encoding='utf-8') as f:
+                seed_urls = [line.strip() for line in f if line.strip()]
+            added = self.push(seed_urls)
+            print(f"Imported {added} URLs from {seed_file} into {db_file}")
+
+    def _seed_seen(self, metadata_file: Optional[str]):
+        """Fill an empty seen set from the queued URLs and the URLs in the page metadata file"""
+        urls = [url for (url,) in self._conn.execute("SELECT url FROM frontier")]
+
+        if metadata_file and os.path.exists(metadata_file):
+            with open(metadata_file, 'r', encoding='utf-8') as f:
+                next(f, None)  # Skip header line
+                for line in f:
+                    url = line.split('\t', 1)[0].strip()
+                    if url:
+                        urls.append(url)
+
+        if urls:
+            self.mark_seen(urls)
+            print(f"Loaded {len(self.seen)} seen URLs")
+
+    def mark_seen(self, urls: Iterable[str]):
+        """
+        Remember URLs as seen without queueing them
+
+        Args:
+            urls: URLs that were fetched or otherwise processed
+        """
+        new_urls = [url for url in urls if url not in self.seen]
+        if not new_urls:
+            return
+
+        with self._lock:
+            self._conn.executemany("INSERT OR IGNORE INTO seen (url) VALUES (?)", ((url,) for url in new_urls))
+            self.seen.update(new_urls)
+
+    def filter_unseen(self, urls: Iterable[str]) -> List[str]:
+        """
+        Keep only URLs that were never queued or fetched
+
+        Args:
+            urls: Candidate URLs
+
+        Returns:
+            The candidates missing from the seen set
+        """
+        return [url for url in urls if url not in self.seen]
+
+    def push(self, urls: Iterable[str]) -> int:
+        """
+        Push URLs onto the frontier, ignoring URLs that are already queued
+
+        Args:
+            urls: URLs to add, the last one is popped first
+
+        Returns:
+            Number of URLs that were actually added
+        """
+        urls = list(urls)
+        new_urls = [url for url in urls if url not in self.seen]
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                before = self._conn.total_changes
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO frontier (url) VALUES (?)",
+                    ((url,) for url in urls)
+                )
+                added = self._conn.total_changes - before
+                self._conn.executemany("INSERT OR IGNORE INTO seen (url) VALUES (?)", ((url,) for url in new_urls))
+                self._conn.execute("COMMIT")
+                self.seen.update(new_urls)
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return added
+
+    def pop_batch(self, count: int) -> List[str]:
+        """
+        Lease up to `count` URLs from the top of the stack
+
+        Args:
+            count: Maximum number of URLs to lease
+
+        Returns:
+            Leased URLs, most recently pushed first
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, url FROM frontier WHERE leased = 0 ORDER BY id DESC LIMIT ?",
+                    (count,)
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE frontier SET leased = 1 WHERE id = ?",
+                    ((row_id,) for row_id, _ in rows)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [url for _, url in rows]
+
+    def pop(self) -> Optional[str]:
+        """Lease the most recently pushed URL, or return None if the frontier is empty"""
+        urls = self.pop_batch(1)
+        return urls[0] if urls else None
+
+    def complete(self, url: str):
+        """Remove a leased URL from the frontier once it has been processed"""
+        with self._lock:
+            self._conn.execute("DELETE FROM frontier WHERE url = ?", (url,))
+
+    def release(self, url: str) -> int:
+        """
+        Return a leased URL to the bottom of the frontier without processing it
+
+        Args:
+            url: The leased URL
+
+        Returns:
+            Number of times the URL has been released so far
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Below every queued URL, so the other URLs are popped before it is retried
+                self._conn.execute(
+                    "UPDATE frontier SET leased = 0, attempts = attempts + 1,"
+                    " id = (SELECT MIN(id) FROM frontier) - 1 WHERE url = ?",
+                    (url,)
+                )
+                row = self._conn.execute("SELECT attempts FROM frontier WHERE url = ?", (url,)).fetchone()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row[0] if row else 0
+
+    def __contains__(self, url: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM frontier WHERE url = ?", (url,)).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM frontier WHERE leased = 0").fetchone()[0]
+
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
+
+
+_frontiers = {}
+_frontiers_lock = threading.Lock()
+
+
+def get_frontier(stack_file: str, seen_seed_file: Optional[str] = None) -> URLFrontier:
+    """
+    Get the shared frontier that backs a URL stack file
+
+    The database is stored next to the stack file (`web-url-stack.txt` -> `web-url-stack.db`)
+    and the text file is imported into it the first time it is opened.
+
+    Args:
+        stack_file: Path to the legacy text URL stack
+        seen_seed_file: Optional page metadata TSV used to seed an empty seen set
+
+    Returns:
+        URLFrontier instance shared by all callers in this process
+    """
+    with _frontiers_lock:
+        frontier = _frontiers.get(stack_file)
+        if frontier is None:
+            db_file = os.path.splitext(stack_file)[0] + ".db"
+            frontier = URLFrontier(db_file, seed_file=stack_file, seen_seed_file=seen_seed_file)
+            _frontiers[stack_file] = frontier
+        return frontier
@@ -0,0 +1,760 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_right
+from collections import defaultdict
+from collections.abc import Mapping, Sequence
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows, every process is allowed to write there
+    fcntl = None
+
+from doc_store import NUMERIC_COLUMNS, DocumentStore
+from numeric_fields import numeric_value
+from numeric_index import NumericRange, SortedColumn, sort_column
+from postings import PostingList, doc_range
+
+SEGMENT_MAGIC = b"STKSEG01"
+SEGMENT_FORMAT_VERSION = 5
+
+# Timestamp of documents without a valid one: it sorts as the newest and decays to a recency weight of 1
+NO_TIMESTAMP = 2 ** 63 - 1
+
+# Sections in the order they are written, every one starts at an 8 byte boundary
+SECTIONS = [
+    "meta",            # JSON: column names, numeric column names and byte order
+    "term_offsets",    # int64[num_terms + 1], byte offsets into term_blob
+    "term_blob",       # UTF-8 terms, sorted by their encoded bytes
+    "term_postings",   # int64[num_terms + 1], start of every term's postings in the posting arrays
+    "doc_ids",         # int32[num_postings], global doc ids
+    "weights",         # float32[num_postings], term count / document length
+    "tfs",             # uint32[num_postings]
+    "max_weights",     # float32[num_terms], highest weight / doc norm of every term
+    "max_tfs",         # uint32[num_terms], highest raw count of every term
+    "min_lengths",     # uint32[num_terms], shortest document containing every term
+    "max_timestamps",  # int64[num_terms], newest document containing every term
+    "doc_norms",       # float64[num_docs]
+    "doc_lengths",     # uint32[num_docs]
+    "timestamps",      # int64[num_docs], snapshot time in epoch seconds or NO_TIMESTAMP
+    "doc_offsets",     # int64[num_docs + 1], byte offsets into doc_blob
+    "doc_blob",        # UTF-8 documents, one tab separated record per document
+    "range_offsets",   # int64[num_numeric_columns + 1], start of every numeric column in the range arrays
+    "range_values",    # float64[...], values of every numeric column in ascending order, missing ones left out
+    "range_doc_ids",   # int32[...], doc id of every value in range_values
+]
+
+# magic, version, base doc id, num_docs, num_terms, num_postings, then (offset, length) for every section
+HEADER = struct.Struct("<8sIQQQQ" + "QQ" * len(SECTIONS))
+
+
+class TermBounds(NamedTuple):
+    """Per-term maxima used to bound the score a term can add to any document"""
+    max_weight: float  # highest weight / doc norm, bounds the TF-IDF cosine
+    max_tf: int        # highest raw term count, bounds BM25 together with min_length
+    min_length: int    # shortest document containing the term
+    max_timestamp: int # newest document containing the term, bounds its recency weight
+
+    def combine(self, other: "TermBounds") -> "TermBounds":
+        return TermBounds(max(self.max_weight, other.max_weight), max(self.max_tf, other.max_tf),
+                          min(self.min_length, other.min_length), max(self.max_timestamp, other.max_timestamp))
+
+
+def normalized_weight(weight: float, norm: float) -> float:
+    """Weight of a posting divided by its document norm, documents without a norm keep the raw weight"""
+    return weight / norm if norm > 0 else weight
+
+
+def posting_bounds(postings: PostingList, base: int, doc_norms: Sequence, doc_lengths: Sequence,
+                   timestamps: Sequence) -> TermBounds:
+    """Bounds of a term over its postings, the per-document sequences start at doc id `base`"""
+    max_weight = 0.0
+    min_length = None
+    max_timestamp = None
+    for doc_id, weight in zip(postings.doc_ids, postings.weights):
+        local_id = doc_id - base
+        max_weight = max(max_weight, normalized_weight(weight, doc_norms[local_id]))
+        if max_timestamp is None or timestamps[local_id] > max_timestamp:
+            max_timestamp = timestamps[local_id]
+        length = doc_lengths[local_id]
+        if min_length is None or length < min_length:
+            min_length = length
+    return TermBounds(max_weight, max(postings.tfs, default=0), min_length or 0, max_timestamp or 0)
+
+
+def _pad(f):
+    remainder = f.tell() % 8
+    if remainder:
+        f.write(b"\0" * (8 - remainder))
+
+
+def write_segment(filepath: str, base: int, documents: Iterable[Dict[str, str]], postings: Mapping,
+                  doc_norms: Sequence, doc_lengths: Sequence, timestamps: Sequence,
+                  bounds: Optional[Callable[[str], TermBounds]] = None):
+    """
+    Write an index segment file
+
+    The file is written next to the target and renamed over it, so processes that
+    still have the previous file mapped keep reading a consistent copy.
+
+    Args:
+        filepath: Path of the segment file
+        base: Doc id of the first document in the segment
+        documents: Documents of the segment, in doc_id order
+        postings: term -> PostingList with global doc ids
+        doc_norms: L2 norm of every document
+        doc_lengths: Number of terms of every document
+        timestamps: Snapshot time of every document
+        bounds: term -> score bounds if they are already known, computed from the postings otherwise
+    """
+    documents = list(documents)
+    columns = []
+    for doc in documents:
+        for column in doc:
+            if column is not None and column not in columns:
+                columns.append(column)
+    meta = {"columns": columns, "numeric_columns": list(NUMERIC_COLUMNS), "byteorder": sys.byteorder}
+
+    terms = sorted(postings, key=lambda term: term.encode('utf-8'))
+
+    term_offsets = array('q', [0])
+    term_blob = bytearray()
+    term_postings = array('q', [0])
+    max_weights = array('f')
+    max_tfs = array('I')
+    min_lengths = array('I')
+    max_timestamps = array('q')
+    merged = PostingList.concat([postings[term] for term in terms])
+    for term in terms:
+        term_blob += term.encode('utf-8')
+        term_offsets.append(len(term_blob))
+        term_postings.append(term_postings[-1] + len(postings[term]))
+        if bounds is not None:
+            term_bounds = bounds(term)
+        else:
+            term_bounds = posting_bounds(postings[term], base, doc_norms, doc_lengths, timestamps)
+        max_weights.append(term_bounds.max_weight)
+        max_tfs.append(term_bounds.max_tf)
+        min_lengths.append(term_bounds.min_length)
+        max_timestamps.append(term_bounds.max_timestamp)
+
+    doc_offsets = array('q', [0])
+    doc_blob = bytearray()
+    for doc in documents:
+        values = ["" if doc.get(column) is None else doc[column] for column in columns]
+        doc_blob += "\t".join(values).encode('utf-8')
+        doc_offsets.append(len(doc_blob))
+
+    range_offsets = array('q', [0])
+    range_values = array('d')
+    range_doc_ids = array('i')
+    for column in NUMERIC_COLUMNS:
+        sorted_values, doc_ids = sort_column([numeric_value(doc, column) for doc in documents], base)
+        range_values.extend(sorted_values)
+        range_doc_ids.extend(doc_ids)
+        range_offsets.append(len(range_values))
+
+    sections = {
+        "meta": json.dumps(meta).encode('utf-8'),
+        "term_offsets": term_offsets,
+        "term_blob": term_blob,
+        "term_postings": term_postings,
+        "doc_ids": merged.doc_ids,
+        "weights": merged.weights,
+        "tfs": merged.tfs,
+        "max_weights": max_weights,
+        "max_tfs": max_tfs,
+        "min_lengths": min_lengths,
+        "max_timestamps": max_timestamps,
+        "doc_norms": array('d', doc_norms),
+        "doc_lengths": array('I', doc_lengths),
+        "timestamps": array('q', timestamps),
+        "doc_offsets": doc_offsets,
+        "doc_blob": doc_blob,
+        "range_offsets": range_offsets,
+        "range_values": range_values,
+        "range_doc_ids": range_doc_ids,
+    }
+
+    directory = os.path.dirname(filepath)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    temp_file = filepath + ".tmp"
+    locations = []
+    with open(temp_file, 'wb') as f:
+        f.write(b"\0" * HEADER.size)
+        for name in SECTIONS:
+            _pad(f)
+            data = sections[name]
+            data = data.tobytes() if isinstance(data, array) else bytes(data)
+            locations.extend((f.tell(), len(data)))
+            f.write(data)
+
+        f.seek(0)
+        f.write(HEADER.pack(SEGMENT_MAGIC, SEGMENT_FORMAT_VERSION, base, len(documents), len(terms),
+                            len(merged), *locations))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, filepath)
+
+
+def is_segment_file(filepath: str) -> bool:
+    """Check whether a file is an index segment (as opposed to an older pickled index)"""
+    with open(filepath, 'rb') as f:
+        return f.read(len(SEGMENT_MAGIC)) == SEGMENT_MAGIC
+
+
+class IndexSegment:
+    """
+    Read-only, memory-mapped view of an index segment file.
+
+    Nothing is read up front except the header and the small JSON metadata. Term
+    lookups binary search the sorted term dictionary in place, and postings, norms
+    and documents are zero-copy `memoryview`s into the mapping. Opening the file
+    therefore takes the same time at any index size, and every process that opens
+    it shares the pages through the OS page cache.
+    """
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        with open(filepath, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+
+        fields = HEADER.unpack_from(self._buffer, 0)
+        magic, version, self.base, self.num_docs, self.num_terms, self.num_postings = fields[:6]
+        if magic != SEGMENT_MAGIC:
+            raise ValueError(f"{filepath} is not an index segment")
+        if version != SEGMENT_FORMAT_VERSION:
+            raise ValueError(f"{filepath} uses segment format {version}, expected {SEGMENT_FORMAT_VERSION}")
+
+        locations = fields[6:]
+        self._sections = {name: (locations[2 * i], locations[2 * i + 1]) for i, name in enumerate(SECTIONS)}
+
+        self.meta = json.loads(bytes(self._section("meta")).decode('utf-8'))
+        if self.meta["byteorder"] != sys.byteorder:
+            raise ValueError(f"{filepath} was written with {self.meta['byteorder']} byte order, rebuild the index")
+        self.columns: List[str] = self.meta["columns"]
+
+        self._term_offsets = self._section("term_offsets", 'q')
+        self._term_blob = self._section("term_blob")
+        self._term_postings = self._section("term_postings", 'q')
+        self._doc_ids = self._section("doc_ids", 'i')
+        self._weights = self._section("weights", 'f')
+        self._tfs = self._section("tfs", 'I')
+        self._max_weights = self._section("max_weights", 'f')
+        self._max_tfs = self._section("max_tfs", 'I')
+        self._min_lengths = self._section("min_lengths", 'I')
+        self._max_timestamps = self._section("max_timestamps", 'q')
+        self.doc_norms = self._section("doc_norms", 'd')
+        self.doc_lengths = self._section("doc_lengths", 'I')
+        self.timestamps = self._section("timestamps", 'q')
+        self._doc_offsets = self._section("doc_offsets", 'q')
+        self._doc_blob = self._section("doc_blob")
+        range_offsets = self._section("range_offsets", 'q')
+        range_values = self._section("range_values", 'd')
+        range_doc_ids = self._section("range_doc_ids", 'i')
+        # numeric column -> (ascending values, their doc ids)
+        self._sorted_columns = {
+            column: (range_values[range_offsets[i]:range_offsets[i + 1]],
+                     range_doc_ids[range_offsets[i]:range_offsets[i + 1]])
+            for i, column in enumerate(self.meta["numeric_columns"])
+        }
+
+    def _section(self, name: str, typecode: Optional[str] = None) -> memoryview:
+        offset, length = self._sections[name]
+        view = self._buffer[offset:offset + length]
+        return view.cast(typecode) if typecode else view
+
+    @property
+    def end(self) -> int:
+        """Doc id after the last document of the segment"""
+        return self.base + self.num_docs
+
+    def term(self, term_id: int) -> str:
+        """The term stored at position `term_id` of the term dictionary"""
+        return bytes(self._term_blob[self._term_offsets[term_id]:self._term_offsets[term_id + 1]]).decode('utf-8')
+
+    def term_id(self, term: str) -> int:
+        """Position of a term in the term dictionary, or -1 if it isn't indexed"""
+        key = term.encode('utf-8')
+        low, high = 0, self.num_terms
+        while low < high:
+            middle = (low + high) // 2
+            if bytes(self._term_blob[self._term_offsets[middle]:self._term_offsets[middle + 1]]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.num_terms and self.term(low) == term:
+            return low
+        return -1
+
+    def terms(self) -> Iterator[str]:
+        return (self.term(term_id) for term_id in range(self.num_terms))
+
+    def get_postings(self, term: str) -> Optional[PostingList]:
+        """Postings of a term as zero-copy views into the segment, or None if the term isn't indexed"""
+        term_id = self.term_id(term)
+        if term_id < 0:
+            return None
+        start, end = self._term_postings[term_id], self._term_postings[term_id + 1]
+        return PostingList(self._doc_ids[start:end], self._weights[start:end], self._tfs[start:end])
+
+    def doc_frequency(self, term: str) -> int:
+        """Number of documents in the segment containing a term"""
+        term_id = self.term_id(term)
+        if term_id < 0:
+            return 0
+        return self._term_postings[term_id + 1] - self._term_postings[term_id]
+
+    def bounds(self, term: str) -> Optional[TermBounds]:
+        """Score bounds of a term stored when the segment was written, or None if the term isn't indexed"""
+        term_id = self.term_id(term)
+        if term_id < 0:
+            return None
+        return TermBounds(self._max_weights[term_id], self._max_tfs[term_id], self._min_lengths[term_id],
+                          self._max_timestamps[term_id])
+
+    def numeric_range(self, numeric_range: NumericRange) -> List[int]:
+        """Doc ids of the documents whose value is in a range, in no particular order"""
+        sorted_values, doc_ids = self._sorted_columns[numeric_range.column]
+        start, end = numeric_range.positions(sorted_values)
+        return doc_ids[start:end].tolist()
+
+    def document(self, doc_id: int) -> Dict[str, str]:
+        """Decode a single stored document"""
+        local_id = doc_id - self.base
+        data = bytes(self._doc_blob[self._doc_offsets[local_id]:self._doc_offsets[local_id + 1]])
+        return dict(zip(self.columns, data.decode('utf-8').split('\t')))
+
+    def documents(self) -> Iterator[Dict[str, str]]:
+        return (self.document(doc_id) for doc_id in range(self.base, self.end))
+
+
+class MemorySegment:
+    """
+    Mutable segment that receives newly indexed documents.
+
+    It has the same read interface as `IndexSegment` and is written out as a
+    segment file once it is large enough.
+    """
+
+    def __init__(self, base: int):
+        self.base = base
+        self._documents = DocumentStore()
+        self.postings: Dict[str, PostingList] = defaultdict(PostingList)
+        self.doc_norms = array('d')
+        self.doc_lengths = array('I')
+        self.timestamps = array('q')
+        # term -> bounds, kept up to date as documents are added
+        self._max_weights: Dict[str, float] = defaultdict(float)
+        self._max_tfs: Dict[str, int] = defaultdict(int)
+        self._min_lengths: Dict[str, int] = {}
+        self._max_timestamps: Dict[str, int] = {}
+        self._sorted_columns: Dict[str, SortedColumn] = {}  # created by the first range query on a column
+
+    @property
+    def num_docs(self) -> int:
+        return len(self._documents)
+
+    @property
+    def end(self) -> int:
+        return self.base + self.num_docs
+
+    def add_document(self, doc: Dict[str, str], term_counts: Dict[str, int], timestamp: int,
+                     numbers: Optional[Iterable[float]] = None) -> int:
+        """
+        Add a document and its postings, its norm is filled in by `set_norm`
+
+        `numbers` are the parsed numeric columns of the document if they are already known.
+
+        Returns:
+            Doc id of the new document
+        """
+        doc_id = self.end
+        doc_length = sum(term_counts.values())
+        for term, count in term_counts.items():
+            self.postings[term].append(doc_id, count / doc_length, count)
+            if count > self._max_tfs[term]:
+                self._max_tfs[term] = count
+            if doc_length < self._min_lengths.get(term, doc_length + 1):
+                self._min_lengths[term] = doc_length
+            if timestamp > self._max_timestamps.get(term, timestamp - 1):
+                self._max_timestamps[term] = timestamp
+
+        self._documents.append(doc, numbers)
+        self.doc_norms.append(0.0)
+        self.doc_lengths.append(doc_length)
+        self.timestamps.append(timestamp)
+        return doc_id
+
+    def set_norm(self, doc_id: int, norm: float, term_counts: Dict[str, int]):
+        """Set the norm of a document added with `term_counts` and update the bounds of its terms"""
+        self.doc_norms[doc_id - self.base] = norm
+        doc_length = sum(term_counts.values())
+        for term, count in term_counts.items():
+            weight = normalized_weight(count / doc_length, norm)
+            if weight > self._max_weights[term]:
+                self._max_weights[term] = weight
+
+    def append_segment(self, other: "MemorySegment"):
+        """Append the documents of a segment built separately, e.g. by a worker process, that starts at `end`"""
+        if other.base != self.end:
+            raise ValueError(f"Segment starts at doc id {other.base}, expected {self.end}")
+
+        for term, postings in other.postings.items():
+            existing = self.postings.get(term)
+            # A new list, searches may still be iterating the old one
+            self.postings[term] = postings if existing is None else PostingList.concat([existing, postings])
+        for term, weight in other._max_weights.items():
+            if weight > self._max_weights[term]:
+                self._max_weights[term] = weight
+        for term, tf in other._max_tfs.items():
+            if tf > self._max_tfs[term]:
+                self._max_tfs[term] = tf
+        for term, length in other._min_lengths.items():
+            if length < self._min_lengths.get(term, length + 1):
+                self._min_lengths[term] = length
+        for term, timestamp in other._max_timestamps.items():
+            if timestamp > self._max_timestamps.get(term, timestamp - 1):
+                self._max_timestamps[term] = timestamp
+
+        self._documents.append_store(other._documents)
+        self.doc_norms.extend(other.doc_norms)
+        self.doc_lengths.extend(other.doc_lengths)
+        self.timestamps.extend(other.timestamps)
+
+    def rebuild_bounds(self):
+        """Recompute the bounds of every term from postings that were assigned directly"""
+        self._max_weights.clear()
+        self._max_tfs.clear()
+        self._min_lengths.clear()
+        self._max_timestamps.clear()
+        for term, postings in self.postings.items():
+            bounds = posting_bounds(postings, self.base, self.doc_norms, self.doc_lengths, self.timestamps)
+            self._max_weights[term] = bounds.max_weight
+            self._max_tfs[term] = bounds.max_tf
+            self._min_lengths[term] = bounds.min_length
+            self._max_timestamps[term] = bounds.max_timestamp
+
+    def terms(self) -> Iterator[str]:
+        return iter(self.postings)
+
+    def get_postings(self, term: str) -> Optional[PostingList]:
+        return self.postings.get(term)
+
+    def doc_frequency(self, term: str) -> int:
+        postings = self.postings.get(term)
+        return len(postings) if postings is not None else 0
+
+    def bounds(self, term: str) -> Optional[TermBounds]:
+        if term not in self._min_lengths:
+            return None
+        return TermBounds(self._max_weights[term], self._max_tfs[term], self._min_lengths[term],
+                          self._max_timestamps[term])
+
+    def numeric_range(self, numeric_range: NumericRange) -> List[int]:
+        sorted_column = self._sorted_columns.get(numeric_range.column)
+        if sorted_column is None:
+            sorted_column = SortedColumn(self._documents.numbers(numeric_range.column), self.base)
+            self._sorted_columns[numeric_range.column] = sorted_column
+        return sorted_column.range(numeric_range)
+
+    def document(self, doc_id: int) -> Dict[str, str]:
+        return self._documents[doc_id - self.base]
+
+    def documents(self) -> Iterator[Dict[str, str]]:
+        return iter(self._documents)
+
+
+class LatestSnapshotIndex:
+    """
+    Postings of only the newest snapshot of every symbol.
+
+    A new snapshot always has a higher doc id than the one it replaces, so postings
+    are appended in doc id order like in `MemorySegment`. The replaced document is
+    not removed right away, its terms are marked stale and their posting lists are
+    compacted the next time they are read.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, PostingList] = {}
+        self.doc_ids: Dict[str, int] = {}  # symbol -> doc id of its newest snapshot
+        self._doc_terms: Dict[int, List[str]] = {}  # doc id -> terms, for current documents
+        self._stale_terms: set = set()
+        # Searches compact lists while the indexer adds snapshots
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def add(self, symbol: str, doc_id: int, term_counts: Dict[str, int]):
+        """Make `doc_id` the current snapshot of `symbol`, doc ids have to increase"""
+        doc_length = sum(term_counts.values())
+        with self._lock:
+            previous = self.doc_ids.get(symbol)
+            if previous is not None:
+                self._stale_terms.update(self._doc_terms.pop(previous))
+
+            for term, count in term_counts.items():
+                postings = self.postings.get(term)
+                if postings is None:
+                    postings = self.postings[term] = PostingList()
+                postings.append(doc_id, count / doc_length, count)
+            self.doc_ids[symbol] = doc_id
+            self._doc_terms[doc_id] = list(term_counts)
+
+    def get_postings(self, term: str) -> Optional[PostingList]:
+        """Postings of a term over the current snapshots, or None if none of them contains it"""
+        with self._lock:
+            if term in self._stale_terms:
+                self._compact(term)
+            return self.postings.get(term)
+
+    def _compact(self, term: str):
+        # A new list is built, so searches still iterating the old one are not affected
+        compacted = PostingList()
+        for doc_id, weight, tf in self.postings[term]:
+            if doc_id in self._doc_terms:
+                compacted.append(doc_id, weight, tf)
+        if len(compacted):
+            self.postings[term] = compacted
+        else:
+            del self.postings[term]
+        self._stale_terms.discard(term)
+
+
+def write_merged_segment(segments: List, filepath: str, idf: Callable[[str], float]) -> IndexSegment:
+    """
+    Merge segments that cover consecutive doc id ranges into one segment file
+
+    Document norms depend on the IDF of every term, which shifts as documents are
+    added, so they are recomputed with the current statistics while merging.
+
+    Args:
+        segments: Segments to merge, ordered by doc id
+        filepath: Path of the merged segment file
+        idf: term -> current TF-IDF inverse document frequency
+
+    Returns:
+        The merged segment, opened from the new file
+    """
+    base = segments[0].base
+    num_docs = sum(segment.num_docs for segment in segments)
+
+    terms = set()
+    for segment in segments:
+        terms.update(segment.terms())
+
+    postings = {}
+    squared_norms = [0.0] * num_docs
+    for term in terms:
+        parts = [segment.get_postings(term) for segment in segments]
+        merged = PostingList.concat([part for part in parts if part is not None])
+        postings[term] = merged
+
+        term_idf = idf(term)
+        for doc_id, weight in zip(merged.doc_ids, merged.weights):
+            squared_norms[doc_id - base] += (weight * term_idf) ** 2
+
+    doc_lengths = array('I')
+    timestamps = array('q')
+    for segment in segments:
+        doc_lengths.frombytes(memoryview(segment.doc_lengths).cast('B'))
+        timestamps.frombytes(memoryview(segment.timestamps).cast('B'))
+
+    documents = (doc for segment in segments for doc in segment.documents())
+    doc_norms = array('d', (norm ** 0.5 for norm in squared_norms))
+    write_segment(filepath, base, documents, postings, doc_norms, doc_lengths, timestamps)
+    return IndexSegment(filepath)
+
+
+class IndexDirectory:
+    """
+    On-disk layout of an index made of several segments.
+
+    `manifest.json` lists the live segment files in doc id order together with the
+    data file offset they cover. It is replaced atomically after every flush or
+    merge, so readers always see a complete set of segments. Only the process
+    holding `writer.lock` writes segments and manifests, other processes open the
+    index read-only and follow the manifest.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.manifest_file = os.path.join(path, "manifest.json")
+        self._lock_file = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.manifest_file)
+
+    def acquire_writer(self) -> bool:
+        """Try to become the single writer of the index directory"""
+        if self._lock_file is not None:
+            return True
+        os.makedirs(self.path, exist_ok=True)
+        lock_file = open(os.path.join(self.path, "writer.lock"), 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+        self._lock_file = lock_file
+        return True
+
+    def release_writer(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    @property
+    def is_writer(self) -> bool:
+        return self._lock_file is not None
+
+    def read_manifest(self) -> Dict[str, any]:
+        with open(self.manifest_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def write_manifest(self, manifest: Dict[str, any]):
+        temp_file = self.manifest_file + ".tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.manifest_file)
+
+    def segment_path(self, number: int) -> str:
+        return os.path.join(self.path, f"segment-{number:06d}.idx")
+
+    def remove_unused_segments(self, live_files: List[str]):
+        """Delete segment files that are no longer listed in the manifest"""
+        live = set(live_files)
+        for name in os.listdir(self.path):
+            if name.startswith("segment-") and name not in live:
+                os.remove(os.path.join(self.path, name))
+
+
+def find_segment(segments: List, doc_id: int):
+    """The segment holding `doc_id`, segments are ordered by doc id"""
+    position = bisect_right([segment.base for segment in segments], doc_id) - 1
+    if position < 0 or doc_id >= segments[position].end:
+        raise IndexError("document index out of range")
+    return segments[position]
+
+
+class SegmentPostings(Mapping):
+    """
+    term -> PostingList mapping over all segments of an index
+
+    With `start` and `end`, only the postings of the doc ids in [start, end) are
+    included, e.g. the shard of a sharded search worker.
+    """
+
+    def __init__(self, segments: List, start: int = 0, end: Optional[int] = None):
+        self.segments = segments
+        self.start = start
+        self.end = end
+
+    def _segments(self) -> List:
+        """Segments holding doc ids in the range"""
+        segments = list(self.segments)
+        if self.start == 0 and self.end is None:
+            return segments
+        return [segment for segment in segments
+                if segment.end > self.start and (self.end is None or segment.base < self.end)]
+
+    def __getitem__(self, term: str) -> PostingList:
+        parts = []
+        for segment in self._segments():
+            postings = segment.get_postings(term)
+            if postings is not None and (segment.base < self.start or
+                                         (self.end is not None and segment.end > self.end)):
+                postings = doc_range(postings, self.start, segment.end if self.end is None else self.end)
+            if postings is not None and len(postings):
+                parts.append(postings)
+        if not parts:
+            raise KeyError(term)
+        if len(parts) == 1:
+            return parts[0]
+        return PostingList.concat(parts)
+
+    def bounds(self, term: str) -> Optional[TermBounds]:
+        """Score bounds of a term over all segments, or None if the term isn't indexed"""
+        result = None
+        for segment in self._segments():
+            bounds = segment.bounds(term)
+            if bounds is not None:
+                result = bounds if result is None else result.combine(bounds)
+        return result
+
+    def __iter__(self) -> Iterator[str]:
+        terms = set()
+        for segment in self._segments():
+            terms.update(segment.terms())
+        return iter(terms)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+class SegmentDocFrequencies(Mapping):
+    """term -> document frequency mapping over all segments of an index"""
+
+    def __init__(self, segments: List):
+        self.segments = segments
+
+    def __getitem__(self, term: str) -> int:
+        frequency = sum(segment.doc_frequency(term) for segment in list(self.segments))
+        if frequency == 0:
+            raise KeyError(term)
+        return frequency
+
+    def __iter__(self) -> Iterator[str]:
+        terms = set()
+        for segment in list(self.segments):
+            terms.update(segment.terms())
+        return iter(terms)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+class SegmentDocuments(Sequence):
+    """
+    Documents of all segments, decoded when they are accessed
+
+    Rows that were loaded but not indexed yet are kept in `pending` and follow
+    the indexed documents.
+    """
+
+    def __init__(self, segments: List):
+        self.segments = segments
+        self.pending: List[Dict[str, str]] = []
+
+    def _indexed(self) -> int:
+        return self.segments[-1].end if self.segments else 0
+
+    def append(self, doc: Dict[str, str]):
+        self.pending.append(doc)
+
+    def __getitem__(self, doc_id: int) -> Dict[str, str]:
+        if isinstance(doc_id, slice):
+            return [self[i] for i in range(*doc_id.indices(len(self)))]
+        if doc_id < 0:
+            doc_id += len(self)
+        indexed = self._indexed()
+        if doc_id >= indexed:
+            if doc_id - indexed >= len(self.pending) or doc_id < 0:
+                raise IndexError("document index out of range")
+            return self.pending[doc_id - indexed]
+        return find_segment(self.segments, doc_id).document(doc_id)
+
+    def __len__(self) -> int:
+        return self._indexed() + len(self.pending)
@@ -0,0 +1,790 @@
+import csv
+import math
+import os
+import random
+import tempfile
+from bisect import bisect_left
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import indexer
+import numeric_index
+from benchmark import synthetic_rows, write_rows
+from doc_store import NUMERIC_COLUMNS, DocumentStore
+from extractor import TSV_FIELDNAMES
+from indexer import StockIndexer, MERGE_FACTOR
+from numeric_fields import format_number, numeric_value, parse_number
+from numeric_index import NumericRange, parse_range
+from query_cache import QueryCache
+from postings import PostingList, gallop, intersect
+from ranking import QueryTerm, top_k_all, top_k_any
+from sharded_search import ShardedIndexer
+
+# Small in-memory segments, so a few hundred rows already exercise flushes and merges
+indexer.FLUSH_DOCS = 100
+# In-memory columns are sorted after a few rows, so range lookups use both the sorted part and the scan
+numeric_index.MAX_UNSORTED = 16
+
+QUERIES = [
+    ("exchange_nasdaq price_low", True, 'tfidf'),
+    ("exchange_nasdaq move_flat price_low", False, 'tfidf'),
+    ("symbol_s00042 move_surge", False, 'tfidf'),
+    ("cap_large price_medium", True, 'bm25'),
+    ("exchange_nyse move_up_weak size_small", False, 'bm25'),
+]
+
+# Every ranking is compared at the same time, recency weights depend on it.
+# Shortly after the last synthetic snapshot, so recent documents don't all decay to nothing.
+NOW = time.mktime((2025, 10, 30, 0, 0, 0, 0, 0, -1))
+
+
+def posting_list(doc_ids):
+    postings = PostingList()
+    for doc_id in doc_ids:
+        postings.append(doc_id, 1.0, 1)
+    return postings
+
+
+def query_term(contributions, max_weight, calls=None):
+    """
+    Term scored with the given {doc_id: contribution}
+
+    Contributions and weights are multiples of 1/4, so every sum is exact and
+    ties on the k-th score are real ties whatever order the terms are added in.
+    """
+    postings = posting_list(sorted(contributions))
+
+    def score(doc_id, position):
+        if postings.doc_ids[position] != doc_id:
+            raise AssertionError(f"Doc {doc_id} scored with the posting of {postings.doc_ids[position]}")
+        if calls is not None:
+            calls.append(doc_id)
+        return contributions[doc_id]
+
+    upper_bound = max(contributions.values(), default=0.0) * max_weight
+    return QueryTerm(postings, upper_bound, score)
+
+
+def exhaustive_top_k(term_contributions, k, doc_weight, require_all_terms):
+    """Every matching document scored one by one, sorted by score, ties by doc_id"""
+    doc_ids = set().union(*term_contributions)
+    scored = []
+    for doc_id in doc_ids:
+        matched = [contributions[doc_id] for contributions in term_contributions if doc_id in contributions]
+        if require_all_terms and len(matched) < len(term_contributions):
+            continue
+        scored.append((doc_id, sum(matched) * doc_weight(doc_id)))
+    return sorted(scored, key=lambda item: (-item[1], item[0]))[:k]
+
+
+def append_rows(rows, data_file):
+    with open(data_file, 'a', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=TSV_FIELDNAMES, delimiter='\t')
+        writer.writerows(rows)
+
+
+def fresh_index(rows, temp_dir):
+    """Index built from scratch over all the rows"""
+    data_file = os.path.join(temp_dir, "fresh.tsv")
+    write_rows(rows, data_file)
+    fresh = StockIndexer(data_file=data_file, query_cache_size=0)
+    fresh.load_data()
+    fresh.build_index()
+    return fresh
+
+
+def check_rankings(indexer, expected, name):
+    """
+    Compare every query of QUERIES, in AND/OR and with latest_only, with the index `expected`
+
+    TF-IDF norms of documents indexed before later rows use the IDF of that time
+    until their segment is merged, so only the order of TF-IDF results is compared.
+    """
+    success = True
+    for query, require_all_terms, method in QUERIES:
+        for latest_only in (False, True):
+            ranked = indexer.rank(query, 10, require_all_terms, method, latest_only, now=NOW)
+            wanted = expected.rank(query, 10, require_all_terms, method, latest_only, now=NOW)
+            same = [doc_id for doc_id, _ in ranked] == [doc_id for doc_id, _ in wanted]
+            if method == 'bm25':
+                same = same and all(math.isclose(score, wanted_score, rel_tol=1e-9)
+                                    for (_, score), (_, wanted_score) in zip(ranked, wanted))
+            if not same:
+                print(f"ERROR: {name}: '{query}' ({method}, latest_only={latest_only}) "
+                      f"ranks {ranked} instead of {wanted}")
+                success = False
+    return success
+
+
+def test_gallop():
+    success = True
+    rng = random.Random(7)
+    for _ in range(200):
+        doc_ids = sorted(rng.sample(range(1000), rng.randint(0, 60)))
+        start = rng.randint(0, len(doc_ids))
+        target = rng.randint(-5, 1005)
+        expected = bisect_left(doc_ids, target, start)
+        if gallop(doc_ids, target, start) != expected:
+            print(f"ERROR: gallop({doc_ids}, {target}, {start}) is {gallop(doc_ids, target, start)} "
+                  f"instead of {expected}")
+            success = False
+    return success
+
+
+def test_intersect():
+    success = True
+    cases = [
+        ([], []),
+        ([[]], []),
+        ([[1, 2, 3], []], []),
+        ([[], [1, 2, 3]], []),
+        ([[1, 3, 5, 7], [2, 4, 6, 8]], []),
+        ([[1, 2, 3], [4, 5, 6]], []),
+        ([[4, 5, 6], [1, 2, 3]], []),
+        ([[1, 5, 9]], [1, 5, 9]),
+        ([[1, 5, 9], [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]], [1, 5, 9]),
+        ([[0, 1000], list(range(1000)), [0, 999, 1000]], [0]),
+    ]
+    rng = random.Random(11)
+    for _ in range(200):
+        lists = [sorted(rng.sample(range(300), rng.choice([0, 1, 5, 40, 250]))) for _ in range(rng.randint(1, 4))]
+        cases.append((lists, sorted(set.intersection(*map(set, lists)))))
+
+    for lists, expected in cases:
+        found = list(intersect([posting_list(doc_ids) for doc_ids in lists]))
+        if [doc_id for doc_id, _ in found] != expected:
+            print(f"ERROR: Intersection of {lists} is {[doc_id for doc_id, _ in found]} instead of {expected}")
+            success = False
+            continue
+        for doc_id, positions in found:
+            if [doc_ids[position] for doc_ids, position in zip(lists, positions)] != [doc_id] * len(lists):
+                print(f"ERROR: Positions {positions} of doc {doc_id} in {lists} are wrong")
+                success = False
+    return success
+
+
+def test_top_k():
+    success = True
+    rng = random.Random(3)
+    num_docs = 80
+    weights = [rng.choice([0.25, 0.5, 1.0]) for _ in range(num_docs)]
+    doc_weight = weights.__getitem__
+
+    def check(term_contributions, k, require_all_terms, name):
+        terms = [query_term(contributions, max(weights)) for contributions in term_contributions]
+        top_k = top_k_all if require_all_terms else top_k_any
+        ranked = top_k(terms, k, doc_weight)
+        expected = exhaustive_top_k(term_contributions, k, doc_weight, require_all_terms)
+        if ranked != expected:
+            print(f"ERROR: {name}: {top_k.__name__} with k={k} ranks {ranked} instead of {expected}")
+            return False
+        return True
+
+    # Random terms of every density with few distinct contributions, so many documents tie
+    for _ in range(150):
+        term_contributions = []
+        for _ in range(rng.randint(1, 4)):
+            doc_ids = rng.sample(range(num_docs), rng.choice([0, 1, 3, 10, 40, 80]))
+            term_contributions.append({doc_id: rng.choice([0.25, 0.5, 1.0, 2.0]) for doc_id in doc_ids})
+        for k in (1, 3, 10, num_docs + 5):
+            for require_all_terms in (True, False):
+                success &= check(term_contributions, k, require_all_terms, "random terms")
+
+    # Every document scores the same, the lowest doc ids win the ties
+    same = {doc_id: 1.0 for doc_id in range(0, num_docs, 2)}
+    for require_all_terms in (True, False):
+        success &= check([same, dict(same)], 5, require_all_terms, "all tied")
+        success &= check([same], 0, require_all_terms, "k of 0")
+        success &= check([same, {}], 5, require_all_terms, "empty term")
+        success &= check([{1: 1.0, 3: 1.0}, {2: 1.0, 4: 1.0}], 5, require_all_terms, "disjoint terms")
+
+    # A common term with small contributions and a rare one that decides the top k. Once the k-th
+    # score is above the common term's bound, it only gets probed for the rare term's documents.
+    common = {doc_id: 0.25 for doc_id in range(num_docs)}
+    rare = {doc_id: 2.0 for doc_id in range(10, num_docs, 8)}
+    calls = []
+    terms = [query_term(common, max(weights), calls), query_term(rare, max(weights))]
+    ranked = top_k_any(terms, 3, doc_weight)
+    expected = exhaustive_top_k([common, rare], 3, doc_weight, False)
+    if ranked != expected:
+        print(f"ERROR: MaxScore ranks {ranked} instead of {expected}")
+        success = False
+    if len(calls) >= len(common):
+        print(f"ERROR: MaxScore scored all {len(calls)} documents of the common term")
+        success = False
+    success &= check([common, rare], num_docs + 5, False, "MaxScore with k above the matches")
+
+    return success
+
+
+def test_document_store():
+    success = True
+
+    def stored(row, column):
+        if column in NUMERIC_COLUMNS:
+            return format_number(numeric_value(row, column))
+        return row.get(column) or ""
+
+    def check(store, rows, name):
+        all_columns = set().union(*rows)
+        if set(store.columns) != all_columns:
+            print(f"ERROR: {name}: Store has columns {store.columns} instead of {sorted(all_columns)}")
+            return False
+        if len(store) != len(rows):
+            print(f"ERROR: {name}: Store has {len(store)} of {len(rows)} rows")
+            return False
+        for index, row in enumerate(rows):
+            expected = {column: stored(row, column) for column in store.columns}
+            if store[index] != expected or list(store[index]) != store.columns:
+                print(f"ERROR: {name}: Row {index} is {store[index]} instead of {expected}")
+                return False
+        return True
+
+    def store_of(rows):
+        store = DocumentStore()
+        store.extend(rows)
+        return store
+
+    # y and price_value are discovered by the second row, the first reports them as empty
+    first = [{"company": "A", "symbol": "AA", "x": "1"},
+             {"company": "B", "symbol": "BB", "x": "2", "y": "3", "price_value": "12.5"}]
+    # y before x, the rows are decoded and added again
+    reordered = [{"symbol": "CC", "y": "4"},
+                 {"symbol": "DD", "x": "5", "exchange": "NYSE", "market_cap_value": "1000000000"}]
+    # x, y and a new z, the text entries are copied as they are
+    extended = [{"symbol": "EE", "x": "6"}, {"symbol": "FF", "x": "7", "y": "8", "z": "9"}]
+    # Fewer columns than the store
+    shorter = [{"symbol": "GG", "x": "10", "current_price": "$1,234.50"}]
+
+    success &= check(store_of(first), first, "append")
+
+    store = store_of(first)
+    rows = list(first)
+    for other in (reordered, extended, shorter):
+        store.append_store(store_of(other))
+        rows += other
+        success &= check(store, rows, f"append_store of {other[-1]['symbol']}")
+
+    # Appending a row with every column afterwards doesn't change the rows before it
+    store.append({column: "1" for column in store.columns})
+    success &= check(store, rows + [{column: "1" for column in store.columns}], "append after append_store")
+
+    return success
+
+
+def test_query_cache():
+    success = True
+
+    cache = QueryCache(max_entries=3)
+    for key in "abc":
+        cache.put(key, 0, key.upper())
+    cache.get("a", 0)
+    cache.put("d", 0, "D")
+    # "b" is the least recently used after "a" was looked up
+    if cache.get("b", 0) is not None or [cache.get(key, 0) for key in "acd"] != ["A", "C", "D"]:
+        print(f"ERROR: LRU eviction kept {list(cache._entries)} instead of a, c and d")
+        success = False
+    if cache.evictions != 1:
+        print(f"ERROR: {cache.evictions} evictions counted instead of 1")
+        success = False
+
+    # The first lookup at a newer generation drops everything computed before
+    if cache.get("a", 1) is not None or len(cache) != 0:
+        print("ERROR: Entries of generation 0 survived a lookup at generation 1")
+        success = False
+    if cache.invalidations != 1:
+        print(f"ERROR: {cache.invalidations} invalidations counted instead of 1")
+        success = False
+    # A search that started before the index changed finishes after the lookup at the new generation
+    cache.put("a", 0, "stale")
+    if cache.get("a", 1) is not None:
+        print("ERROR: A result of an older generation was cached")
+        success = False
+    cache.put("a", 1, "A1")
+    if cache.get("a", 1) != "A1":
+        print("ERROR: A result of the current generation wasn't cached")
+        success = False
+
+    cache = QueryCache(max_entries=3, max_age=0.05)
+    cache.put("a", 0, "A")
+    if cache.get("a", 0) != "A":
+        print("ERROR: A fresh entry was treated as expired")
+        success = False
+    time.sleep(0.1)
+    if cache.get("a", 0) is not None:
+        print("ERROR: An entry older than max_age was returned")
+        success = False
+
+    cache = QueryCache(max_entries=0)
+    cache.put("a", 0, "A")
+    if cache.get("a", 0) is not None or len(cache) != 0:
+        print("ERROR: A cache of size 0 stored a result")
+        success = False
+
+    return success
+
+
+def test_search_cache_invalidation(temp_dir):
+    success = True
+    rows = synthetic_rows(200, symbols=50)
+    data_file = os.path.join(temp_dir, "data.tsv")
+    write_rows(rows[:150], data_file)
+
+    indexer = StockIndexer(data_file=data_file)
+    indexer.load_data()
+    indexer.build_index()
+
+    query = f"symbol_{rows[-1]['symbol'].lower()}"
+    first = indexer.search(query, top_k=100)
+    if indexer.search(query, top_k=100) != first or indexer.query_cache.hits != 1:
+        print("ERROR: Repeating a search didn't hit the cache")
+        success = False
+
+    indexer.add_documents(rows[150:])
+    misses = indexer.query_cache.misses
+    added = indexer.search(query, top_k=100)
+    if indexer.query_cache.misses != misses + 1:
+        print("ERROR: A search after add_documents was answered from the cache")
+        success = False
+    new_doc_ids = {doc_id for doc_id in range(150, len(rows)) if rows[doc_id]['symbol'] == rows[-1]['symbol']}
+    if not new_doc_ids <= {doc_id for doc_id, _, _ in added}:
+        print(f"ERROR: The added documents {sorted(new_doc_ids)} are missing from the results of '{query}'")
+        success = False
+
+    indexer.close()
+    return success
+
+
+def test_refresh_after_append(temp_dir):
+    success = True
+    rows = synthetic_rows(1000, symbols=150)
+    data_file = os.path.join(temp_dir, "data.tsv")
+    write_rows(rows[:500], data_file)
+
+    writer = StockIndexer(data_file=data_file, query_cache_size=0)
+    writer.load_data()
+    writer.build_index()
+    writer.save_index(os.path.join(temp_dir, "index"))
+
+    append_rows(rows[500:], data_file)
+    added = writer.refresh()
+    if added != 500:
+        print(f"ERROR: Refresh added {added} of 500 appended rows")
+        success = False
+    if writer.refresh() != 0:
+        print("ERROR: Refresh without appended rows added documents")
+        success = False
+
+    success &= check_rankings(writer, fresh_index(rows, temp_dir), "refresh after append")
+    writer.close()
+    return success
+
+
+def test_merge_segments(temp_dir):
+    success = True
+    rows = synthetic_rows(100 * (MERGE_FACTOR + 1), symbols=150)
+    data_file = os.path.join(temp_dir, "data.tsv")
+    write_rows(rows[:100], data_file)
+
+    writer = StockIndexer(data_file=data_file, query_cache_size=0)
+    writer.load_data()
+    writer.build_index()
+    writer.save_index(os.path.join(temp_dir, "index"))
+
+    # Every batch of FLUSH_DOCS rows is written out as a segment file of the same tier
+    for start in range(100, len(rows), 100):
+        append_rows(rows[start:start + 100], data_file)
+        writer.refresh()
+    files = len(writer.index_directory.read_manifest()['segments'])
+    if files != MERGE_FACTOR + 1:
+        print(f"ERROR: {files} segment files after {MERGE_FACTOR + 1} flushes")
+        success = False
+
+    if not writer.merge_segments():
+        print(f"ERROR: {MERGE_FACTOR} segments of the same size were not merged")
+        success = False
+    manifest = writer.index_directory.read_manifest()
+    if len(manifest['segments']) != files - MERGE_FACTOR + 1:
+        print(f"ERROR: {len(manifest['segments'])} segment files after the merge")
+        success = False
+    on_disk = sorted(name for name in os.listdir(writer.index_directory.path) if name.startswith("segment-"))
+    if on_disk != sorted(manifest['segments']):
+        print(f"ERROR: Segment files {on_disk} don't match the manifest {manifest['segments']}")
+        success = False
+    if writer.merge_segments():
+        print("ERROR: Segments of different sizes were merged")
+        success = False
+
+    success &= check_rankings(writer, fresh_index(rows, temp_dir), "merged segments")
+    writer.close()
+    return success
+
+
+def test_reopen_after_close(temp_dir):
+    success = True
+    rows = synthetic_rows(650, symbols=150)
+    data_file = os.path.join(temp_dir, "data.tsv")
+    write_rows(rows[:300], data_file)
+    index_path = os.path.join(temp_dir, "index")
+
+    writer = StockIndexer(data_file=data_file, query_cache_size=0)
+    writer.load_data()
+    writer.build_index()
+    writer.save_index(index_path)
+    # The first batch is flushed, the last 50 documents are still in memory and written out by close
+    append_rows(rows[300:600], data_file)
+    writer.refresh()
+    append_rows(rows[600:], data_file)
+    writer.refresh()
+    if len(writer.index_directory.read_manifest()['segments']) != 2:
+        print("ERROR: The appended rows weren't flushed as a second segment")
+        success = False
+    writer.close()
+    if len(writer.index_directory.read_manifest()['segments']) != 3:
+        print("ERROR: close() didn't write the documents in memory")
+        success = False
+
+    reopened = StockIndexer(query_cache_size=0)
+    reopened.load_index(index_path)
+    if not reopened.index_directory.is_writer:
+        print("ERROR: The index is still locked after close()")
+        success = False
+    if len(reopened.documents) != len(rows):
+        print(f"ERROR: Reopened index has {len(reopened.documents)} of {len(rows)} documents")
+        success = False
+    if reopened.latest_snapshots != writer.latest_snapshots:
+        print("ERROR: Latest snapshots changed by reopening the index")
+        success = False
+
+    success &= check_rankings(reopened, writer, "reopened after close")
+    success &= check_rankings(reopened, fresh_index(rows, temp_dir), "reopened after close")
+    reopened.close()
+    return success
+
+
+def test_read_only_follow(temp_dir):
+    success = True
+    rows = synthetic_rows(700, symbols=150)
+    data_file = os.path.join(temp_dir, "data.tsv")
+    write_rows(rows[:300], data_file)
+    index_path = os.path.join(temp_dir, "index")
+
+    writer = StockIndexer(data_file=data_file, query_cache_size=0)
+    writer.load_data()
+    writer.build_index()
+    writer.save_index(index_path)
+
+    reader = StockIndexer(query_cache_size=0)
+    reader.load_index(index_path)
+    if reader.index_directory.is_writer:
+        print("ERROR: A second process became writer of a locked index")
+        success = False
+    try:
+        reader.save_index(index_path)
+        print("ERROR: A read-only index was saved")
+        success = False
+    except RuntimeError:
+        pass
+
+    # The writer flushes 400 rows, the reader switches to its manifest and indexes the rest itself
+    append_rows(rows[300:], data_file)
+    writer.refresh()
+    sequence = writer.index_directory.read_manifest()['sequence']
+    reader.refresh()
+    if reader._manifest_sequence != sequence:
+        print(f"ERROR: Reader is at manifest {reader._manifest_sequence}, the writer wrote {sequence}")
+        success = False
+    if len(reader.documents) != len(rows):
+        print(f"ERROR: Reader has {len(reader.documents)} of {len(rows)} documents")
+        success = False
+    if reader.merge_segments():
+        print("ERROR: A read-only index merged segments")
+        success = False
+
+    success &= check_rankings(reader, writer, "read-only follow")
+    reader.close()
+    writer.close()
+    return success
+
+
+def test_rebuild_on_truncate(temp_dir):
+    success = True
+    rows = synthetic_rows(600, symbols=150)
+    data_file = os.path.join(temp_dir, "data.tsv")
+    write_rows(rows, data_file)
+    index_path = os.path.join(temp_dir, "index")
+
+    writer = StockIndexer(data_file=data_file, query_cache_size=0)
+    writer.load_data()
+    writer.build_index()
+    writer.save_index(index_path)
+
+    # The data file is rewritten with fewer rows, e.g. by a bulk re-extraction
+    write_rows(rows[:250], data_file)
+    writer.refresh()
+    if len(writer.documents) != 250:
+        print(f"ERROR: Index has {len(writer.documents)} documents after the data file shrank to 250 rows")
+        success = False
+    if writer.index_directory is None or not writer.index_directory.is_writer:
+        print("ERROR: The rebuilt index isn't saved to its directory")
+        success = False
+    elif writer.index_directory.read_manifest()['data_offset'] != os.path.getsize(data_file):
+        print("ERROR: The manifest doesn't cover the rewritten data file")
+        success = False
+
+    success &= check_rankings(writer, fresh_index(rows[:250], temp_dir), "rebuild on truncate")
+    writer.close()
+    return success
+
+
+def test_parse_number():
+    success = True
+    cases = {
+        "$1,234.50": 1234.5,
+        "+2.31%": 2.31,
+        "-0.5%": -0.5,
+        "12.5B USD": 12.5e9,
+        "3.4M": 3.4e6,
+        "1.2T USD": 1.2e12,
+        "850K": 850e3,
+        "": math.nan,
+        "N/A": math.nan,
+        "1S2": math.nan,
+        "4D": math.nan,
+        "U12": math.nan,
+        "12 US": math.nan,
+    }
+    for text, expected in cases.items():
+        value = parse_number(text)
+        if not (value == expected or (math.isnan(value) and math.isnan(expected))):
+            print(f"ERROR: parse_number('{text}') is {value} instead of {expected}")
+            success = False
+    return success
+
+
+def test_parse_range():
+    success = True
+    inf = math.inf
+    cases = {
+        "price:100..250": NumericRange("price_value", 100, 250),
+        "price:..250": NumericRange("price_value", -inf, 250),
+        "cap:50B..": NumericRange("market_cap_value", 50e9, inf),
+        "cap:>50B": NumericRange("market_cap_value", low=50e9, include_low=False),
+        "cap:>=1.5T": NumericRange("market_cap_value", low=1.5e12),
+        "revenue:>100M": NumericRange("revenue_value", low=100e6, include_low=False),
+        "change:<-3%": NumericRange("change_pct_value", high=-3, include_high=False),
+        "change:<=2.5%": NumericRange("change_pct_value", high=2.5),
+        "employees:=1000": NumericRange("employees_value", 1000, 1000),
+        "employees:12K": NumericRange("employees_value", 12000, 12000),
+        "PRICE:$1,234.50": NumericRange("price_value", 1234.5, 1234.5),
+        "price:abc": None,
+        "price:1S2": None,
+        "price:1..x": None,
+        "price:": None,
+        "volume:>10": None,
+        "exchange_nasdaq": None,
+    }
+    for token, expected in cases.items():
+        parsed = parse_range(token)
+        if parsed != expected:
+            print(f"ERROR: parse_range('{token}') is {parsed} instead of {expected}")
+            success = False
+
+    bounds = {
+        (50e9, "cap:>50B"): False,
+        (50e9, "cap:>=50B"): True,
+        (-3.0, "change:<-3%"): False,
+        (-3.0, "change:<=-3%"): True,
+        (250.0, "price:100..250"): True,
+        (math.nan, "price:..250"): False,
+    }
+    for (value, token), expected in bounds.items():
+        if (value in parse_range(token)) != expected:
+            print(f"ERROR: {value} in '{token}' is {not expected}")
+            success = False
+
+    return success
+
+
+def test_range_queries(temp_dir):
+    success = True
+    rows = synthetic_rows(600, symbols=100)
+    data_file = os.path.join(temp_dir, "data.tsv")
+    write_rows(rows[:540], data_file)
+
+    writer = StockIndexer(data_file=data_file, query_cache_size=0)
+    writer.load_data()
+    writer.build_index()
+    writer.save_index(os.path.join(temp_dir, "index"))
+    # Ranges are looked up in the segment file and in the in-memory segment
+    append_rows(rows[540:], data_file)
+    writer.refresh()
+
+    price = numeric_value(writer.documents[7], "price_value")
+    queries = [
+        "price:100..250",
+        "cap:>50B",
+        "change:<-3% cap:>1B",
+        f"price:{price}",
+        "price:10..60 exchange_nasdaq",
+        "revenue:>=100M employees:<=50000 exchange_nyse move_flat",
+        "cap:<=500M price:>20 move_up_weak size_small",
+        "change:>=2% exchange_nasdaq cap_large",
+    ]
+
+    latest = set(writer.latest_snapshots.values())
+    for query in queries:
+        ranges = writer._query_ranges(query)
+        terms = writer._query_terms(query)
+        in_ranges = [doc_id for doc_id in range(len(writer.documents))
+                     if all(numeric_value(writer.documents[doc_id], numeric_range.column) in numeric_range
+                            for numeric_range in ranges)]
+        if not in_ranges:
+            print(f"ERROR: No document matches the ranges of '{query}', the test data doesn't cover it")
+            success = False
+
+        for require_all_terms in (True, False):
+            for latest_only in (False, True):
+                # Every document that has the terms and is in every range, scanned one by one
+                expected = set()
+                for doc_id in in_ranges:
+                    doc_terms = set(writer.extract_terms(writer.documents[doc_id]))
+                    has_terms = all if require_all_terms else any
+                    if (not terms or has_terms(term in doc_terms for term in terms)) and \
+                            (not latest_only or doc_id in latest):
+                        expected.add(doc_id)
+
+                for method in ('tfidf', 'bm25'):
+                    ranked = writer.rank(query, len(writer.documents), require_all_terms, method, latest_only,
+                                         now=NOW)
+                    found = {doc_id for doc_id, _ in ranked}
+                    if found != expected or len(ranked) != len(found):
+                        print(f"ERROR: '{query}' ({method}, require_all_terms={require_all_terms}, "
+                              f"latest_only={latest_only}) found {len(ranked)} documents, expected "
+                              f"{len(expected)}: missing {sorted(expected - found)[:5]}, "
+                              f"extra {sorted(found - expected)[:5]}")
+                        success = False
+
+    writer.close()
+    return success
+
+
+def test_sharded_search(temp_dir):
+    success = True
+    rows = synthetic_rows(900, symbols=150)
+    data_file = os.path.join(temp_dir, "data.tsv")
+    write_rows(rows[:500], data_file)
+    index_path = os.path.join(temp_dir, "index")
+
+    writer = StockIndexer(data_file=data_file, query_cache_size=0)
+    writer.load_data()
+    writer.build_index()
+    writer.save_index(index_path)
+    # Two segment files, some shards span both
+    append_rows(rows[500:700], data_file)
+    writer.refresh()
+
+    queries = [(query, require_all_terms, method, latest_only)
+               for query, _, _ in QUERIES + [("price:10..60 exchange_nasdaq", True, 'tfidf')]
+               for require_all_terms in (True, False)
+               for method in ('tfidf', 'bm25')
+               for latest_only in (False, True)]
+
+    def compare(sharded, name):
+        single = StockIndexer(query_cache_size=0)
+        single.open_segments(index_path)
+        expected = [single.rank(query, 10, require_all_terms, method, latest_only, now=NOW)
+                    for query, require_all_terms, method, latest_only in queries]
+
+        def rank(arguments):
+            query, require_all_terms, method, latest_only = arguments
+            return sharded.rank(query, 10, require_all_terms, method, latest_only, now=NOW)
+
+        # One query at a time, then many from several threads at once
+        with ThreadPoolExecutor(8) as executor:
+            for ranked_queries in ([rank(arguments) for arguments in queries], list(executor.map(rank, queries * 4))):
+                for i, ranked in enumerate(ranked_queries):
+                    if ranked != expected[i % len(queries)]:
+                        print(f"ERROR: {name}: {queries[i % len(queries)]} ranks {ranked} instead of "
+                              f"{expected[i % len(queries)]}")
+                        return False
+        return True
+
+    sharded = ShardedIndexer(index_path, 3, query_cache_size=0)
+    success &= compare(sharded, "sharded search")
+
+    # The writer flushes another segment, the workers and the coordinator follow its manifest
+    append_rows(rows[700:], data_file)
+    writer.refresh()
+    added = sharded.refresh()
+    if added != 200:
+        print(f"ERROR: Sharded search refresh added {added} of 200 flushed documents")
+        success = False
+    success &= compare(sharded, "sharded search after refresh")
+
+    sharded.close()
+    writer.close()
+    return success
+
+
+def test_sharded_search_sees_new_rows(temp_dir):
+    success = True
+    rows = synthetic_rows(320, symbols=150)
+    data_file = os.path.join(temp_dir, "data.tsv")
+    write_rows(rows[:300], data_file)
+    index_path = os.path.join(temp_dir, "index")
+
+    writer = StockIndexer(data_file=data_file, query_cache_size=0)
+    writer.load_data()
+    writer.build_index()
+    writer.save_index(index_path)
+    sharded = ShardedIndexer(index_path, 2, query_cache_size=0)
+    writer.start_background_updates(interval=0.1, flush=True)
+    sharded.start_background_updates(interval=0.1)
+
+    # Far fewer rows than FLUSH_DOCS, they are flushed by the next background update anyway
+    append_rows(rows[300:], data_file)
+    deadline = time.monotonic() + 5
+    while len(sharded.documents) < len(rows) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    if len(sharded.documents) != len(rows):
+        print(f"ERROR: Sharded search sees {len(sharded.documents)} of {len(rows)} documents after 5 s")
+        success = False
+    else:
+        query = f"symbol_{rows[-1]['symbol'].lower()}"
+        ranked = sharded.rank(query, 10, True, 'tfidf', latest_only=True, now=NOW)
+        if [doc_id for doc_id, _ in ranked] != [len(rows) - 1]:
+            print(f"ERROR: '{query}' ranks {ranked} instead of the new snapshot {len(rows) - 1}")
+            success = False
+
+    sharded.close()
+    writer.close()
+    return success
+
+
+def main():
+    tests = [test_parse_number, test_parse_range, test_gallop, test_intersect, test_top_k,
+             test_query_cache, test_document_store]
+    index_tests = [test_search_cache_invalidation, test_refresh_after_append, test_merge_segments,
+                   test_reopen_after_close, test_read_only_follow, test_rebuild_on_truncate, test_range_queries,
+                   test_sharded_search, test_sharded_search_sees_new_rows]
+    failed_tests = 0
+
+    for test in tests:
+        if not test():
+            print(f"FAILED: {test.__name__}")
+            failed_tests += 1
+    for test in index_tests:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            if not test(temp_dir):
+                print(f"FAILED: {test.__name__}")
+                failed_tests += 1
+
+    total_tests = len(tests) + len(index_tests)
+    print(f"Total tests: {total_tests}")
+    print(f"Failed tests: {failed_tests}")
+    print(f"Success rate: {100 - (failed_tests / total_tests) * 100}%")
+
+
+if __name__ == "__main__":
+    main()
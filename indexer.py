@@ -1,177 +1,113 @@
 import csv
+import heapq
+import io
 import math
+import multiprocessing
+import os
 import pickle
 import re
+import threading
+import time
+from array import array
+from bisect import bisect_right
 from collections import defaultdict, Counter
 from datetime import datetime
-from typing import Dict, List, Set, Tuple, Any
-from pathlib import Path
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Set, Tuple, Any
+
+from numeric_fields import NUMERIC_FIELDS, numeric_value
+from numeric_index import NumericRange, parse_range
+from postings import PostingList, doc_range, intersect, restrict
+from index_segment import (IndexDirectory, IndexSegment, LatestSnapshotIndex, MemorySegment, SegmentDocFrequencies,
+                           SegmentDocuments, SegmentPostings, NO_TIMESTAMP, normalized_weight, write_merged_segment, write_segment)
+from query_cache import QueryCache
+from ranking import QueryTerm, recency_weight, top_k_all, top_k_any
+import vector_scoring
+
+# Layout version of pickled indexes, the format used before segment files
+INDEX_FORMAT_VERSION = 4
+
+# Newly indexed documents stay in memory until there are this many, then they are written as a segment
+FLUSH_DOCS = 5_000
+# Number of segments of a similar size that are merged into one
+MERGE_FACTOR = 4
+# Fewest documents a worker process of a parallel build gets, smaller batches aren't worth starting processes for
+MIN_SHARD_DOCS = 10_000
+
+# Numeric column -> (boundaries, terms): a value gets the term after the last boundary that is <= the value
+NUMERIC_BUCKETS = {
+    # <$10, $10-50, $50-150, $150-500, $500+
+    'price_value': ([10, 50, 150, 500],
+                    ['price_micro', 'price_low', 'price_medium', 'price_high', 'price_very_high']),
+    # <$50M, $50M-300M, $300M-2B, $2B-10B, $10B-200B, $200B+
+    'market_cap_value': ([50e6, 300e6, 2e9, 10e9, 200e9],
+                         ['cap_nano', 'cap_micro', 'cap_small', 'cap_mid', 'cap_large', 'cap_mega']),
+    # <-5%, -5% to -2%, -2% to -0.5%, -0.5% to 0.5%, 0.5% to 2%, 2% to 5%, >5%.
+    # Buckets above -0.5% include their upper bound, so those boundaries are the next float after it.
+    'change_pct_value': ([-5, -2, -0.5, math.nextafter(0.5, math.inf), math.nextafter(2, math.inf),
+                          math.nextafter(5, math.inf)],
+                         ['move_crash', 'move_down_strong', 'move_down_weak', 'move_flat', 'move_up_weak',
+                          'move_up_strong', 'move_surge']),
+    # <1K, 1K-10K, 10K-50K, 50K-100K, 100K+
+    'employees_value': ([1_000, 10_000, 50_000, 100_000],
+                        ['size_tiny', 'size_small', 'size_medium', 'size_large', 'size_huge']),
+    # <$100M, $100M-1B, $1B-10B, $10B-50B, $50B+
+    'revenue_value': ([100e6, 1e9, 10e9, 50e9],
+                      ['rev_startup', 'rev_small', 'rev_medium', 'rev_large', 'rev_huge']),
+}
 
 # TODO: vahy podla casu
 
 class StockIndexer:
     """TF-IDF indexer for stock market time-series data."""
     
-    def __init__(self, data_file: str = "data/extracted_data.tsv", half_life_days: float = 7.0):
+    def __init__(self, data_file: str = "data/extracted_data.tsv", half_life_days: float = 7.0,
+                 scoring_backend: str = 'python', query_cache_size: int = 1024, build_workers: int = 1):
+        if scoring_backend not in ('python', 'numpy'):
+            raise ValueError(f"Unknown scoring backend: {scoring_backend}")
+        if scoring_backend == 'numpy' and not vector_scoring.available():
+            raise ImportError("The numpy scoring backend requires NumPy, install it with `pip install numpy`")
         self.data_file = data_file
-        self.documents: List[Dict[str, Any]] = []  # All stock records
-        self.index: Dict[str, Dict[int, float]] = defaultdict(dict)  # term -> {doc_id: tf-idf}
-        self.doc_frequencies: Dict[str, int] = Counter()  # term -> number of docs containing it
-        self.doc_norms: Dict[int, float] = {}  # doc_id -> L2 norm for cosine similarity
+        # 'python' scores posting by posting with top-k pruning, 'numpy' scores whole posting arrays at once
+        self.scoring_backend: str = scoring_backend
+        # Number of processes `build_index` indexes large batches with
+        self.build_workers: int = build_workers
+        # Index segments ordered by doc_id, only the last one can be an in-memory segment.
+        # The views below read through this list, so it is only ever modified in place.
+        self.segments: List = []
+        self.documents: SegmentDocuments = SegmentDocuments(self.segments)  # All stock records
+        self.index: Mapping[str, PostingList] = SegmentPostings(self.segments)  # term -> postings (doc_id, tf, raw count)
+        self.doc_frequencies: Mapping[str, int] = SegmentDocFrequencies(self.segments)  # term -> number of docs containing it
+        self.doc_norms: array = array('d')  # doc_id -> L2 norm for cosine similarity
+        # BM25 statistics
+        self.doc_lengths: array = array('I')  # doc_id -> number of terms
+        self.total_doc_length: int = 0
+        self.avg_doc_length: float = 0.0
         self.latest_snapshots: Dict[str, int] = {}  # symbol -> latest doc_id
-        # Recency weighting
+        self.latest_index: LatestSnapshotIndex = LatestSnapshotIndex()  # postings of the latest snapshots only
+        # Recency weighting, decay is computed at query time from the snapshot timestamps
         self.half_life_days: float = half_life_days
-        self.recency_weights: Dict[int, float] = {}  # doc_id -> weight in [0,1]
+        self.timestamps: array = array('q')  # doc_id -> epoch seconds, NO_TIMESTAMP if unknown
+        # Incremental updates
+        self.data_offset: int = 0  # Bytes of data_file that have been read
+        self.index_directory: Optional[IndexDirectory] = None
+        self._next_segment: int = 1
+        self._manifest_sequence: int = 0
+        self._flushed_offset: int = 0  # data_offset and latest_snapshots covered by the segment files
+        self._flushed_snapshots: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self._stop_updates = threading.Event()
+        self._updates_thread: Optional[threading.Thread] = None
+        # Search results are cached until the index changes, `generation` counts the changes
+        self.generation: int = 0
+        self.query_cache: QueryCache = QueryCache(query_cache_size)
+        # Doc id range [start, end) a sharded search worker ranks, statistics stay those of the whole index
+        self.shard: Optional[Tuple[int, int]] = None
     
-    def bucket_price(self, price: str) -> str:
-        """
-        Bucket stock price into categories.
-        
-        0 - $10: price_micro
-        10 - $50: price_low
-        50 - $150: price_medium
-        150 - $500: price_high
-        500+: price_very_high
-        """
-        try:
-            value = float(price.replace('$', '').replace(',', ''))
-            if value < 10:
-                return "price_micro"
-            elif value < 50:
-                return "price_low"
-            elif value < 150:
-                return "price_medium"
-            elif value < 500:
-                return "price_high"
-            else:
-                return "price_very_high"
-        except (ValueError, AttributeError):
-            return None
-    
-    def bucket_market_cap(self, market_cap: str) -> str:
-        """
-        Bucket market capitalization into categories.
-        
-        <$50M: cap_nano
-        $50M-300M: cap_micro
-        $300M-2B: cap_small
-        $2B-10B: cap_mid
-        $10B-200B: cap_large
-        $200B+: cap_mega
-        """
-        try:
-            value_str = market_cap.replace('USD', '').replace('$', '').strip()
-
-            if 'B' in value_str:
-                value = float(value_str.replace('B', '').strip()) * 1_000_000_000
-            elif 'M' in value_str:
-                value = float(value_str.replace('M', '').strip()) * 1_000_000
-            else:
-                value = float(value_str)
-            
-            if value < 50_000_000:
-                return "cap_nano"
-            elif value < 300_000_000:
-                return "cap_micro"
-            elif value < 2_000_000_000:
-                return "cap_small"
-            elif value < 10_000_000_000:
-                return "cap_mid"
-            elif value < 200_000_000_000:
-                return "cap_large"
-            else:
-                return "cap_mega"
-        except (ValueError, AttributeError):
-            return None
-    
-    def bucket_price_change(self, change_pct: str) -> str:
-        """
-        Bucket price change percentage into movement categories.
-        
-        <-5%: move_crash
-        -5% to -2%: move_down_strong
-        -2% to -0.5%: move_down_weak
-        -0.5% to 0.5%: move_flat
-        0.5% to 2%: move_up_weak
-        2% to 5%: move_up_strong
-        >5%: move_surge
-        """
-        try:
-            value = float(change_pct.replace('%', '').replace('+', ''))
-            if value < -5:
-                return "move_crash"
-            elif value < -2:
-                return "move_down_strong"
-            elif value < -0.5:
-                return "move_down_weak"
-            elif value <= 0.5:
-                return "move_flat"
-            elif value <= 2:
-                return "move_up_weak"
-            elif value <= 5:
-                return "move_up_strong"
-            else:
-                return "move_surge"
-        except (ValueError, AttributeError):
-            return None
-    
-    def bucket_employees(self, employees: str) -> str:
-        """
-        Bucket employee count into company size categories.
-        
-        <1K: size_tiny
-        1K-10K: size_small
-        10K-50K: size_medium
-        50K-100K: size_large
-        100K+: size_huge
-        """
-        try:
-            value = int(employees.replace(',', ''))
-            if value < 1_000:
-                return "size_tiny"
-            elif value < 10_000:
-                return "size_small"
-            elif value < 50_000:
-                return "size_medium"
-            elif value < 100_000:
-                return "size_large"
-            else:
-                return "size_huge"
-        except (ValueError, AttributeError):
-            return None
-    
-    def bucket_revenue(self, revenue: str) -> str:
-        """
-        Bucket revenue into categories.
-        
-        <$100M: rev_startup
-        $100M-1B: rev_small
-        $1B-10B: rev_medium
-        $10B-50B: rev_large
-        $50B+: rev_huge
-        """
-        try:
-            value_str = revenue.replace('$', '').strip()
-
-            if 'B' in value_str:
-                value = float(value_str.replace('B', '').strip()) * 1_000_000_000
-            elif 'M' in value_str:
-                value = float(value_str.replace('M', '').strip()) * 1_000_000
-            else:
-                value = float(value_str)
-            
-            if value < 100_000_000:
-                return "rev_startup"
-            elif value < 1_000_000_000:
-                return "rev_small"
-            elif value < 10_000_000_000:
-                return "rev_medium"
-            elif value < 50_000_000_000:
-                return "rev_large"
-            else:
-                return "rev_huge"
-        except (ValueError, AttributeError):
-            return None
+    def bucket_column(self, column: str, values: Sequence[float]) -> List[Optional[str]]:
+        """Bucket terms of the values of a numeric column, None for missing values (see NUMERIC_BUCKETS)"""
+        boundaries, terms = NUMERIC_BUCKETS[column]
+        # NaN != NaN, missing values get no term
+        return [terms[bisect_right(boundaries, value)] if value == value else None for value in values]
     
     def extract_year_from_founded(self, founded: str) -> str:
         """
@@ -227,13 +163,32 @@ class StockIndexer:
         - company
         - symbol
         - exchange
-        - current_price
-        - market_cap
-        - calculated_percentage_change
-        - employees
-        - revenue
         - founded
+        - price, market cap, percentage change, employees and revenue (bucketed, see NUMERIC_BUCKETS)
+        """
+        terms = self._text_terms(row)
+        for column in NUMERIC_BUCKETS:
+            bucket = self.bucket_column(column, [numeric_value(row, column)])[0]
+            if bucket:
+                terms.append(bucket)
+        return terms
+    
+    def _extract_batch_terms(self, rows: List[Dict[str, str]]) -> Tuple[List[List[str]], Dict[str, List[float]]]:
+        """
+        Extract the terms of many records, numeric fields are parsed once and bucketed a column at a time.
+        
+        Returns a (terms of every record, numeric column -> values) tuple.
         """
+        numbers = {column: [numeric_value(row, column) for row in rows] for column in NUMERIC_FIELDS}
+        terms = [self._text_terms(row) for row in rows]
+        for column, values in numbers.items():
+            for row_terms, bucket in zip(terms, self.bucket_column(column, values)):
+                if bucket:
+                    row_terms.append(bucket)
+        return terms, numbers
+    
+    def _text_terms(self, row: Dict[str, str]) -> List[str]:
+        """Terms of the company, symbol, exchange and founded fields"""
         terms = []
         
         # Text fields - company name (tokenized)
@@ -250,27 +205,6 @@ class StockIndexer:
         if exchange:
             terms.append(f"exchange_{exchange}")
         
-        # Bucketed numerical fields
-        price_bucket = self.bucket_price(row.get('current_price', ''))
-        if price_bucket:
-            terms.append(price_bucket)
-        
-        cap_bucket = self.bucket_market_cap(row.get('market_cap', ''))
-        if cap_bucket:
-            terms.append(cap_bucket)
-        
-        change_bucket = self.bucket_price_change(row.get('calculated_percentage_change', ''))
-        if change_bucket:
-            terms.append(change_bucket)
-        
-        emp_bucket = self.bucket_employees(row.get('employees', ''))
-        if emp_bucket:
-            terms.append(emp_bucket)
-        
-        rev_bucket = self.bucket_revenue(row.get('revenue', ''))
-        if rev_bucket:
-            terms.append(rev_bucket)
-        
         founded_bucket = self.extract_year_from_founded(row.get('founded', ''))
         if founded_bucket:
             terms.append(founded_bucket)
@@ -285,118 +219,461 @@ class StockIndexer:
         """
         print(f"Loading data from {self.data_file}...")
         
-        with open(self.data_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f, delimiter='\t')
-            
-            for row in reader:
-                doc_id = len(self.documents)
-                self.documents.append(row)
-                
-                # Track latest snapshot per symbol
-                symbol = row.get('symbol', '').strip()
-                timestamp_str = row.get('timestamp', '')
-                
-                if symbol:
-                    try:
-                        timestamp = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
-                        
-                        # Update if this is the latest snapshot
-                        if symbol not in self.latest_snapshots:
-                            self.latest_snapshots[symbol] = doc_id
-                        else:
-                            prev_id = self.latest_snapshots[symbol]
-                            prev_timestamp = datetime.strptime(
-                                self.documents[prev_id].get('timestamp', ''),
-                                '%Y-%m-%d %H:%M:%S'
-                            )
-                            if timestamp > prev_timestamp:
-                                self.latest_snapshots[symbol] = doc_id
-                    except (ValueError, AttributeError):
-                        pass
+        rows, self.data_offset = self._read_rows(0)
+        for row in rows:
+            doc_id = len(self.documents)
+            self.documents.append(row)
+            self._track_latest_snapshot(doc_id, row)
         
         print(f"Loaded {len(self.documents)} records")
         print(f"Found {len(self.latest_snapshots)} unique stocks")
-        # Compute recency weights now that all documents are loaded
-        self._compute_recency_weights()
     
-    def _compute_recency_weights(self):
-        """Compute exponential decay weights for each document based on timestamp.
+    def _read_rows(self, offset: int) -> Tuple[List[Dict[str, str]], int]:
+        """
+        Read the complete rows of the data file that start at or after a byte offset.
         
-        Weight function uses half-life: weight = 0.5 ** (age_days / half_life_days)
-        Documents without a valid timestamp receive weight 1.0.
+        A partially written last line is left for the next read.
+        
+        Returns a (rows, offset after the last complete row) tuple.
         """
-        now = datetime.now()
-        ln2 = math.log(2)
-        for doc_id, doc in enumerate(self.documents):
-            ts_str = doc.get('timestamp', '')
+        with open(self.data_file, 'rb') as f:
+            header = f.readline()
+            fieldnames = next(csv.reader([header.decode('utf-8').rstrip('\r\n')], delimiter='\t'))
+            offset = max(offset, len(header))
+            f.seek(offset)
+            data = f.read()
+        
+        end = data.rfind(b'\n') + 1
+        reader = csv.DictReader(io.StringIO(data[:end].decode('utf-8')), fieldnames=fieldnames, delimiter='\t')
+        return list(reader), offset + end
+    
+    def _track_latest_snapshot(self, doc_id: int, row: Dict[str, str]):
+        """Track latest snapshot per symbol"""
+        symbol = (row.get('symbol') or '').strip()
+        timestamp_str = row.get('timestamp', '')
+        
+        if symbol:
             try:
-                ts = datetime.strptime(ts_str, '%Y-%m-%d %H:%M:%S')
-                age_days = max((now - ts).total_seconds() / 86400.0, 0.0)
-                if self.half_life_days > 0:
-                    weight = math.exp(-ln2 * (age_days / self.half_life_days))
+                timestamp = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
+                
+                # Update if this is the latest snapshot
+                if symbol not in self.latest_snapshots:
+                    self.latest_snapshots[symbol] = doc_id
                 else:
-                    weight = 1.0
-            except Exception:
-                weight = 1.0
-            self.recency_weights[doc_id] = float(max(min(weight, 1.0), 0.0))
+                    prev_id = self.latest_snapshots[symbol]
+                    prev_timestamp = datetime.strptime(
+                        self.documents[prev_id].get('timestamp', ''),
+                        '%Y-%m-%d %H:%M:%S'
+                    )
+                    if timestamp > prev_timestamp:
+                        self.latest_snapshots[symbol] = doc_id
+            except (ValueError, AttributeError, TypeError):
+                pass
+    
+    def _timestamp(self, doc: Dict[str, str]) -> int:
+        """Snapshot time of a document in epoch seconds, NO_TIMESTAMP if it has no valid timestamp"""
+        ts_str = doc.get('timestamp', '')
+        try:
+            return int(datetime.strptime(ts_str, '%Y-%m-%d %H:%M:%S').timestamp())
+        except (ValueError, TypeError, OverflowError, OSError):
+            return NO_TIMESTAMP
+    
+    def recency_weight(self, doc_id: int, now: Optional[float] = None) -> float:
+        """Exponential decay weight of a document at `now` (epoch seconds, defaults to the current time)"""
+        return recency_weight(self.timestamps[doc_id], time.time() if now is None else now, self.half_life_days)
     
-    def build_index(self):
+    def build_index(self, workers: Optional[int] = None):
         """
         Build TF-IDF index from loaded documents.
         
-        Always indexes all records; recency is handled via exponential decay in scoring.
+        Indexes every loaded record that is not indexed yet; recency is handled via exponential decay in scoring.
+        
+        Args:
+            workers: Number of processes to index with, defaults to `build_workers`
         """
         print(f"\nBuilding TF-IDF index (indexing all records)...")
+        workers = workers or self.build_workers
         
-        # Determine which documents to index (all)
-        doc_ids = set(range(len(self.documents)))
-        print(f"Indexing all {len(doc_ids)} records")
-        
-        # Step 1: Compute term frequencies (TF) and document frequencies (DF)
-        term_freqs: Dict[int, Counter] = defaultdict(Counter)
-        # Track how many documents contain each term
-        for doc_id in doc_ids:
-            terms = self.extract_terms(self.documents[doc_id])
-            term_freqs[doc_id] = Counter(terms)
-            
-            # Update document frequency
-            for term in set(terms):
-                self.doc_frequencies[term] += 1
+        with self._lock:
+            rows = self.documents.pending
+            shards = min(workers, len(rows) // MIN_SHARD_DOCS)
+            print(f"Indexing all {len(rows)} records" + (f" with {shards} worker processes" if shards > 1 else ""))
+            self.documents.pending = []
+            self._index_documents(rows, workers)
         
         print(f"Extracted {len(self.doc_frequencies)} unique terms")
+        print(f"Index built successfully!")
+    
+    def _idf(self, term: str) -> float:
+        """Inverse document frequency of a term over all indexed documents"""
+        df = self.doc_frequencies.get(term, 0)
+        return math.log(len(self.doc_norms) / df) if df > 0 else 0
+    
+    def _memory_segment(self) -> MemorySegment:
+        """The in-memory segment new documents are added to"""
+        if self.segments and isinstance(self.segments[-1], MemorySegment):
+            return self.segments[-1]
+        segment = MemorySegment(self.segments[-1].end if self.segments else 0)
+        self.segments.append(segment)
+        return segment
+    
+    def _index_documents(self, rows: List[Dict[str, str]], workers: int = 1):
+        """
+        Index documents after the already indexed ones.
         
-        # Step 2: Compute TF-IDF scores
-        num_docs = len(doc_ids)
+        Postings store the raw term count and the count normalized by the document
+        length, IDF is applied at query time, so existing postings stay valid as the
+        corpus grows. Document frequencies, the document count and the average length
+        are therefore always exact. Norms of the new documents use the current IDF and
+        are recomputed for older documents whenever their segments are merged.
         
-        for doc_id in doc_ids:
-            tf_counter = term_freqs[doc_id]
-            doc_length = sum(tf_counter.values())
+        With more than one worker, batches of at least MIN_SHARD_DOCS documents per
+        worker are indexed in parallel, see `_index_shards`.
+        """
+        shards = min(workers, len(rows) // MIN_SHARD_DOCS)
+        if shards > 1:
+            self._index_shards(rows, shards)
+            return
+        
+        segment = self._memory_segment()
+        
+        # Step 1: Add postings with term frequencies (TF), document frequencies (DF) follow from the posting lists
+        documents = self._prepare_documents(rows)
+        for _, term_counts, timestamp, _ in documents:
+            doc_length = sum(term_counts.values())
+            self.doc_norms.append(0.0)
+            self.doc_lengths.append(doc_length)
+            self.timestamps.append(timestamp)
+            self.total_doc_length += doc_length
+        new_docs, latest = self._add_to_segment(segment, documents, self.latest_snapshots)
+        for symbol, doc_id, term_counts in latest:
+            self.latest_index.add(symbol, doc_id, term_counts)
+        
+        num_docs = len(self.doc_norms)
+        self.avg_doc_length = self.total_doc_length / num_docs if num_docs > 0 else 0.0
+        
+        # Step 2: Compute document norms (L2 norm of the TF-IDF vector for cosine similarity)
+        self._set_norms(segment, new_docs, self._idf)
+        for doc_id, _ in new_docs:
+            self.doc_norms[doc_id] = segment.doc_norms[doc_id - segment.base]
+        
+        if rows:
+            self.generation += 1
+    
+    def _index_shards(self, rows: List[Dict[str, str]], workers: int):
+        """
+        Index documents in parallel worker processes.
+        
+        The rows are split into `workers` consecutive shards. Every worker extracts the
+        terms of its shard into a segment of its own and reports the document
+        frequencies of the shard. Their sum gives the IDF over all documents, which
+        the workers use to compute the norms of their documents. The shard segments
+        are then appended to the in-memory segment in doc id order, so the index is
+        the same as one built by a single process.
+        """
+        segment = self._memory_segment()
+        size = -(-len(rows) // workers)
+        connections = []
+        processes = []
+        for start in range(0, len(rows), size):
+            base = segment.end + start
+            shard_rows = rows[start:start + size]
+            latest_snapshots = {symbol: doc_id for symbol, doc_id in self.latest_snapshots.items()
+                                if base <= doc_id < base + len(shard_rows)}
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_build_shard, daemon=True,
+                                              args=(worker_connection, base, shard_rows, latest_snapshots))
+            process.start()
+            worker_connection.close()
+            connections.append(connection)
+            processes.append(process)
+        
+        try:
+            # Step 1 runs in the workers, the document frequencies of the shards add up to those of the batch
+            doc_frequencies = Counter()
+            for connection in connections:
+                doc_frequencies.update(connection.recv())
             
-            for term, count in tf_counter.items():
-                # TF: normalized term frequency
-                tf = count / doc_length if doc_length > 0 else 0
-                
-                # IDF: inverse document frequency
-                df = self.doc_frequencies[term]
-                idf = math.log(num_docs / df) if df > 0 else 0
-                
-                # TF-IDF score
-                tfidf = tf * idf
-                self.index[term][doc_id] = tfidf
+            # Step 2: Norms are computed by the workers with the IDF over all documents
+            num_docs = len(self.doc_norms) + len(rows)
+            idfs = {term: math.log(num_docs / (df + self.doc_frequencies.get(term, 0)))
+                    for term, df in doc_frequencies.items()}
+            for connection in connections:
+                connection.send(idfs)
+            
+            for connection in connections:
+                shard, latest = connection.recv()
+                self.doc_norms.extend(shard.doc_norms)
+                self.doc_lengths.extend(shard.doc_lengths)
+                self.timestamps.extend(shard.timestamps)
+                self.total_doc_length += sum(shard.doc_lengths)
+                segment.append_segment(shard)
+                for symbol, doc_id, term_counts in latest:
+                    self.latest_index.add(symbol, doc_id, term_counts)
+        except BaseException as error:
+            # Forked workers hold a copy of this end of their connection, so they never see it close
+            # and would wait for the IDF forever
+            for process in processes:
+                process.terminate()
+            if isinstance(error, EOFError):
+                raise RuntimeError("An index build worker exited unexpectedly") from None
+            raise
+        finally:
+            for connection in connections:
+                connection.close()
+            for process in processes:
+                process.join()
+        
+        self.avg_doc_length = self.total_doc_length / len(self.doc_norms)
+        self.generation += 1
+    
+    def _prepare_documents(self, rows: List[Dict[str, str]]) -> List[Tuple[Dict[str, str], Counter, int, Tuple]]:
+        """(record, term counts, timestamp, numeric column values) of every record"""
+        batch_terms, numbers = self._extract_batch_terms(rows)
+        return [(row, Counter(terms), self._timestamp(row), row_numbers)
+                for row, terms, row_numbers in zip(rows, batch_terms, zip(*numbers.values()))]
+    
+    def _add_to_segment(self, segment: MemorySegment, documents: List[Tuple[Dict[str, str], Counter, int, Tuple]],
+                        latest_snapshots: Dict[str, int]) -> Tuple[List[Tuple[int, Counter]], List[Tuple[str, int, Counter]]]:
+        """
+        Add prepared documents and their postings to a segment, their norms are set by `_set_norms`.
         
-        # Step 3: Compute document norms for cosine similarity (L2 norm)
-        for doc_id in doc_ids:
+        Returns a ((doc_id, term counts) of every document, (symbol, doc_id, term counts) of the
+        documents that are the latest snapshot of their symbol) tuple.
+        """
+        new_docs = []
+        latest = []
+        for row, term_counts, timestamp, numbers in documents:
+            doc_id = segment.add_document(row, term_counts, timestamp, numbers)
+            new_docs.append((doc_id, term_counts))
+            
+            # Snapshots were tracked when the rows were loaded
+            symbol = (row.get('symbol') or '').strip()
+            if symbol and latest_snapshots.get(symbol) == doc_id:
+                latest.append((symbol, doc_id, term_counts))
+        return new_docs, latest
+    
+    def _set_norms(self, segment: MemorySegment, new_docs: List[Tuple[int, Counter]], idf: Callable[[str], float]):
+        """Set the L2 norm of the TF-IDF vector of documents added to a segment, `idf` gives the IDF of a term"""
+        idfs = {}
+        for doc_id, term_counts in new_docs:
+            doc_length = sum(term_counts.values())
             norm = 0.0
-            for term in self.index:
-                if doc_id in self.index[term]:
-                    norm += self.index[term][doc_id] ** 2
-            self.doc_norms[doc_id] = math.sqrt(norm)
+            for term, count in term_counts.items():
+                term_idf = idfs.get(term)
+                if term_idf is None:
+                    term_idf = idfs[term] = idf(term)
+                norm += (count / doc_length * term_idf) ** 2
+            segment.set_norm(doc_id, math.sqrt(norm), term_counts)
+    
+    def add_documents(self, rows: List[Dict[str, str]]) -> int:
+        """
+        Index new stock records without rebuilding the index.
         
-        print(f"Index built successfully!")
+        New documents go to an in-memory segment. Once it holds FLUSH_DOCS documents
+        and the index has a directory this process writes to, it is written out as a
+        segment file; segment files are merged by `merge_segments`.
+        
+        Returns the number of documents added.
+        """
+        with self._lock:
+            for row in rows:
+                doc_id = len(self.documents)
+                self.documents.append(row)
+                self._track_latest_snapshot(doc_id, row)
+            pending = self.documents.pending
+            self.documents.pending = []
+            self._index_documents(pending)
+            
+            segment = self.segments[-1] if self.segments else None
+            if (isinstance(segment, MemorySegment) and segment.num_docs >= FLUSH_DOCS
+                    and self.index_directory is not None and self.index_directory.is_writer):
+                self._flush()
+        
+        return len(rows)
     
+    def refresh(self) -> int:
+        """
+        Index the rows appended to the data file since it was last read.
+        
+        An index opened read-only (another process writes the index directory) first
+        switches to the newest segments that process has written.
+        
+        Returns the number of documents added.
+        """
+        with self._lock:
+            read_only = self.index_directory is not None and not self.index_directory.is_writer
+            if read_only:
+                manifest = self.index_directory.read_manifest()
+                if manifest['sequence'] != self._manifest_sequence:
+                    self._open_directory(self.index_directory)
+            
+            if not os.path.exists(self.data_file):
+                return 0
+            size = os.path.getsize(self.data_file)
+            if size == self.data_offset:
+                return 0
+            if size < self.data_offset:
+                if read_only:
+                    # The writing process rebuilds the index, its manifest is picked up on a later refresh
+                    return 0
+                print(f"{self.data_file} was rewritten, rebuilding the index...")
+                self._rebuild()
+                return len(self.doc_norms)
+            
+            rows, self.data_offset = self._read_rows(self.data_offset)
+            return self.add_documents(rows) if rows else 0
+    
+    def _rebuild(self):
+        """Index the data file from scratch"""
+        directory = self.index_directory
+        if directory is not None:
+            directory.release_writer()
+            self.index_directory = None
+        
+        self.segments.clear()
+        self.documents.pending = []
+        self.doc_norms = array('d')
+        self.doc_lengths = array('I')
+        self.timestamps = array('q')
+        self.total_doc_length = 0
+        self.avg_doc_length = 0.0
+        self.latest_snapshots = {}
+        self.latest_index = LatestSnapshotIndex()
+        self.data_offset = 0
+        self.generation += 1
+        
+        self.load_data()
+        self.build_index()
+        if directory is not None:
+            self.save_index(directory.path)
+    
+    def _flush(self):
+        """Write the in-memory segment to a segment file"""
+        segment = self.segments[-1] if self.segments else None
+        if not isinstance(segment, MemorySegment) or segment.num_docs == 0:
+            return
+        
+        filepath = self.index_directory.segment_path(self._next_segment)
+        self._next_segment += 1
+        write_segment(filepath, segment.base, segment.documents(), segment.postings,
+                      segment.doc_norms, segment.doc_lengths, segment.timestamps, segment.bounds)
+        self.segments[-1] = IndexSegment(filepath)
+        
+        self._flushed_offset = self.data_offset
+        self._flushed_snapshots = dict(self.latest_snapshots)
+        self._write_manifest()
+    
+    def _write_manifest(self):
+        self._manifest_sequence += 1
+        segment_files = [os.path.basename(segment.filepath) for segment in self.segments
+                         if isinstance(segment, IndexSegment)]
+        self.index_directory.write_manifest({
+            'sequence': self._manifest_sequence,
+            'segments': segment_files,
+            'next_segment': self._next_segment,
+            'data_file': self.data_file,
+            'data_offset': self._flushed_offset,
+            'latest_snapshots': self._flushed_snapshots,
+            'half_life_days': self.half_life_days,
+        })
+        self.index_directory.remove_unused_segments(segment_files)
+    
+    def _segment_tier(self, num_docs: int) -> int:
+        """Size class of a segment, segments of the same tier are merged together"""
+        return int(math.log(max(num_docs, FLUSH_DOCS) / FLUSH_DOCS, MERGE_FACTOR))
+    
+    def merge_segments(self) -> bool:
+        """
+        Merge the newest MERGE_FACTOR segment files if they are of a similar size.
+        
+        New documents always land in the newest segment, so small segments collect
+        at the end and are merged into progressively larger ones (LSM-style). The
+        merged file is written without holding the index lock, searches keep running
+        against the old segments until the new one is swapped in.
+        
+        Returns True if segments were merged.
+        """
+        with self._lock:
+            if self.index_directory is None or not self.index_directory.is_writer:
+                return False
+            
+            files = [segment for segment in self.segments if isinstance(segment, IndexSegment)]
+            if len(files) < MERGE_FACTOR:
+                return False
+            tier = self._segment_tier(files[-1].num_docs)
+            run = files[-MERGE_FACTOR:]
+            if any(self._segment_tier(segment.num_docs) != tier for segment in run):
+                return False
+            
+            terms = set()
+            for segment in run:
+                terms.update(segment.terms())
+            idfs = {term: self._idf(term) for term in terms}
+            filepath = self.index_directory.segment_path(self._next_segment)
+            self._next_segment += 1
+        
+        merged = write_merged_segment(run, filepath, idfs.__getitem__)
+        
+        with self._lock:
+            position = self.segments.index(run[0])
+            self.segments[position:position + len(run)] = [merged]
+            self.doc_norms[merged.base:merged.end] = array('d', merged.doc_norms)
+            # Norms of the merged documents use the current IDF, so their scores change
+            self.generation += 1
+            self._write_manifest()
+        
+        print(f"Merged {len(run)} segments into {os.path.basename(filepath)} ({merged.num_docs} documents)")
+        return True
+    
+    def start_background_updates(self, interval: float = 2.0, flush: bool = False):
+        """
+        Keep the index up to date on a background thread.
+        
+        Every `interval` seconds the rows appended to the data file are indexed and
+        segment files are merged when needed. With `flush`, the documents held in
+        memory are written to a segment file on every update rather than once there
+        are FLUSH_DOCS of them, so processes that only search the segment files (see
+        sharded_search.py) see new rows within seconds as well.
+        """
+        if self._updates_thread is not None:
+            return
+        
+        def run():
+            while not self._stop_updates.wait(interval):
+                try:
+                    self.refresh()
+                    if flush:
+                        self.flush()
+                    while self.merge_segments():
+                        pass
+                except Exception as e:
+                    print(f"Error updating index: {e}")
+        
+        self._stop_updates.clear()
+        self._updates_thread = threading.Thread(target=run, daemon=True)
+        self._updates_thread.start()
+    
+    def flush(self):
+        """Write the documents held in memory to a segment file, if this process writes the index directory"""
+        with self._lock:
+            if self.index_directory is not None and self.index_directory.is_writer:
+                self._flush()
+    
+    def close(self):
+        """Stop background updates and write documents that are still in memory to disk"""
+        if self._updates_thread is not None:
+            self._stop_updates.set()
+            self._updates_thread.join()
+            self._updates_thread = None
+        
+        with self._lock:
+            if self.index_directory is not None and self.index_directory.is_writer:
+                self._flush()
+                self.index_directory.release_writer()
     
     def search(self, query: str, top_k: int = 10, require_all_terms: bool = True, 
-               ranking_method: str = 'tfidf') -> List[Tuple[int, float, Dict]]:
+               ranking_method: str = 'tfidf', latest_only: bool = False) -> List[Tuple[int, float, Dict]]:
         """
         Search the index using a query string.
         
@@ -404,23 +681,57 @@ class StockIndexer:
         - tfidf: TF-IDF with cosine similarity
         - bm25: BM25 ranking algorithm
         
+        With `latest_only`, only the newest snapshot of every symbol is searched.
+        Scores are the same as in a search over all snapshots.
+        
+        Range predicates in the query (price:100..250, cap:>50B, change:<-3%, see
+        `numeric_index.parse_range`) restrict the results to documents whose values
+        are in every range, whether the terms are combined with AND or OR. A query
+        with only range predicates returns the most recent matching documents.
+        
+        Results are cached in `query_cache` until documents are added or the index changes.
+        
         Returns a list of (doc_id, score, document) tuples, sorted by relevance.
         """
         
+        # Queries with the same terms are scored the same, whatever their order or spelling
+        key = (tuple(sorted(self._query_terms(query))), tuple(self._query_ranges(query)), require_all_terms,
+               ranking_method, top_k, latest_only)
+        generation = self.generation
+        results = self.query_cache.get(key, generation)
+        if results is not None:
+            return list(results)
+        
+        results = self._with_documents(self.rank(query, top_k, require_all_terms, ranking_method, latest_only))
+        self.query_cache.put(key, generation, tuple(results))
+        return results
+    
+    def rank(self, query: str, top_k: int = 10, require_all_terms: bool = True, ranking_method: str = 'tfidf',
+             latest_only: bool = False, now: Optional[float] = None) -> List[Tuple[int, float]]:
+        """
+        Rank the documents of a query like `search`, without the cache and without decoding the documents.
+        
+        Recency weights decay from `now` (epoch seconds, defaults to the current time). If `shard`
+        is set, only the documents in that doc id range are ranked.
+        
+        Returns a list of (doc_id, score) tuples, sorted by relevance.
+        """
+        now = time.time() if now is None else now
         if ranking_method == 'bm25':
-            return self.search_bm25(query, top_k, require_all_terms)
-        else:
-            return self.search_tfidf(query, top_k, require_all_terms)
+            return self._rank_bm25(query, top_k, require_all_terms, latest_only, now)
+        return self._rank_tfidf(query, top_k, require_all_terms, latest_only, now)
     
-    def search_tfidf(self, query: str, top_k: int = 10, require_all_terms: bool = True) -> List[Tuple[int, float, Dict]]:
-        """Search using TF-IDF with cosine similarity (default method)."""
-        # Tokenize query
+    def _query_terms(self, query: str) -> List[str]:
+        """Tokenize a query, special terms (symbol_, exchange_, buckets) are kept as they are"""
         query_terms = []
         
         # Check for special query terms (symbol_, exchange_, ...)
         tokens = query.lower().split()
         for token in tokens:
-            if token.startswith('symbol_') or token.startswith('exchange_'):
+            if parse_range(token) is not None:
+                # Range predicates filter documents, see _query_ranges
+                continue
+            elif token.startswith('symbol_') or token.startswith('exchange_'):
                 query_terms.append(token)
             elif '_' in token and any(token.startswith(prefix) for prefix in 
                 ['price_', 'cap_', 'move_', 'size_', 'rev_', 'founded_']):
@@ -429,20 +740,98 @@ class StockIndexer:
                 # Regular word tokens
                 query_terms.extend(self.tokenize(token))
         
+        return query_terms
+    
+    def _query_ranges(self, query: str) -> List[NumericRange]:
+        """Range predicates of a query"""
+        return [numeric_range for numeric_range in map(parse_range, query.split()) if numeric_range is not None]
+    
+    def _range_doc_ids(self, ranges: List[NumericRange], latest_only: bool) -> array:
+        """
+        Sorted doc ids of the indexed documents in every range.
+        
+        Every range is looked up by binary search in the sorted numeric columns of the
+        segments, so it costs O(log n) plus the number of matching documents.
+        """
+        start, end = self.shard or (0, math.inf)
+        segments = [segment for segment in list(self.segments) if segment.end > start and segment.base < end]
+        matches = [PostingList(array('i', sorted(doc_id for segment in segments
+                                                 for doc_id in segment.numeric_range(numeric_range)
+                                                 if start <= doc_id < end)))
+                   for numeric_range in ranges]
+        if latest_only:
+            matches.append(PostingList(array('i', sorted(doc_id for doc_id in self.latest_index.doc_ids.values()
+                                                         if start <= doc_id < end))))
+        if len(matches) == 1:
+            return matches[0].doc_ids
+        return array('i', (doc_id for doc_id, _ in intersect(matches)))
+    
+    def _postings(self, term: str, latest_only: bool, allowed: Optional[array] = None) -> Optional[PostingList]:
+        """
+        Postings of a term over all snapshots or only the latest ones, None if it has none.
+        
+        With `allowed` (sorted doc ids), only the postings of those documents are returned.
+        """
+        if latest_only:
+            postings = self.latest_index.get_postings(term)
+            if postings is not None and self.shard is not None:
+                postings = doc_range(postings, *self.shard)
+        elif self.shard is not None:
+            postings = SegmentPostings(self.segments, *self.shard).get(term)
+        else:
+            postings = self.index[term] if term in self.doc_frequencies else None
+        if postings is not None and allowed is not None:
+            postings = restrict(postings, allowed)
+        return postings if postings else None
+    
+    def _top_k_in_ranges(self, ranges: List[NumericRange], top_k: int, latest_only: bool,
+                         now: float) -> List[Tuple[int, float]]:
+        """Top documents of a query with only range predicates, scored by their recency weight at `now`"""
+        weights = ((doc_id, self.recency_weight(doc_id, now)) for doc_id in self._range_doc_ids(ranges, latest_only))
+        return heapq.nsmallest(top_k, weights, key=lambda item: (-item[1], item[0]))
+    
+    def _top_k(self, terms: List[QueryTerm], top_k: int, require_all_terms: bool,
+               now: float) -> List[Tuple[int, float]]:
+        """Select the top_k documents with a bounded heap, recency weights at `now` scale every document's score"""
+        timestamps = self.timestamps
+        half_life_days = self.half_life_days
+        
+        def doc_weight(doc_id):
+            return recency_weight(timestamps[doc_id], now, half_life_days)
+        
+        if require_all_terms:
+            return top_k_all(terms, top_k, doc_weight)
+        return top_k_any(terms, top_k, doc_weight)
+    
+    def _with_documents(self, ranked: List[Tuple[int, float]]) -> List[Tuple[int, float, Dict]]:
+        return [(doc_id, score, self.documents[doc_id]) for doc_id, score in ranked]
+    
+    def search_tfidf(self, query: str, top_k: int = 10, require_all_terms: bool = True,
+                     latest_only: bool = False) -> List[Tuple[int, float, Dict]]:
+        """Search using TF-IDF with cosine similarity (default method)."""
+        return self._with_documents(self._rank_tfidf(query, top_k, require_all_terms, latest_only, time.time()))
+    
+    def _rank_tfidf(self, query: str, top_k: int, require_all_terms: bool, latest_only: bool,
+                    now: float) -> List[Tuple[int, float]]:
+        query_terms = self._query_terms(query)
+        ranges = self._query_ranges(query)
         if not query_terms:
-            return []
+            return self._top_k_in_ranges(ranges, top_k, latest_only, now) if ranges else []
         
         # Compute query vector (TF-IDF for query)
         query_tf = Counter(query_terms)
         query_length = len(query_terms)
         query_vector = {}
+        term_idfs = {}
         
-        for term in set(query_terms):
+        # Terms are summed in sorted order, so a query scores every document the same in every process
+        for term in sorted(set(query_terms)):
             if term in self.doc_frequencies:
                 tf = query_tf[term] / query_length
                 df = self.doc_frequencies[term]
                 idf = math.log(len(self.doc_norms) / df) if df > 0 else 0
                 query_vector[term] = tf * idf
+                term_idfs[term] = idf
         
         # Compute query norm
         query_norm = math.sqrt(sum(v ** 2 for v in query_vector.values()))
@@ -450,112 +839,114 @@ class StockIndexer:
         if query_norm == 0:
             return []
         
-        # Score documents using cosine similarity
-        scores = {}
-        doc_term_counts = defaultdict(int)  # Track how many query terms each doc matches
-        
-        for term, query_weight in query_vector.items():
-            if term in self.index:
-                for doc_id, doc_weight in self.index[term].items():
-                    if doc_id not in scores:
-                        scores[doc_id] = 0.0
-                    scores[doc_id] += query_weight * doc_weight
-                    doc_term_counts[doc_id] += 1
-        
-        # Filter documents if require_all_terms is True
-        if require_all_terms:
-            num_query_terms = len(query_vector)
-            scores = {doc_id: score for doc_id, score in scores.items() 
-                     if doc_term_counts[doc_id] == num_query_terms}
-        
-        # Normalize by document norms (cosine similarity)
-        for doc_id in scores:
-            if self.doc_norms[doc_id] > 0:
-                scores[doc_id] /= (query_norm * self.doc_norms[doc_id])
-            # Apply recency weight
-            weight = self.recency_weights.get(doc_id, 1.0)
-            scores[doc_id] *= weight
-        
-        # Sort by score and return top_k
-        ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+        # IDF and norms stay those of all snapshots in a latest-only or range restricted search,
+        # only the postings differ
+        allowed = self._range_doc_ids(ranges, latest_only) if ranges else None
+        term_postings = {}
+        for term in query_vector:
+            postings = self._postings(term, latest_only, allowed)
+            if postings is not None:
+                term_postings[term] = postings
+            elif require_all_terms:
+                return []
+        
+        # Recency decays from the time of the query, so rankings stay current in a long-running process
+        if self.scoring_backend == 'numpy':
+            # Zero-copy views of arrays that are appended to, so updates have to wait until scoring is done
+            with self._lock:
+                terms = [(postings, query_vector[term] * term_idfs[term] / query_norm)
+                         for term, postings in term_postings.items()]
+                return vector_scoring.tfidf_top_k(terms, self.doc_norms, self.timestamps, now, self.half_life_days,
+                                                  top_k, require_all_terms)
+        
+        # Cosine similarity: every term adds query weight * tf * idf / (query norm * doc norm).
+        # The stored bounds of weight / doc norm and of the newest timestamp cap what a term can add to any document.
+        doc_norms = self.doc_norms
+        terms = []
+        for term, postings in term_postings.items():
+            factor = query_vector[term] * term_idfs[term] / query_norm
+            
+            def score(doc_id, position, weights=postings.weights, factor=factor):
+                return normalized_weight(weights[position], doc_norms[doc_id]) * factor
+            
+            # Bounds of the whole index, so terms are ordered the same in every shard
+            bounds = self.index.bounds(term)
+            max_recency = recency_weight(bounds.max_timestamp, now, self.half_life_days)
+            terms.append(QueryTerm(postings, bounds.max_weight * factor * max_recency, score))
         
-        return [(doc_id, score, self.documents[doc_id]) for doc_id, score in ranked]
+        return self._top_k(terms, top_k, require_all_terms, now)
     
-    def search_bm25(self, query: str, top_k: int = 10, require_all_terms: bool = True) -> List[Tuple[int, float, Dict]]:
+    def search_bm25(self, query: str, top_k: int = 10, require_all_terms: bool = True,
+                    latest_only: bool = False) -> List[Tuple[int, float, Dict]]:
         """Search using BM25 ranking algorithm.
         
         BM25 is an improved probabilistic ranking function that addresses term saturation.
         It's better than TF-IDF for handling repeated query terms and document length normalization.
         """
-        # Tokenize query
-        query_terms = []
-        
-        # Check for special query terms (symbol_, exchange_, etc.)
-        tokens = query.lower().split()
-        for token in tokens:
-            if token.startswith('symbol_') or token.startswith('exchange_'):
-                query_terms.append(token)
-            elif '_' in token and any(token.startswith(prefix) for prefix in 
-                ['price_', 'cap_', 'move_', 'size_', 'rev_', 'founded_']):
-                query_terms.append(token)
-            else:
-                # Regular word tokens
-                query_terms.extend(self.tokenize(token))
-        
+        return self._with_documents(self._rank_bm25(query, top_k, require_all_terms, latest_only, time.time()))
+    
+    def _rank_bm25(self, query: str, top_k: int, require_all_terms: bool, latest_only: bool,
+                   now: float) -> List[Tuple[int, float]]:
+        query_terms = self._query_terms(query)
+        ranges = self._query_ranges(query)
         if not query_terms:
-            return []
+            return self._top_k_in_ranges(ranges, top_k, latest_only, now) if ranges else []
         
         # BM25 parameters
         k1 = 1.5  # Term frequency saturation parameter (usually 1.2-2.0)
         b = 0.75  # Length normalization parameter (usually 0.0-1.0)
         
-        # Calculate average document length
-        if not hasattr(self, '_avg_doc_length'):
-            self._avg_doc_length = sum(len(self.extract_terms(doc)) for doc in self.documents) / len(self.documents)
-        
-        # BM25 scoring
-        scores = {}
-        doc_term_counts = defaultdict(int)
-        
-        for term in set(query_terms):
+        # term -> query term count * IDF
+        term_factors = {}
+        for term in sorted(set(query_terms)):
             if term not in self.doc_frequencies:
                 continue
             
             # IDF for BM25 (logarithmic smoothing)
             df = self.doc_frequencies[term]
             idf = math.log((len(self.doc_norms) - df + 0.5) / (df + 0.5) + 1)
-            
-            if term in self.index:
-                term_freq_in_query = query_terms.count(term)
-                
-                for doc_id, tf_weight in self.index[term].items():
-                    if doc_id not in scores:
-                        scores[doc_id] = 0.0
-                    
-                    # Get document length (number of terms)
-                    doc_length = len(self.extract_terms(self.documents[doc_id]))
-                    
-                    # Calculate BM25 score component for this term
-                    numerator = (k1 + 1) * tf_weight
-                    denominator = tf_weight + k1 * (1 - b + b * (doc_length / self._avg_doc_length))
-                    score_component = term_freq_in_query * idf * (numerator / denominator)
-                    
-                    scores[doc_id] += score_component
-                    doc_term_counts[doc_id] += 1
-        
-        # Filter documents if require_all_terms is True
-        if require_all_terms:
-            num_query_terms = len(set(query_terms))
-            scores = {doc_id: score for doc_id, score in scores.items() 
-                     if doc_term_counts[doc_id] == num_query_terms}
+            term_factors[term] = query_terms.count(term) * idf
         
-        # Apply recency weights and sort
-        for doc_id in list(scores.keys()):
-            weight = self.recency_weights.get(doc_id, 1.0)
-            scores[doc_id] *= weight
-        ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+        if require_all_terms and len(term_factors) < len(set(query_terms)):
+            # A query term that isn't indexed can't be matched
+            return []
         
-        return [(doc_id, score, self.documents[doc_id]) for doc_id, score in ranked]
+        allowed = self._range_doc_ids(ranges, latest_only) if ranges else None
+        term_postings = {}
+        for term in term_factors:
+            postings = self._postings(term, latest_only, allowed)
+            if postings is not None:
+                term_postings[term] = postings
+            elif require_all_terms:
+                return []
+        
+        if self.scoring_backend == 'numpy':
+            with self._lock:
+                terms = [(postings, term_factors[term]) for term, postings in term_postings.items()]
+                return vector_scoring.bm25_top_k(terms, self.doc_lengths, self.avg_doc_length, self.timestamps, now,
+                                                 self.half_life_days, top_k, require_all_terms, k1, b)
+        
+        doc_lengths = self.doc_lengths
+        avg_doc_length = self.avg_doc_length
+        terms = []
+        for term, postings in term_postings.items():
+            factor = term_factors[term]
+            
+            def score(doc_id, position, tfs=postings.tfs, factor=factor):
+                tf = tfs[position]
+                # Document length (number of terms) is stored at build time
+                numerator = (k1 + 1) * tf
+                denominator = tf + k1 * (1 - b + b * (doc_lengths[doc_id] / avg_doc_length))
+                return factor * (numerator / denominator)
+            
+            # The component grows with tf and shrinks with the document length
+            bounds = self.index.bounds(term)
+            max_tf = bounds.max_tf
+            upper_bound = factor * ((k1 + 1) * max_tf) / (max_tf + k1 * (1 - b + b * (bounds.min_length / avg_doc_length)))
+            max_recency = recency_weight(bounds.max_timestamp, now, self.half_life_days)
+            terms.append(QueryTerm(postings, upper_bound * max_recency, score))
+        
+        return self._top_k(terms, top_k, require_all_terms, now)
     
     def display_results(self, results: List[Tuple[int, float, Dict]]):
         """Display search results in a readable format."""
@@ -584,51 +975,180 @@ class StockIndexer:
             print(f"   Relevance Score: {score:.4f}")
             print("-" * 100)
     
-    def save_index(self, filepath: str = "indexes/stock_index.pkl"):
-        """Save the index to disk."""
-        print(f"\nSaving index to {filepath}...")
-        
-        index_data = {
-            'documents': self.documents,
-            'index': dict(self.index),
-            'doc_frequencies': dict(self.doc_frequencies),
-            'doc_norms': self.doc_norms,
-            'latest_snapshots': self.latest_snapshots,
-            'data_file': self.data_file,
-            'half_life_days': self.half_life_days,
-            'recency_weights': self.recency_weights
-        }
+    def save_index(self, path: str = "indexes/extracted_data_index"):
+        """
+        Save the index to disk as a directory of memory-mappable segment files.
         
-        Path(filepath).parent.mkdir(parents=True, exist_ok=True)
-        with open(filepath, 'wb') as f:
-            pickle.dump(index_data, f)
+        This process becomes the writer of the directory: documents added later are
+        flushed and merged there, see `add_documents` and `merge_segments`. Saving to
+        the directory the index was loaded from only flushes the in-memory segment.
+        See index_segment.py for the layout.
+        """
+        print(f"\nSaving index to {path}...")
+        
+        with self._lock:
+            directory = self.index_directory
+            if directory is None or os.path.abspath(directory.path) != os.path.abspath(path):
+                directory = IndexDirectory(path)
+                if not directory.acquire_writer():
+                    raise RuntimeError(f"{path} is locked by another process")
+                if directory.exists():
+                    manifest = directory.read_manifest()
+                    self._next_segment = manifest['next_segment']
+                    self._manifest_sequence = manifest['sequence']
+                else:
+                    self._next_segment = 1
+                
+                # Write everything indexed so far as a single segment of the new directory
+                self.documents.pending, pending = [], self.documents.pending
+                self._index_documents(pending)
+                filepath = directory.segment_path(self._next_segment)
+                self._next_segment += 1
+                segment = write_merged_segment(list(self.segments), filepath, self._idf)
+                self.segments[:] = [segment]
+                self.doc_norms = array('d', segment.doc_norms)
+                
+                if self.index_directory is not None:
+                    self.index_directory.release_writer()
+                self.index_directory = directory
+                self._flushed_offset = self.data_offset
+                self._flushed_snapshots = dict(self.latest_snapshots)
+                self._write_manifest()
+            elif directory.is_writer:
+                self._flush()
+            else:
+                raise RuntimeError(f"{path} is locked by another process")
         
         print(f"Index saved successfully!")
     
-    def load_index(self, filepath: str = "data/stock_index.pkl"):
-        """Load a previously saved index from disk."""
-        print(f"Loading index from {filepath}...")
+    def load_index(self, path: str = "indexes/extracted_data_index"):
+        """
+        Load a previously saved index from disk.
         
-        with open(filepath, 'rb') as f:
-            index_data = pickle.load(f)
+        Segment files are memory-mapped: postings, norms and documents are read from
+        the mapping when a query touches them, so loading is near-instant at any size.
+        Rows appended to the data file after the index was saved are indexed right
+        away. If no other process writes the index directory, this one becomes its
+        writer. Older pickled indexes are still read.
+        """
+        print(f"Loading index from {path}...")
+        
+        with self._lock:
+            if os.path.isdir(path):
+                directory = IndexDirectory(path)
+                if not directory.exists():
+                    raise FileNotFoundError(directory.manifest_file)
+                directory.acquire_writer()
+                self._open_directory(directory)
+            else:
+                self._load_pickled_index(path)
         
-        self.documents = index_data['documents']
-        self.index = defaultdict(dict, index_data['index'])
-        self.doc_frequencies = Counter(index_data['doc_frequencies'])
-        self.doc_norms = index_data['doc_norms']
-        self.latest_snapshots = index_data['latest_snapshots']
-        self.data_file = index_data['data_file']
-        self.half_life_days = index_data.get('half_life_days', self.half_life_days)
-        self.recency_weights = index_data.get('recency_weights', {})
-        if not self.recency_weights:
-            # Backfill if loading an old index
-            self._compute_recency_weights()
+        added = self.refresh()
         
         print(f"Index loaded successfully!")
-        print(f"  - {len(self.documents)} documents")
+        print(f"  - {len(self.documents)} documents ({added} added since the index was saved)")
         print(f"  - {len(self.doc_frequencies)} unique terms")
         print(f"  - {len(self.latest_snapshots)} unique stocks")
         print(f"  - half_life_days = {self.half_life_days}")
+        if self.index_directory is not None and not self.index_directory.is_writer:
+            print(f"  - read-only, another process writes {path}")
+    
+    def open_segments(self, path: str = "indexes/extracted_data_index") -> int:
+        """
+        Open the segment files of an index directory read-only, as listed in its current manifest.
+        
+        Unlike `load_index`, rows of the data file the writer of the directory hasn't
+        written to a segment yet are not indexed, so every process that opens the same
+        manifest searches exactly the same documents.
+        
+        Returns the sequence number of the manifest.
+        """
+        directory = IndexDirectory(path)
+        if not directory.exists():
+            raise FileNotFoundError(directory.manifest_file)
+        with self._lock:
+            self._open_directory(directory)
+            return self._manifest_sequence
+    
+    def _open_directory(self, directory: IndexDirectory):
+        """Switch to the segments listed in the manifest of an index directory"""
+        manifest = directory.read_manifest()
+        segments = [IndexSegment(os.path.join(directory.path, name)) for name in manifest['segments']]
+        
+        self.segments[:] = segments
+        self.documents.pending = []
+        self.doc_norms = array('d')
+        self.doc_lengths = array('I')
+        self.timestamps = array('q')
+        for segment in segments:
+            self.doc_norms.frombytes(memoryview(segment.doc_norms).cast('B'))
+            self.doc_lengths.frombytes(memoryview(segment.doc_lengths).cast('B'))
+            self.timestamps.frombytes(memoryview(segment.timestamps).cast('B'))
+        self.total_doc_length = sum(self.doc_lengths)
+        self.avg_doc_length = self.total_doc_length / len(self.doc_lengths) if self.doc_lengths else 0.0
+        
+        self.index_directory = directory
+        self.data_file = manifest['data_file']
+        self.half_life_days = manifest['half_life_days']
+        self.data_offset = self._flushed_offset = manifest['data_offset']
+        self.latest_snapshots = dict(manifest['latest_snapshots'])
+        self._flushed_snapshots = dict(self.latest_snapshots)
+        self._rebuild_latest_index()
+        self._next_segment = manifest['next_segment']
+        self._manifest_sequence = manifest['sequence']
+        self.generation += 1
+    
+    def _rebuild_latest_index(self):
+        """Index the latest snapshots again from the stored documents"""
+        self.latest_index = LatestSnapshotIndex()
+        for symbol, doc_id in sorted(self.latest_snapshots.items(), key=lambda item: item[1]):
+            self.latest_index.add(symbol, doc_id, Counter(self.extract_terms(self.documents[doc_id])))
+    
+    def _load_pickled_index(self, filepath: str):
+        """Load an index saved with pickle by an earlier version."""
+        with open(filepath, 'rb') as f:
+            index_data = pickle.load(f)
+        
+        documents = list(index_data['documents'])
+        self.segments.clear()
+        self.documents.pending = []
+        self.latest_snapshots = index_data['latest_snapshots']
+        self.latest_index = LatestSnapshotIndex()
+        self.data_file = index_data['data_file']
+        self.half_life_days = index_data.get('half_life_days', self.half_life_days)
+        # Pickles don't record how much of the data file they cover, assume all of it
+        self.data_offset = os.path.getsize(self.data_file) if os.path.exists(self.data_file) else 0
+        if self.index_directory is not None:
+            self.index_directory.release_writer()
+            self.index_directory = None
+        
+        if index_data.get('format_version') == INDEX_FORMAT_VERSION:
+            segment = MemorySegment(0)
+            segment._documents.extend(documents)
+            segment.postings = defaultdict(PostingList, {
+                term: PostingList.decode(data) for term, data in index_data['index'].items()
+            })
+            segment.doc_norms = index_data['doc_norms']
+            segment.doc_lengths = index_data['doc_lengths']
+            segment.timestamps = index_data['timestamps']
+            segment.rebuild_bounds()
+            self.segments.append(segment)
+            self.doc_norms = array('d', segment.doc_norms)
+            self.doc_lengths = array('I', segment.doc_lengths)
+            self.timestamps = array('q', segment.timestamps)
+            self.total_doc_length = sum(self.doc_lengths)
+            self.avg_doc_length = index_data['avg_doc_length']
+            self._rebuild_latest_index()
+            self.generation += 1
+        else:
+            # Older layouts are rebuilt from the stored documents
+            print("Index uses an older format, rebuilding postings...")
+            self.doc_norms = array('d')
+            self.doc_lengths = array('I')
+            self.timestamps = array('q')
+            self.total_doc_length = 0
+            self.documents.pending = documents
+            self.build_index()
     
     # ==================== STATISTICS ====================
     
@@ -641,9 +1161,31 @@ class StockIndexer:
         print(f"Indexed documents: {len(self.doc_norms)}")
         print(f"Unique stocks: {len(self.latest_snapshots)}")
         print(f"Unique terms: {len(self.doc_frequencies)}")
+        cache = self.query_cache.stats()
+        print(f"Query cache: {cache['entries']} entries, {cache['hits']} hits, {cache['misses']} misses "
+              f"({cache['hit_rate']:.0%} hit rate)")
         print(f"\nTop 20 most common terms:")
         
-        for term, count in self.doc_frequencies.most_common(20):
+        for term, count in heapq.nlargest(20, self.doc_frequencies.items(), key=lambda item: item[1]):
             print(f"  {term}: {count} documents")
         
         print("\n" + "=" * 100)
+
+
+def _build_shard(connection, base: int, rows: List[Dict[str, str]], latest_snapshots: Dict[str, int]):
+    """
+    Index a shard of a parallel build in a worker process, see `StockIndexer._index_shards`
+    
+    Sends the document frequencies of the shard, waits for the IDF of every term
+    over all documents, and sends back the segment with its norms set together with
+    the latest snapshots it holds.
+    """
+    indexer = StockIndexer()
+    segment = MemorySegment(base)
+    new_docs, latest = indexer._add_to_segment(segment, indexer._prepare_documents(rows), latest_snapshots)
+    connection.send({term: len(postings) for term, postings in segment.postings.items()})
+    
+    idfs = connection.recv()
+    indexer._set_norms(segment, new_docs, idfs.__getitem__)
+    connection.send((segment, latest))
+    connection.close()
@@ -0,0 +1,60 @@
+import math
+from typing import Dict, Optional
+
+# Numeric column of the extracted data TSV -> formatted column its value is parsed from
+NUMERIC_FIELDS = {
+    "price_value": "current_price",
+    "change_pct_value": "calculated_percentage_change",
+    "market_cap_value": "market_cap",
+    "revenue_value": "revenue",
+    "employees_value": "employees",
+}
+
+_SCALES = {"T": 1e12, "B": 1e9, "M": 1e6, "K": 1e3}
+# Currency sign, separators, percent sign and spaces around the digits, deleted in a single pass
+_DECORATIONS = str.maketrans('', '', '$,% ')
+
+
+def parse_number(text: Optional[str]) -> float:
+    """
+    Parse a formatted amount like '$1,234.50', '+2.31%', '12.5B USD' or '3.4M'
+
+    Returns NaN if the text is empty or not a number.
+    """
+    if not text:
+        return math.nan
+    # Only the whole currency code is removed, stray letters leave the text unparseable
+    value = text.replace('USD', '').translate(_DECORATIONS)
+    scale = _SCALES.get(value[-1:].upper())
+    if scale is not None:
+        value = value[:-1]
+    try:
+        return float(value) * (scale or 1)
+    except ValueError:
+        return math.nan
+
+
+def format_number(value: float) -> str:
+    """Text of a numeric column, empty for a missing value; 15 digits parse back to the same text"""
+    return "" if math.isnan(value) else f"{value:.15g}"
+
+
+def numeric_fields(row: Dict[str, str]) -> Dict[str, str]:
+    """Numeric columns of an extracted row, parsed from its formatted columns"""
+    return {column: format_number(parse_number(row.get(source))) for column, source in NUMERIC_FIELDS.items()}
+
+
+def numeric_value(row: Dict[str, str], column: str) -> float:
+    """
+    Value of a numeric column of a row, NaN if it is missing
+
+    Rows of data files written before the extractor added the numeric columns
+    are parsed from the formatted column instead.
+    """
+    text = row.get(column)
+    if text is None:
+        return parse_number(row.get(NUMERIC_FIELDS[column]))
+    try:
+        return float(text) if text else math.nan
+    except ValueError:
+        return math.nan
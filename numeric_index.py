@@ -0,0 +1,110 @@
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from numeric_fields import parse_number
+
+# Field of a range predicate in a query -> numeric column
+RANGE_FIELDS = {
+    "price": "price_value",
+    "cap": "market_cap_value",
+    "change": "change_pct_value",
+    "revenue": "revenue_value",
+    "employees": "employees_value",
+}
+
+# Documents added to a sorted column since it was last sorted are scanned until there are this many
+MAX_UNSORTED = 1_024
+
+
+class NumericRange(NamedTuple):
+    """Range predicate over a numeric column"""
+    column: str
+    low: float = -math.inf
+    high: float = math.inf
+    include_low: bool = True
+    include_high: bool = True
+
+    def __contains__(self, value: float) -> bool:
+        # NaN (a missing value) compares false and is never in a range
+        return ((self.low < value or (self.include_low and self.low == value)) and
+                (value < self.high or (self.include_high and value == self.high)))
+
+    def positions(self, sorted_values: Sequence[float]) -> Tuple[int, int]:
+        """(start, end) positions of the values in the range within ascending `sorted_values`"""
+        start = (bisect_left if self.include_low else bisect_right)(sorted_values, self.low)
+        end = (bisect_right if self.include_high else bisect_left)(sorted_values, self.high)
+        return start, max(start, end)
+
+
+def parse_range(token: str) -> Optional[NumericRange]:
+    """
+    Parse a range predicate: field:low..high (either end may be left out),
+    field:>x, field:>=x, field:<x, field:<=x or field:x, e.g. 'price:100..250',
+    'cap:>50B' or 'change:<-3%'
+
+    Returns None if the token isn't one.
+    """
+    field, separator, spec = token.partition(':')
+    column = RANGE_FIELDS.get(field.lower())
+    if column is None or not separator or not spec:
+        return None
+
+    if '..' in spec:
+        low_text, high_text = spec.split('..', 1)
+        low = parse_number(low_text) if low_text else -math.inf
+        high = parse_number(high_text) if high_text else math.inf
+        if math.isnan(low) or math.isnan(high):
+            return None
+        return NumericRange(column, low, high)
+
+    op = next((op for op in ('>=', '<=', '>', '<', '=') if spec.startswith(op)), '')
+    value = parse_number(spec[len(op):])
+    if math.isnan(value):
+        return None
+    if op in ('', '='):
+        return NumericRange(column, value, value)
+    if op[0] == '>':
+        return NumericRange(column, low=value, include_low=op == '>=')
+    return NumericRange(column, high=value, include_high=op == '<=')
+
+
+def sort_column(values: Sequence[float], base: int) -> Tuple[array, array]:
+    """
+    Sort the values of a numeric column, missing (NaN) values are left out
+
+    Returns:
+        (values in ascending order, doc id of every value) tuple, ties are ordered by doc id
+    """
+    order = sorted((i for i, value in enumerate(values) if value == value), key=values.__getitem__)
+    return array('d', (values[i] for i in order)), array('i', (base + i for i in order))
+
+
+class SortedColumn:
+    """
+    Sorted view of a numeric column that is still being appended to
+
+    Values appended since the column was last sorted are scanned, the column is
+    sorted again once there are more of them than MAX_UNSORTED.
+    """
+
+    def __init__(self, values: Sequence[float], base: int):
+        self.values = values
+        self.base = base
+        self._sorted: Tuple[array, array, int] = (array('d'), array('i'), 0)  # values, doc ids, number of values
+
+    def range(self, numeric_range: NumericRange) -> List[int]:
+        """Doc ids of the values in a range, in no particular order"""
+        sorted_values, doc_ids, count = self._sorted
+        if len(self.values) - count > MAX_UNSORTED:
+            count = len(self.values)
+            sorted_values, doc_ids = sort_column(self.values[:count], self.base)
+            self._sorted = (sorted_values, doc_ids, count)
+
+        start, end = numeric_range.positions(sorted_values)
+        matches = doc_ids[start:end].tolist()
+        for i in range(count, len(self.values)):
+            if self.values[i] in numeric_range:
+                matches.append(self.base + i)
+        return matches
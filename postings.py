@@ -0,0 +1,203 @@
+import sys
+from array import array
+from bisect import bisect_left
+from typing import Iterator, List, Sequence, Tuple
+
+
+class PostingList:
+    """
+    Postings of a single term, stored as parallel arrays sorted by doc_id.
+
+    `doc_ids` are int32, `weights` (term count / document length) are float32 and
+    `tfs` (raw term counts) are uint32, so a posting costs 12 bytes instead of the
+    boxed ints, floats and hash-table slots of a `{doc_id: weight}` dict.
+    """
+
+    __slots__ = ("doc_ids", "weights", "tfs")
+
+    def __init__(self, doc_ids: array = None, weights: array = None, tfs: array = None):
+        self.doc_ids = doc_ids if doc_ids is not None else array('i')
+        self.weights = weights if weights is not None else array('f')
+        self.tfs = tfs if tfs is not None else array('I')
+
+    def append(self, doc_id: int, weight: float, tf: int):
+        """Add a posting, doc ids have to be appended in increasing order"""
+        self.doc_ids.append(doc_id)
+        self.weights.append(weight)
+        self.tfs.append(tf)
+
+    def find(self, doc_id: int) -> int:
+        """Position of `doc_id` in the list, or -1 if the term doesn't occur in the document"""
+        position = bisect_left(self.doc_ids, doc_id)
+        if position < len(self.doc_ids) and self.doc_ids[position] == doc_id:
+            return position
+        return -1
+
+    def __iter__(self) -> Iterator[Tuple[int, float, int]]:
+        """Iterate over (doc_id, weight, tf) tuples"""
+        return zip(self.doc_ids, self.weights, self.tfs)
+
+    def __contains__(self, doc_id: int) -> bool:
+        return self.find(doc_id) >= 0
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def nbytes(self) -> int:
+        """Memory used by the posting data, excluding the fixed object overhead"""
+        return sum(values.itemsize * len(values) for values in (self.doc_ids, self.weights, self.tfs))
+
+    @classmethod
+    def concat(cls, posting_lists: List["PostingList"]) -> "PostingList":
+        """
+        Join posting lists that cover consecutive doc id ranges into one list
+
+        The arrays are copied with `frombytes`, so this works on arrays and on
+        memoryviews into a segment file alike.
+        """
+        result = cls()
+        for postings in posting_lists:
+            result.doc_ids.frombytes(memoryview(postings.doc_ids).cast('B'))
+            result.weights.frombytes(memoryview(postings.weights).cast('B'))
+            result.tfs.frombytes(memoryview(postings.tfs).cast('B'))
+        return result
+
+    def encode(self) -> bytes:
+        """
+        Serialize the list for storage on disk
+
+        Layout: varint count, varint doc id gaps, varint term counts, then the
+        weights as little-endian float32.
+        """
+        out = bytearray()
+        encode_varint(len(self.doc_ids), out)
+        previous = 0
+        for doc_id in self.doc_ids:
+            encode_varint(doc_id - previous, out)
+            previous = doc_id
+        for tf in self.tfs:
+            encode_varint(tf, out)
+
+        weights = self.weights
+        if sys.byteorder != 'little':
+            weights = array('f', weights)
+            weights.byteswap()
+        out += weights.tobytes()
+        return bytes(out)
+
+    @classmethod
+    def decode(cls, data: bytes) -> "PostingList":
+        """Read a list written by `encode`"""
+        count, offset = decode_varint(data, 0)
+
+        doc_ids = array('i')
+        previous = 0
+        for _ in range(count):
+            gap, offset = decode_varint(data, offset)
+            previous += gap
+            doc_ids.append(previous)
+
+        tfs = array('I')
+        for _ in range(count):
+            tf, offset = decode_varint(data, offset)
+            tfs.append(tf)
+
+        weights = array('f')
+        weights.frombytes(data[offset:offset + 4 * count])
+        if sys.byteorder != 'little':
+            weights.byteswap()
+
+        return cls(doc_ids, weights, tfs)
+
+
+def gallop(doc_ids: Sequence[int], target: int, start: int = 0) -> int:
+    """
+    First position at or after `start` whose doc id is >= `target`
+
+    Probes 1, 2, 4, ... entries ahead before binary searching the last step, so
+    skipping k entries costs O(log k) instead of O(log n) or O(k).
+    """
+    length = len(doc_ids)
+    high = start
+    step = 1
+    while high < length and doc_ids[high] < target:
+        start = high + 1
+        high += step
+        step *= 2
+    return bisect_left(doc_ids, target, start, min(high, length))
+
+
+def intersect(posting_lists: List[PostingList]) -> Iterator[Tuple[int, Tuple[int, ...]]]:
+    """
+    Documents that occur in every posting list, in doc_id order
+
+    The shortest list proposes candidates and the others gallop forward to them;
+    a miss moves the candidate to the next doc id found, so long lists are skipped
+    through rather than scanned.
+
+    Yields:
+        (doc_id, positions) tuples, positions[i] is the document's index in posting_lists[i]
+    """
+    if not posting_lists:
+        return
+    doc_ids = [postings.doc_ids for postings in posting_lists]
+    order = sorted(range(len(doc_ids)), key=lambda i: len(doc_ids[i]))
+    lead, others = order[0], order[1:]
+    positions = [0] * len(doc_ids)
+
+    while positions[lead] < len(doc_ids[lead]):
+        target = doc_ids[lead][positions[lead]]
+        for i in others:
+            position = gallop(doc_ids[i], target, positions[i])
+            positions[i] = position
+            if position == len(doc_ids[i]):
+                return
+            if doc_ids[i][position] != target:
+                # Skip the lead list ahead to the next document that list has
+                positions[lead] = gallop(doc_ids[lead], doc_ids[i][position], positions[lead])
+                break
+        else:
+            yield target, tuple(positions)
+            positions[lead] += 1
+
+
+def restrict(postings: PostingList, doc_ids: Sequence[int]) -> PostingList:
+    """Postings of the documents in `doc_ids` (sorted), found with `intersect`"""
+    result = PostingList()
+    for doc_id, positions in intersect([postings, PostingList(doc_ids)]):
+        position = positions[0]
+        result.append(doc_id, postings.weights[position], postings.tfs[position])
+    return result
+
+
+def doc_range(postings: PostingList, start: int, end: int) -> PostingList:
+    """Postings of the doc ids in [start, end), zero-copy if the list is a view into a segment file"""
+    low = bisect_left(postings.doc_ids, start)
+    high = bisect_left(postings.doc_ids, end, low)
+    return PostingList(postings.doc_ids[low:high], postings.weights[low:high], postings.tfs[low:high])
+
+
+def encode_varint(value: int, out: bytearray):
+    """Append a non-negative integer as a LEB128 varint (7 bits per byte)"""
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(data: bytes, offset: int) -> Tuple[int, int]:
+    """
+    Read a varint written by `encode_varint`
+
+    Returns:
+        (value, offset of the next byte) tuple
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
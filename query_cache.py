@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class QueryCache:
+    """
+    Bounded LRU cache of search results.
+
+    Entries are tagged with the index generation they were computed at. The
+    indexer bumps its generation whenever documents are added or the index is
+    reloaded, and the first lookup at a newer generation drops every entry.
+
+    Recency weights decay from the time of the query, so scores of a cached
+    result slowly drift from those of a fresh search. Entries older than
+    `max_age` seconds are treated as missing.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_age: float = 60.0):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (time, result)
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _check_generation(self, generation: int):
+        if generation > self._generation:
+            if self._entries:
+                self._entries.clear()
+                self.invalidations += 1
+            self._generation = generation
+
+    def get(self, key: Hashable, generation: int) -> Optional[Any]:
+        """Cached result for `key`, None if it isn't cached at `generation`"""
+        with self._lock:
+            self._check_generation(generation)
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.max_age:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, generation: int, result: Any):
+        """Cache a result computed at `generation`, results of an older generation are dropped"""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._check_generation(generation)
+            if generation < self._generation:
+                return
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
@@ -0,0 +1,166 @@
+import heapq
+import math
+from bisect import bisect_left
+from typing import Callable, List, NamedTuple, Tuple
+
+from postings import PostingList, intersect
+
+# Bounds are stored as float32 and summed in a different order than the scores,
+# so they are inflated slightly to never prune a document that belongs in the top k
+BOUND_SLACK = 1 + 1e-6
+
+
+def recency_weight(timestamp: int, now: float, half_life_days: float) -> float:
+    """
+    Exponential decay weight of a document with the given epoch timestamp
+
+    Weight function uses half-life: weight = 0.5 ** (age_days / half_life_days).
+    Documents from the future or without a timestamp (NO_TIMESTAMP) receive weight 1.0.
+    """
+    if half_life_days <= 0:
+        return 1.0
+    age_days = max(now - timestamp, 0) / 86400.0
+    return math.exp(-math.log(2) * (age_days / half_life_days))
+
+
+class QueryTerm(NamedTuple):
+    """A query term prepared for scoring"""
+    postings: PostingList
+    upper_bound: float                  # highest contribution * doc weight the term can add to a document
+    score: Callable[[int, int], float]  # (doc_id, position in postings) -> contribution
+
+
+class TopK:
+    """
+    Bounded min-heap of the best `k` (doc_id, score) pairs seen so far.
+
+    Documents have to be offered in increasing doc_id order: ties keep the
+    document that was offered first, so a later one only gets in with a strictly
+    higher score than `threshold`.
+    """
+
+    def __init__(self, k: int):
+        self.k = k
+        self._heap: List[Tuple[float, int]] = []  # (score, -doc_id)
+
+    @property
+    def threshold(self) -> float:
+        """Score a document has to beat to get in, -1 until the heap is full"""
+        return self._heap[0][0] if len(self._heap) >= self.k else -1.0
+
+    def offer(self, doc_id: int, score: float):
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, (score, -doc_id))
+        elif score > self._heap[0][0]:
+            heapq.heapreplace(self._heap, (score, -doc_id))
+
+    def results(self) -> List[Tuple[int, float]]:
+        """(doc_id, score) pairs sorted by score, ties by doc_id"""
+        return [(-neg_doc_id, score) for score, neg_doc_id in sorted(self._heap, key=lambda e: (-e[0], -e[1]))]
+
+
+def top_k_any(terms: List[QueryTerm], k: int, doc_weight: Callable[[int], float]) -> List[Tuple[int, float]]:
+    """
+    Top k documents matching any of the terms, scored by sum(contributions) * doc_weight(doc_id)
+
+    Uses MaxScore dynamic pruning: terms are ordered by upper bound, and once the
+    bounds of the weakest terms together can't lift a document past the current
+    k-th score, those terms stop producing candidates and are only probed for
+    documents found through the others. Probing stops as soon as the remaining
+    bounds can't reach the threshold.
+    """
+    if k <= 0 or not terms:
+        return []
+
+    terms = sorted(terms, key=lambda term: term.upper_bound)
+    doc_ids = [term.postings.doc_ids for term in terms]
+    lengths = [len(ids) for ids in doc_ids]
+    positions = [0] * len(terms)
+    # prefix_bounds[i]: sum of the bounds of terms[:i]
+    prefix_bounds = [0.0]
+    for term in terms:
+        prefix_bounds.append(prefix_bounds[-1] + term.upper_bound * BOUND_SLACK)
+
+    top = TopK(k)
+    threshold = top.threshold
+    first_essential = 0  # terms[:first_essential] can't make a document reach the threshold on their own
+
+    while True:
+        doc_id = None
+        for i in range(first_essential, len(terms)):
+            if positions[i] < lengths[i]:
+                candidate = doc_ids[i][positions[i]]
+                if doc_id is None or candidate < doc_id:
+                    doc_id = candidate
+        if doc_id is None:
+            break
+
+        score = 0.0
+        contributions = []
+        for i in range(first_essential, len(terms)):
+            position = positions[i]
+            if position < lengths[i] and doc_ids[i][position] == doc_id:
+                contribution = terms[i].score(doc_id, position)
+                score += contribution
+                contributions.append(contribution)
+                positions[i] = position + 1
+
+        weight = doc_weight(doc_id)
+        pruned = False
+        for i in range(first_essential - 1, -1, -1):
+            if weight * score + prefix_bounds[i + 1] <= threshold:
+                pruned = True
+                break
+            position = bisect_left(doc_ids[i], doc_id, positions[i])
+            positions[i] = position
+            if position < lengths[i] and doc_ids[i][position] == doc_id:
+                contribution = terms[i].score(doc_id, position)
+                score += contribution
+                contributions.append(contribution)
+        if pruned:
+            continue
+
+        # The order terms are added in depends on the threshold at the time, the exactly rounded sum
+        # gives a document the same score whatever the other documents are, e.g. in every search shard
+        top.offer(doc_id, math.fsum(contributions) * weight)
+        if top.threshold != threshold:
+            threshold = top.threshold
+            while first_essential < len(terms) and prefix_bounds[first_essential + 1] <= threshold:
+                first_essential += 1
+
+    return top.results()
+
+
+def top_k_all(terms: List[QueryTerm], k: int, doc_weight: Callable[[int], float]) -> List[Tuple[int, float]]:
+    """
+    Top k documents matching all of the terms, scored like `top_k_any`
+
+    Only documents in the intersection of the posting lists are scored. Terms are
+    added from the highest bound down and a document is dropped as soon as the
+    bounds of the terms left can't lift it past the k-th score; once the sum of
+    all bounds can't, the search stops.
+    """
+    if k <= 0 or not terms:
+        return []
+
+    terms = sorted(terms, key=lambda term: term.upper_bound, reverse=True)
+    # remaining_bounds[i]: sum of the bounds of terms[i:]
+    remaining_bounds = [0.0] * (len(terms) + 1)
+    for i in range(len(terms) - 1, -1, -1):
+        remaining_bounds[i] = remaining_bounds[i + 1] + terms[i].upper_bound * BOUND_SLACK
+
+    top = TopK(k)
+    for doc_id, positions in intersect([term.postings for term in terms]):
+        threshold = top.threshold
+        if remaining_bounds[0] <= threshold:
+            break
+        weight = doc_weight(doc_id)
+        score = 0.0
+        for i, term in enumerate(terms):
+            if weight * score + remaining_bounds[i] <= threshold:
+                break
+            score += term.score(doc_id, positions[i])
+        else:
+            top.offer(doc_id, score * weight)
+
+    return top.results()
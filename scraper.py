@@ -1,11 +1,17 @@
 import requests
-import time
 import random
 import os
 import re
 import json
 import threading
-from extractor import process_html_file, StockDataExtractor
+import argparse
+import functools
+import time
+from extractor import process_html_file, process_html_content, StockDataExtractor
+from frontier import get_frontier, URLFrontier
+from archive import get_archive, AsyncArchiveWriter
+from extraction_queue import get_extraction_queue
+from downloader import ConcurrentDownloader, SessionPool
 from datetime import datetime
 from typing import List, Dict, Optional
 
@@ -17,61 +23,102 @@ DATA_DIR = "data"
 # If disabled, the scraper will download only the URLs in the stack, and will not add any new URLs to the stacks
 ADD_EXTRACTED_URLS_TO_STACK = False
 
+# Number of parallel downloads and the politeness budget for a single host (requests per second)
+DEFAULT_CONCURRENCY = 4
+DEFAULT_HOST_RATE = 0.5
+
+# A page that can't be archived this many times is given up on and recorded as a failure
+MAX_SAVE_ATTEMPTS = 3
+
 WEB_PAGE_METADATA_FILE = f"{DATA_DIR}/web-page-metadata.tsv"
 EXTRACTED_DATA_FILE = f"{DATA_DIR}/extracted_data.tsv"
 
+# The URL stack is kept in a SQLite frontier (web-url-stack.db) seeded from this file on first run
 URL_STACK_FILE = f"{QUEUES_DIR}/web-url-stack.txt"
+# Journal of pages queued for extraction, replayed after a crash
 PAGE_EXTRACTION_STACK_FILE = f"{QUEUES_DIR}/page-extraction-stack.txt"
 
 WEB_PAGE_METADATA_HEADER = "url\tfile_path\ttimestamp\tstatus\n"
 EXTRACTED_DATA_HEADER = "company\tsymbol\texchange\tsource_file\ttimestamp\tcurrent_price\tprevious_close\tcalculated_percentage_change\tcalculated_difference\tmarket_cap\tfounded\temployees\trevenue\tebitda\n"
 
+# Cookies that skip the Google consent page
+CONSENT_COOKIES = {
+    'CONSENT': 'YES+cb.20210328-17-p0.en+FX+667',
+    'SOCS': 'CAI',
+    'NID': '511=example_value'
+}
+
+# Serializes appends to the shared TSV and queue files between downloader threads
+file_write_lock = threading.Lock()
+
 # https://www.google.com/finance/quote/NVDA:NASDAQ
 
+def get_url_frontier(stack_file: str = URL_STACK_FILE) -> URLFrontier:
+    """Get the frontier behind the URL stack, seen URLs are seeded from the page metadata file"""
+    return get_frontier(stack_file, seen_seed_file=WEB_PAGE_METADATA_FILE)
+
+
 def read_and_remove_last_url(stack_file: str = URL_STACK_FILE) -> Optional[str]:
     """
-    Read the last URL from the stack file and remove it
+    Read the last URL from the stack and lease it for processing
+    
+    The URL stays in the frontier until `mark_url_done` is called, so a crash
+    before that point puts it back on the stack on the next run.
     
     Args:
         stack_file: Path to the URL stack file
     
     Returns:
-        The last URL from the file, or None if file is empty or doesn't exist
+        The last URL from the stack, or None if the stack is empty
     """
-    if not os.path.exists(stack_file):
-        print(f"URL stack file not found: {stack_file}")
-        return None
-    
     try:
-        # Read all URLs from the file
-        with open(stack_file, 'r', encoding='utf-8') as f:
-            urls = [line.strip() for line in f.readlines() if line.strip()]
+        url = get_url_frontier(stack_file).pop()
         
-        if not urls:
-            print(f"URL stack file is empty: {stack_file}")
-            return None
+        if url is None:
+            print(f"URL stack is empty: {stack_file}")
         
-        # Get the last URL
-        last_url = urls[-1]
-        
-        # Remove the last URL from the list
-        remaining_urls = urls[:-1]
-        
-        # Write remaining URLs back to file
-        with open(stack_file, 'w', encoding='utf-8') as f:
-            for url in remaining_urls:
-                f.write(url + '\n')
-                
-        return last_url
+        return url
         
     except Exception as e:
         print(f"Error reading URL from stack: {e}")
         return None
 
 
+def mark_url_done(url: str, stack_file: str = URL_STACK_FILE):
+    """
+    Remove a URL returned by `read_and_remove_last_url` from the stack for good
+    
+    Args:
+        url: The processed URL
+        stack_file: Path to the URL stack file
+    """
+    try:
+        get_url_frontier(stack_file).complete(url)
+    except Exception as e:
+        print(f"Error removing URL from stack: {e}")
+
+
+def release_url(url: str, stack_file: str = URL_STACK_FILE) -> int:
+    """
+    Put a URL returned by `read_and_remove_last_url` back at the bottom of the stack, to be downloaded again
+    
+    Args:
+        url: The URL that couldn't be processed
+        stack_file: Path to the URL stack file
+    
+    Returns:
+        Number of times the URL was put back so far, 0 if it couldn't be put back
+    """
+    try:
+        return get_url_frontier(stack_file).release(url)
+    except Exception as e:
+        print(f"Error returning URL to stack: {e}")
+        return 0
+
+
 def add_urls_to_stack(urls: List[str], stack_file: str = URL_STACK_FILE) -> bool:
     """
-    Add new URLs to the stack file
+    Add new URLs to the stack
     
     Args:
         urls: List of URLs to add
@@ -81,10 +128,7 @@ def add_urls_to_stack(urls: List[str], stack_file: str = URL_STACK_FILE) -> bool
         True if successful, False otherwise
     """
     try:
-        with open(stack_file, 'a', encoding='utf-8') as f:
-            for url in urls:
-                f.write(url + '\n')
-        
+        get_url_frontier(stack_file).push(urls)
         return True
         
     except Exception as e:
@@ -92,20 +136,22 @@ def add_urls_to_stack(urls: List[str], stack_file: str = URL_STACK_FILE) -> bool
         return False
 
 
-def add_html_to_extraction_stack(html_filepath: str, extraction_stack_file: str = PAGE_EXTRACTION_STACK_FILE) -> bool:
+def add_html_to_extraction_stack(html_filepath: str, extraction_stack_file: str = PAGE_EXTRACTION_STACK_FILE,
+                                  html_content: Optional[str] = None, archived: bool = True) -> bool:
     """
-    Add HTML file path to the extraction stack for processing by the extractor
+    Add HTML file path to the extraction queue for processing by the extractor
     
     Args:
-        html_filepath: Path to the HTML file to add to extraction stack
-        extraction_stack_file: Path to the extraction stack file
+        html_filepath: Path to the HTML file to add to extraction queue
+        extraction_stack_file: Path to the extraction queue journal
+        html_content: The downloaded page, handed to the extractor so it doesn't read it back from disk
+        archived: False if the page is still being archived, see `ExtractionQueue.put`
     
     Returns:
         True if successful, False otherwise
     """
     try:
-        with open(extraction_stack_file, 'a', encoding='utf-8') as f:
-            f.write(html_filepath + '\n')
+        get_extraction_queue(extraction_stack_file).put(html_filepath, html_content, archived=archived)
         
         return True
         
@@ -168,28 +214,7 @@ def extract_urls_from_page(html_content: str, base_url: str) -> List[str]:
     
     # Filter out URLs that were already processed or are in stack
     try:
-        processed_urls = set()
-        stack_urls = set()
-        
-        # Get processed URLs from metadata file
-        if os.path.exists(WEB_PAGE_METADATA_FILE):
-            with open(WEB_PAGE_METADATA_FILE, 'r', encoding='utf-8') as f:
-                for line_num, line in enumerate(f, 1):
-                    if line_num == 1:  # Skip header line
-                        continue
-                    line = line.strip()
-                    if line:  # Skip empty lines
-                        parts = line.split('\t')
-                        if len(parts) >= 1:  # At least URL column exists
-                            processed_urls.add(parts[0])
-        
-        # Get URLs already in stack
-        if os.path.exists(URL_STACK_FILE):
-            with open(URL_STACK_FILE, 'r', encoding='utf-8') as f:
-                stack_urls = set(line.strip() for line in f)
-        
-        new_urls = [url for url in extracted_urls 
-                   if url not in processed_urls and url not in stack_urls]
+        new_urls = get_url_frontier().filter_unseen(extracted_urls)
         
         print(f"Found {len(new_urls)} new URLs.")
         
@@ -200,12 +225,13 @@ def extract_urls_from_page(html_content: str, base_url: str) -> List[str]:
         return []
 
 
-def download_stock_page(url: str) -> Dict[str, any]:
+def download_stock_page(url: str, session_pool: Optional[SessionPool] = None) -> Dict[str, any]:
     """
     Scrape a single stock page from Google Finance
     
     Args:
         url: The URL to scrape
+        session_pool: Optional pool of long-lived sessions to reuse (creates a new session if None)
     
     Returns:
         Dictionary with scraping results
@@ -221,20 +247,16 @@ def download_stock_page(url: str) -> Dict[str, any]:
         else:
             symbol = last_part
     
-    headers = get_enhanced_headers()
-    
     try:
-        session = requests.Session()
-        session.headers.update(headers)
-        
-        cookies = {
-            'CONSENT': 'YES+cb.20210328-17-p0.en+FX+667',
-            'SOCS': 'CAI',
-            'NID': '511=example_value'
-        }
-        session.cookies.update(cookies)
+        if session_pool is not None:
+            with session_pool.session() as session:
+                response = session.get(url, timeout=15)
+        else:
+            with requests.Session() as session:
+                session.headers.update(get_enhanced_headers())
+                session.cookies.update(CONSENT_COOKIES)
+                response = session.get(url, timeout=15)
         
-        response = session.get(url, timeout=15)
         response.raise_for_status()
         
         print(f"Successfully downloaded HTML from url: {url}")
@@ -259,25 +281,30 @@ def download_stock_page(url: str) -> Dict[str, any]:
         }
 
 
-def save_html_to_file(html_content: str, symbol: str, html_dir: str) -> str:
+def html_file_path(symbol: str, html_dir: str) -> str:
+    """Path a page downloaded now is stored under, e.g. html/AAPL_20251016_142146.html"""
+    filename = f"{symbol}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html"
+    return os.path.join(html_dir, filename)
+
+
+def save_html_to_file(html_content: str, symbol: str, html_dir: str, url: str = "", timestamp: str = "") -> str:
     """
-    Save HTML content to a file
+    Save HTML content to the compressed page archive
     
     Args:
         html_content: The HTML content to save
         symbol: Stock symbol for filename
-        html_dir: Directory to save the file
+        html_dir: Directory part of the page path
+        url: URL the page was downloaded from
+        timestamp: Download timestamp
     
     Returns:
-        Path to the saved file
+        Path the page is stored under
     """
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = f"{symbol}_{timestamp}.html"
-    filepath = os.path.join(html_dir, filename)
+    filepath = html_file_path(symbol, html_dir)
     
     try:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(html_content)
+        get_archive().put(filepath, html_content, url=url, timestamp=timestamp)
         
         print(f"HTML saved to: {filepath}")
         return filepath
@@ -306,50 +333,119 @@ def write_page_metadata(page_metadata: Dict[str, any], filename: str):
         f.write(f"{url}\t{html_file}\t{timestamp}\t{status}\n")
 
 
-def process_single_url_from_stack() -> bool:
+def finish_url(result: Dict[str, any], error: Optional[Exception] = None):
     """
-    Process a single URL from the stack file
+    Record the metadata of a downloaded page once it is archived and remove its URL from the stack
     
-    Returns:
-        True if a URL was processed, False if stack is empty
+    A page that couldn't be archived has its URL put back on the stack to be downloaded
+    again, until it failed MAX_SAVE_ATTEMPTS times. Then the URL is removed and recorded
+    as a failure.
+    
+    Args:
+        result: Result of `download_stock_page` with the path the page was saved under
+        error: Why the page couldn't be archived
     """
-    url = read_and_remove_last_url()
+    if error is not None:
+        result["success"] = False
+        result["error"] = f"Failed to save HTML file: {error}"
+        result.pop("saved_file", None)
+        
+        attempts = release_url(result["url"])
+        if 0 < attempts < MAX_SAVE_ATTEMPTS:
+            print(f"Will retry {result['url']} ({attempts} of {MAX_SAVE_ATTEMPTS} attempts failed)")
+            return
+        print(f"Giving up on {result['url']}: {result['error']}")
     
-    if url is None:
-        print("No URLs remaining in stack")
-        return False
+    with file_write_lock:
+        write_page_metadata(result, WEB_PAGE_METADATA_FILE)
+    
+    mark_url_done(result["url"])
+
+
+def process_url(url: str, session_pool: Optional[SessionPool] = None,
+                archive_writer: Optional[AsyncArchiveWriter] = None) -> Dict[str, any]:
+    """
+    Download a single URL, save the page and record its metadata
+    
+    Safe to call from several downloader threads at once. With an archive writer the
+    page is handed to the extractor straight from memory and archived in the background.
+    The URL is only removed from the stack once the page is in the archive, so a page
+    lost by a crash before that is downloaded again.
     
+    Args:
+        url: The URL to process
+        session_pool: Optional pool of long-lived sessions to reuse
+        archive_writer: Optional background archive writer
+    
+    Returns:
+        Dictionary with scraping results
+    """
     print(f"\n{'='*60}")
     print(f"Processing URL: {url}")
     
-    result = download_stock_page(url)
+    result = download_stock_page(url, session_pool)
     
     if result["success"]:
-        filepath = save_html_to_file(
-            result["html_content"], 
-            result["symbol"], 
-            HTML_DIR
-        )
+        # Add extracted URLs to the stack if enabled
+        if ADD_EXTRACTED_URLS_TO_STACK:
+            extracted_urls = extract_urls_from_page(result["html_content"], url)
+            if extracted_urls:
+                add_urls_to_stack(extracted_urls)
         
-        if filepath:
-            add_html_to_extraction_stack(filepath)
+        if archive_writer is not None:
+            filepath = html_file_path(result["symbol"], HTML_DIR)
             result["saved_file"] = filepath
+            add_html_to_extraction_stack(filepath, html_content=result["html_content"], archived=False)
             
-            # Add extracted URLs to the stack if enabled
-            if ADD_EXTRACTED_URLS_TO_STACK:
-                extracted_urls = extract_urls_from_page(result["html_content"], url)
-                if extracted_urls:
-                    add_urls_to_stack(extracted_urls)
-            
-            write_page_metadata(result, WEB_PAGE_METADATA_FILE)
+            def on_archived(error: Optional[Exception]):
+                get_extraction_queue(PAGE_EXTRACTION_STACK_FILE).archived(filepath, stored=error is None)
+                finish_url(result, error)
             
+            archive_writer.put(filepath, result["html_content"], url=url, timestamp=result["timestamp"],
+                               on_done=on_archived)
         else:
-            result["success"] = False
-            result["error"] = "Failed to save HTML file"
-            print(f"Failed to save HTML file for {result['symbol']}")
+            filepath = save_html_to_file(
+                result["html_content"], 
+                result["symbol"], 
+                HTML_DIR,
+                url=url,
+                timestamp=result["timestamp"]
+            )
+            
+            if filepath:
+                result["saved_file"] = filepath
+                # The page is on disk already and the extractor reads it back
+                add_html_to_extraction_stack(filepath)
+                finish_url(result)
+            else:
+                print(f"Failed to save HTML file for {result['symbol']}")
+                finish_url(result, OSError("archive write failed"))
     else:
         print(f"Failed to scrape url: {url}")
-        write_page_metadata(result, WEB_PAGE_METADATA_FILE)
+        finish_url(result)
+    
+    get_url_frontier().mark_seen([url])
+    
+    # The page is saved or queued, the downloader threads don't need to keep it in memory
+    result.pop("html_content", None)
+    
+    return result
+
+
+def process_single_url_from_stack() -> bool:
+    """
+    Process a single URL from the stack file
+    
+    Returns:
+        True if a URL was processed, False if stack is empty
+    """
+    url = read_and_remove_last_url()
+    
+    if url is None:
+        print("No URLs remaining in stack")
+        return False
+    
+    process_url(url)
     
     return True
 
@@ -377,76 +473,113 @@ def create_file_structure():
         os.makedirs(QUEUES_DIR)
     
 
-def downloader_worker():
+def downloader_worker(concurrency: int = DEFAULT_CONCURRENCY, host_rate: float = DEFAULT_HOST_RATE,
+                      pool_size: Optional[int] = None):
     """
     Downloads HTML pages from the URL stack and saves them.
+    
+    Args:
+        concurrency: Maximum number of downloads in flight
+        host_rate: Allowed requests per second for a single host
+        pool_size: Number of long-lived HTTP sessions (defaults to concurrency)
     """
     
-    print("Downloader Worker Started")
+    print(f"Downloader Worker Started (concurrency={concurrency}, host_rate={host_rate}/s)")
 
     create_file_structure()
 
-    while True:
-        if not process_single_url_from_stack():
-            print("No more URLs to process. Stopping downloader.")
-            break
-
-        delay = random.uniform(1, 3)
-        print(f"Waiting {delay:.1f} seconds before next download...")
-        time.sleep(delay)
-
+    frontier = get_url_frontier()
+    
+    # One long-lived session per download slot, closed when the downloader stops
+    session_pool = SessionPool(size=pool_size or concurrency, headers_factory=get_enhanced_headers, cookies=CONSENT_COOKIES)
+    # Pages are compressed and written to the archive off the download path
+    archive_writer = AsyncArchiveWriter(get_archive())
+    try:
+        downloader = ConcurrentDownloader(
+            functools.partial(process_url, session_pool=session_pool, archive_writer=archive_writer),
+            concurrency=concurrency,
+            host_rate=host_rate
+        )
+        downloader.run(frontier.pop_batch)
+    finally:
+        stats = session_pool.connection_stats()
+        print(f"Connections: {stats['new_connections']} new, {stats['reused_connections']} reused")
+        session_pool.close()
+        archive_writer.close()
+
+    print("No more URLs to process. Stopping downloader.")
     print(f"\n Downloading completed!")
 
 
 def extractor_worker():
     """
-    Processes HTML files from the extraction stack.
-    Waits 1s and retries if the stack is empty.
+    Processes HTML files from the extraction queue.
+    Starts on a page as soon as it is queued and stops when the queue is closed.
     """
     
     print("Extractor worker started")
     
     extractor = StockDataExtractor()
+    extraction_queue = get_extraction_queue(PAGE_EXTRACTION_STACK_FILE)
     
     while True:
+        item = extraction_queue.get()
+        if item is None:
+            break
+        html_file, html_content, queued_at = item
+        
         try:
-            with open(PAGE_EXTRACTION_STACK_FILE, "r+") as f:
-                lines = [line.strip() for line in f.readlines() if line.strip()]
-                if not lines:
-                    time.sleep(1)
-                    continue
-
-                html_file = lines.pop(0)
-                f.seek(0)
-                f.truncate()
-                f.writelines(line + "\n" for line in lines)
-
-            process_html_file(html_file, output_file=EXTRACTED_DATA_FILE, extractor=extractor)
-            print(f"Extracted data from: {html_file}")
-
-        except FileNotFoundError:
-            print("Extraction stack file not found, waiting...")
-            time.sleep(1)
+            if html_content is not None:
+                process_html_content(html_content, html_file, output_file=EXTRACTED_DATA_FILE, extractor=extractor)
+            else:
+                process_html_file(html_file, output_file=EXTRACTED_DATA_FILE, extractor=extractor)
+            latency_ms = (time.monotonic() - queued_at) * 1000
+            print(f"Extracted data from: {html_file} ({latency_ms:.1f} ms after download)")
         except Exception as e:
             print(f"Error in extractor: {e}")
-            time.sleep(1)
+        
+        extraction_queue.task_done(html_file)
+    
+    print("Extractor worker stopped")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Google Finance scraper")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="maximum number of downloads in flight")
+    parser.add_argument("--host-rate", type=float, default=DEFAULT_HOST_RATE,
+                        help="allowed requests per second for a single host (0 disables the limit)")
+    parser.add_argument("--pool-size", type=int, default=None,
+                        help="number of long-lived HTTP sessions (defaults to --concurrency)")
+    return parser.parse_args()
 
 
 def main():  
     """
     Main entry point — starts two workers in parallel:
       Downloader: fetches HTML pages.
-      Extractor: extracts data from HTML files.
+      Extractor: extracts data from HTML files handed over by the downloader.
     """
-    downloader = threading.Thread(target=downloader_worker, daemon=True)
+    args = parse_args()
+    
+    create_file_structure()
+    extraction_queue = get_extraction_queue(PAGE_EXTRACTION_STACK_FILE)
+    
+    downloader = threading.Thread(
+        target=downloader_worker,
+        kwargs={"concurrency": args.concurrency, "host_rate": args.host_rate, "pool_size": args.pool_size},
+        daemon=True
+    )
     extractor = threading.Thread(target=extractor_worker, daemon=True)
 
     downloader.start()
     extractor.start()
 
     downloader.join()
-    time.sleep(3)
-    extractor.join(timeout=2)
+    
+    # Let the extractor finish the queued pages, then stop it
+    extraction_queue.close()
+    extractor.join()
 
     print("All work completed!")
 
@@ -4,40 +4,74 @@ This script provides a simple way to search the indexed stock data.
 
 Usage:
     python search.py  # Uses full dataset, all records (recency-weighted)
+    python search.py --numpy  # Score queries with the vectorized NumPy backend
+    python search.py --workers 8  # Build a missing index with 8 processes
+    python search.py --shards 4  # Answer queries with 4 search processes, each searching a share of the documents
+
+Rows the scraper appends to the data file while searching are indexed in the
+background and show up in results within a few seconds.
 """
 
-import sys
+import argparse
+import os
 from indexer import StockIndexer
+from numeric_index import parse_range
+from sharded_search import ShardedIndexer
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Search the stock market TF-IDF index")
+    parser.add_argument("--numpy", action="store_true", help="score queries with the vectorized NumPy backend")
+    parser.add_argument("--workers", type=int, nargs='?', const=os.cpu_count() or 1, default=1,
+                        help="number of processes to build a missing index with (every CPU if no number is given)")
+    parser.add_argument("--shards", type=int, nargs='?', const=os.cpu_count() or 1, default=0,
+                        help="number of search processes, each searching a share of the documents "
+                             "(every CPU if no number is given)")
+    return parser.parse_args()
 
 
 def main():
-    # Parse command-line arguments
     # No example mode; always use full dataset
-    
-    for i, arg in enumerate(sys.argv[1:], 1):
-        pass
+    args = parse_args()
+    scoring_backend = 'numpy' if args.numpy else 'python'
+    build_workers = args.workers
+    search_workers = args.shards
     
     # Always use full data
     data_file = "data/extracted_data.tsv"
     print("Using full data file: data/extracted_data.tsv")
     
     print(f"\nInitializing indexer (recency-weighted, indexing all records)...")
-    indexer = StockIndexer(data_file=data_file)
+    indexer = StockIndexer(data_file=data_file, scoring_backend=scoring_backend, build_workers=build_workers)
     
     # Try to load existing index first
-    index_filename = f"indexes/{data_file.split('/')[-1].replace('.tsv', '_index.pkl')}"
+    index_path = f"indexes/{data_file.split('/')[-1].replace('.tsv', '_index')}"
     try:
-        indexer.load_index(index_filename)
+        indexer.load_index(index_path)
         print("\n✓ Loaded existing index")
     except FileNotFoundError:
         print("\n✗ No existing index found, building new one...")
         indexer.load_data()
         indexer.build_index()
-        indexer.save_index(index_filename)
-        print(f"✓ Index saved to {index_filename}")
+        indexer.save_index(index_path)
+        print(f"✓ Index saved to {index_path}")
+    
+    searcher = indexer
+    if search_workers:
+        # Shards search the segment files, so documents still held in memory are written out first
+        if indexer.index_directory.is_writer:
+            indexer.save_index(index_path)
+        searcher = ShardedIndexer(index_path, search_workers, scoring_backend)
+        print(f"✓ Searching with {searcher.workers} processes")
+        # Follows the manifest, so rows are searched once the writer flushes them to a segment file
+        searcher.start_background_updates()
+    
+    # Pick up newly extracted rows while searching. The search processes only read segment files,
+    # so they need new rows flushed on every update instead of once FLUSH_DOCS have piled up.
+    indexer.start_background_updates(flush=bool(search_workers))
     
     # Print statistics
-    indexer.print_statistics()
+    searcher.print_statistics()
     
     # Interactive search mode
     print("\n" + "=" * 100)
@@ -62,6 +96,11 @@ def main():
             # Parse search mode (AND/OR) and ranking method if specified
             require_all_terms = True  # Default to AND
             ranking_method = 'tfidf'  # Default to TF-IDF
+            latest_only = False  # Default to all snapshots
+            
+            if query.upper().startswith('LATEST:'):
+                latest_only = True
+                query = query[7:].strip()
             
             if query.upper().startswith('OR:'):
                 require_all_terms = False
@@ -78,28 +117,33 @@ def main():
                 ranking_method = 'tfidf'
                 query = query[6:].strip()
             
-            # Parse top_k if specified (e.g., "Nike:5" for top 5 results)
+            # Parse top_k if specified (e.g., "Nike:5" for top 5 results), range predicates like "price:100" also use ':'
             top_k = 10
-            if ':' in query:
-                query, top_k_str = query.rsplit(':', 1)
+            if ':' in query and parse_range(query.split()[-1]) is None:
+                head, top_k_str = query.rsplit(':', 1)
                 try:
                     top_k = int(top_k_str.strip())
+                    query = head
                 except ValueError:
                     pass
             
-            results = indexer.search(query.strip(), top_k=top_k, require_all_terms=require_all_terms, 
-                                   ranking_method=ranking_method)
+            results = searcher.search(query.strip(), top_k=top_k, require_all_terms=require_all_terms, 
+                                    ranking_method=ranking_method, latest_only=latest_only)
             
             # Show which mode was used
             mode = "AND" if require_all_terms else "OR"
             method = ranking_method.upper()
-            print(f"\n[Search mode: {mode} | Ranking: {method}]")
+            snapshots = "latest" if latest_only else "all"
+            print(f"\n[Search mode: {mode} | Ranking: {method} | Snapshots: {snapshots}]")
             
-            indexer.display_results(results)
+            searcher.display_results(results)
             
         except (KeyboardInterrupt, EOFError):
             break
     
+    if searcher is not indexer:
+        searcher.close()
+    indexer.close()
     print("\nGoodbye!")
 
 
@@ -121,6 +165,13 @@ def print_help():
     print("    Example: 'Nike' or 'TFIDF: Nike'")
     print("  - BM25: Better handling of term saturation and document length")
     print("    Example: 'BM25: exchange_nyse cap_large'")
+    print("\nSnapshots:")
+    print("  - LATEST: Only search the newest snapshot of every stock, goes before the other prefixes")
+    print("    Example: 'LATEST: OR: BM25: move_surge price_low'")
+    print("\nRange Filters (combine with any terms):")
+    print("  price:100..250   cap:>50B   change:<-3%   revenue:>=1B   employees:..500")
+    print("    Operators: low..high (either end optional), >, >=, <, <=, or an exact value")
+    print("    Example: 'exchange_nasdaq cap:>10B change:<-2%'")
     print("\nSpecial Query Terms:")
     print("  Symbols:     symbol_aapl, symbol_ibm, symbol_nke")
     print("  Exchanges:   exchange_nyse, exchange_nasdaq, exchange_nse")
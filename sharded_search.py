@@ -0,0 +1,205 @@
+import heapq
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from itertools import chain, count
+from typing import Dict, List, Optional, Tuple
+
+from indexer import StockIndexer
+
+
+class _Gather:
+    """Top k of the shards of one query, collected as the workers answer"""
+
+    def __init__(self, shards: int):
+        self.results: List[Optional[List[Tuple[int, float]]]] = []
+        self.remaining = shards
+        self.error: Optional[Exception] = None
+        self.done = threading.Event()
+
+    def add(self, ranked: Optional[List[Tuple[int, float]]]):
+        self.results.append(ranked)
+        self.remaining -= 1
+        if self.remaining == 0:
+            self.done.set()
+
+    def fail(self, error: Exception):
+        self.error = error
+        self.done.set()
+
+
+class ShardedIndexer(StockIndexer):
+    """
+    Searches a saved index directory with a pool of worker processes.
+
+    Every worker opens the segment files of the index itself. They are
+    memory-mapped, so all processes share one copy of the postings through the
+    OS page cache. A query is scattered to every worker, each ranks the
+    documents of one doc id range (its shard) and the top k of the shards are
+    merged here. Document frequencies, the document count, norms and lengths are
+    those of the whole index in every process, and every process ranks with the
+    same `now`, so a document gets the same score as in a single-process search
+    and the merged results are identical to it.
+
+    Every worker has a queue of requests tagged with a request id and answers
+    them in order, so queries from several threads are in flight at once: a
+    worker that is done with its shard of one query starts on the next one while
+    the others are still busy.
+
+    Only the segment files listed in the manifest are searched. Rows the writer of
+    the directory still holds in memory show up once it flushes them, `refresh`
+    switches to its newest manifest.
+    """
+
+    def __init__(self, path: str = "indexes/extracted_data_index", workers: Optional[int] = None,
+                 scoring_backend: str = 'python', query_cache_size: int = 1024):
+        super().__init__(scoring_backend=scoring_backend, query_cache_size=query_cache_size)
+        self.path = path
+        self.open_segments(path)
+
+        self._request_ids = count()
+        self._pending: Dict[int, _Gather] = {}  # request id -> query waiting for its shards
+        self._pending_lock = threading.Lock()
+        self._error: Optional[Exception] = None
+
+        self._results = multiprocessing.Queue()
+        self._requests = []
+        self._processes = []
+        for _ in range(workers or os.cpu_count() or 1):
+            requests = multiprocessing.Queue()
+            process = multiprocessing.Process(target=_serve_shard, daemon=True,
+                                              args=(requests, self._results, path, scoring_backend))
+            process.start()
+            self._requests.append(requests)
+            self._processes.append(process)
+
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    @property
+    def workers(self) -> int:
+        return len(self._processes)
+
+    def rank(self, query: str, top_k: int = 10, require_all_terms: bool = True, ranking_method: str = 'tfidf',
+             latest_only: bool = False, now: Optional[float] = None) -> List[Tuple[int, float]]:
+        """
+        Rank the documents of a query on the workers and merge their top k, see `StockIndexer.rank`
+
+        Safe to call from several threads at once, their queries are answered concurrently.
+        """
+        now = time.time() if now is None else now
+        while True:
+            with self._lock:
+                sequence = self._manifest_sequence
+                num_docs = len(self.doc_norms)
+
+            gather = _Gather(self.workers)
+            request_id = next(self._request_ids)
+            with self._pending_lock:
+                if self._error is not None:
+                    raise self._error
+                self._pending[request_id] = gather
+
+            # Equal doc id ranges, the postings of a term are spread evenly over them
+            bounds = [num_docs * i // self.workers for i in range(self.workers + 1)]
+            for requests, start, end in zip(self._requests, bounds, bounds[1:]):
+                requests.put((request_id, sequence, (start, end), query, top_k, require_all_terms,
+                              ranking_method, latest_only, now))
+            gather.done.wait()
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+            if gather.error is not None:
+                raise gather.error
+
+            if all(ranked is not None for ranked in gather.results):
+                # Sorted by score, ties by doc_id like `ranking.TopK`
+                return heapq.nsmallest(top_k, chain(*gather.results), key=lambda item: (-item[1], item[0]))
+            # A worker already saw a newer manifest than this process, unless another query switched already
+            with self._lock:
+                if self._manifest_sequence == sequence:
+                    self._reopen()
+
+    def _collect(self):
+        """Hand the answers of the workers to the queries waiting for them, until None is received"""
+        while True:
+            try:
+                answer = self._results.get(timeout=1.0)
+            except queue.Empty:
+                if all(process.is_alive() for process in self._processes):
+                    continue
+                # A dead worker never answers, every query waiting for it would wait forever
+                with self._pending_lock:
+                    self._error = RuntimeError("A search worker exited unexpectedly")
+                    for gather in self._pending.values():
+                        gather.fail(self._error)
+                    self._pending.clear()
+                return
+            if answer is None:
+                return
+
+            request_id, ranked = answer
+            with self._pending_lock:
+                gather = self._pending.get(request_id)
+            if gather is not None:
+                gather.add(ranked)
+
+    def refresh(self) -> int:
+        """
+        Switch to the segments the writer of the index has written since they were opened.
+
+        Returns the number of documents added.
+        """
+        with self._lock:
+            if self.index_directory.read_manifest()['sequence'] == self._manifest_sequence:
+                return 0
+            return self._reopen()
+
+    def _reopen(self) -> int:
+        indexed = len(self.doc_norms)
+        self.open_segments(self.path)
+        return len(self.doc_norms) - indexed
+
+    def close(self):
+        """Stop background updates and the worker processes"""
+        super().close()
+        if not self._processes:
+            return
+        for requests in self._requests:
+            requests.put(None)
+        for process in self._processes:
+            process.join()
+        self._results.put(None)
+        self._collector.join()
+        for requests in self._requests:
+            requests.close()
+        self._results.close()
+        self._requests = []
+        self._processes = []
+
+
+def _serve_shard(requests, results, path: str, scoring_backend: str):
+    """
+    Answer the queries of a `ShardedIndexer` in a worker process until it sends None
+
+    Every request names the manifest the coordinator searches. A worker that has
+    an older one opens the newest manifest. If that still isn't the one asked for,
+    it answers None and the coordinator switches to the newest manifest too.
+    """
+    indexer = StockIndexer(scoring_backend=scoring_backend, query_cache_size=0)
+    sequence = indexer.open_segments(path)
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        request_id, manifest_sequence, shard, query, top_k, require_all_terms, ranking_method, latest_only, now = \
+            request
+        if manifest_sequence > sequence:
+            sequence = indexer.open_segments(path)
+        if manifest_sequence != sequence:
+            results.put((request_id, None))
+            continue
+
+        indexer.shard = shard
+        results.put((request_id, indexer.rank(query, top_k, require_all_terms, ranking_method, latest_only, now)))
@@ -1,6 +1,8 @@
 import os
 import csv
 
+from archive import get_archive
+
 from tiktoken._educational import *
 
 def calculate_statistics():
@@ -10,17 +12,27 @@ def calculate_statistics():
     return total_size_mb, total_tokens
 
 
-def calculate_all_size():
-    total_size = 0
-    html_dir = "html"
+def loose_html_files(html_dir: str = "html"):
+    """Paths of HTML files that are still stored as loose files instead of in the archive"""
+    if not os.path.isdir(html_dir):
+        return []
     
-    # Iterate through all files in html directory
+    archive = get_archive()
+    file_paths = []
     for filename in os.listdir(html_dir):
         file_path = os.path.join(html_dir, filename)
-        
-        # Get file size if it's a file (not directory)
-        if os.path.isfile(file_path):
-            total_size += os.path.getsize(file_path)
+        if os.path.isfile(file_path) and file_path not in archive:
+            file_paths.append(file_path)
+    return file_paths
+
+
+def calculate_all_size():
+    # Size of the downloaded HTML, archived pages count with their uncompressed size
+    total_size = sum(record.size for record in get_archive().records.values())
+    
+    # Add files that have not been archived yet
+    for file_path in loose_html_files():
+        total_size += os.path.getsize(file_path)
             
     # Convert to MB and round to 2 decimal places
     total_size_mb = round(total_size / (1024 * 1024), 2)
@@ -28,6 +40,15 @@ def calculate_all_size():
     return total_size_mb
 
 
+def calculate_stored_size():
+    # Compressed size of the archive segments on disk plus the loose files
+    stored_size = get_archive().stored_bytes()
+    for file_path in loose_html_files():
+        stored_size += os.path.getsize(file_path)
+    
+    return round(stored_size / (1024 * 1024), 2)
+
+
 def calculate_all_tokens():
     total_tokens = 0
     enc = SimpleBytePairEncoding.from_tiktoken("cl100k_base")
@@ -45,12 +66,7 @@ def calculate_all_tokens():
 
 
 def calculate_number_of_pages():
-    number_of_pages = 0
-    html_dir = "html"
-    for filename in os.listdir(html_dir):
-        file_path = os.path.join(html_dir, filename)
-        if os.path.isfile(file_path):
-            number_of_pages += 1
+    number_of_pages = len(get_archive()) + len(loose_html_files())
     return number_of_pages
 
 def main():
@@ -59,11 +75,13 @@ def main():
     total_size_mb, total_tokens = calculate_statistics()
     
     number_of_pages = calculate_number_of_pages()
+    stored_size_mb = calculate_stored_size()
     
     total_size_gb = round(total_size_mb / 1024, 3)
     
     print(f"Total size: {total_size_gb} GB")
     print(f"Total size: {total_size_mb} MB")
+    print(f"Stored size (compressed): {stored_size_mb} MB")
     print(f"Number of pages: {number_of_pages}")
     print(f"Relevant pages: 100%")
     print(f"Total tokens: {total_tokens}")
@@ -72,6 +90,7 @@ def main():
         file.write(f"Total size: {total_size_mb} MB\n")
         total_size_gb = round(total_size_mb / 1024, 3)
         file.write(f"Total size: {total_size_gb} GB\n")
+        file.write(f"Stored size (compressed): {stored_size_mb} MB\n")
         file.write(f"Number of pages: {number_of_pages}\n")   
         file.write(f"Relevant pages: 100%\n")
         file.write(f"Total tokens: {total_tokens}\n")
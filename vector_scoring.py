@@ -0,0 +1,107 @@
+from typing import List, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # Optional, StockIndexer falls back to the pure Python scorer
+    np = None
+
+from postings import PostingList
+
+
+def available() -> bool:
+    return np is not None
+
+
+def as_ndarray(values: Sequence, dtype) -> "np.ndarray":
+    """Zero-copy ndarray over an `array` or a memoryview into a segment file"""
+    return np.frombuffer(values, dtype=dtype)
+
+
+def recency_weights(timestamps: "np.ndarray", now: float, half_life_days: float) -> "np.ndarray":
+    """Vectorized `ranking.recency_weight`"""
+    if half_life_days <= 0:
+        return np.ones(len(timestamps))
+    age_days = np.maximum(now - timestamps.astype(np.float64), 0) / 86400.0
+    return np.exp(-np.log(2) * (age_days / half_life_days))
+
+
+def _accumulate(doc_ids: List["np.ndarray"], contributions: List["np.ndarray"], num_docs: int,
+                require_all: bool) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    Sum the contributions of every term per document
+
+    Returns:
+        (candidate doc ids, their summed scores) tuple, candidates match all terms
+        if `require_all` and any term otherwise
+    """
+    all_ids = np.concatenate(doc_ids)
+    scores = np.bincount(all_ids, weights=np.concatenate(contributions), minlength=num_docs)
+    counts = np.bincount(all_ids, minlength=num_docs)
+    candidates = np.flatnonzero(counts == len(doc_ids) if require_all else counts > 0)
+    return candidates, scores[candidates]
+
+
+def _select(candidates: "np.ndarray", scores: "np.ndarray", k: int) -> List[Tuple[int, float]]:
+    """Top k (doc_id, score) pairs sorted by score, ties by doc_id like `ranking.TopK`"""
+    if k <= 0 or len(candidates) == 0:
+        return []
+    if len(candidates) > k:
+        kth = -np.partition(-scores, k - 1)[k - 1]
+        above = np.flatnonzero(scores > kth)
+        # Candidates are sorted by doc id, so the first ties are the lowest doc ids
+        ties = np.flatnonzero(scores == kth)[:k - len(above)]
+        chosen = np.concatenate([above, ties])
+        candidates, scores = candidates[chosen], scores[chosen]
+    order = np.lexsort((candidates, -scores))
+    return [(int(doc_id), float(score)) for doc_id, score in zip(candidates[order], scores[order])]
+
+
+def tfidf_top_k(terms: List[Tuple[PostingList, float]], doc_norms: Sequence, timestamps: Sequence, now: float,
+                half_life_days: float, k: int, require_all: bool) -> List[Tuple[int, float]]:
+    """
+    TF-IDF cosine top k over whole posting arrays
+
+    Args:
+        terms: (postings, query weight * idf / query norm) for every query term
+        doc_norms: L2 norm of every document
+        timestamps: Snapshot time of every document, recency decays from `now` with `half_life_days`
+    """
+    if not terms:
+        return []
+    doc_ids = [as_ndarray(postings.doc_ids, np.int32) for postings, _ in terms]
+    contributions = [as_ndarray(postings.weights, np.float32).astype(np.float64) * factor
+                     for postings, factor in terms]
+    candidates, scores = _accumulate(doc_ids, contributions, len(doc_norms), require_all)
+
+    norms = as_ndarray(doc_norms, np.float64)[candidates]
+    scores = np.divide(scores, norms, out=scores, where=norms > 0)
+    scores *= recency_weights(as_ndarray(timestamps, np.int64)[candidates], now, half_life_days)
+    return _select(candidates, scores, k)
+
+
+def bm25_top_k(terms: List[Tuple[PostingList, float]], doc_lengths: Sequence, avg_doc_length: float,
+               timestamps: Sequence, now: float, half_life_days: float, k: int, require_all: bool,
+               k1: float, b: float) -> List[Tuple[int, float]]:
+    """
+    BM25 top k over whole posting arrays
+
+    Args:
+        terms: (postings, query term count * idf) for every query term
+        doc_lengths: Number of terms of every document
+        timestamps: Snapshot time of every document, recency decays from `now` with `half_life_days`
+    """
+    if not terms:
+        return []
+    lengths = as_ndarray(doc_lengths, np.uint32)
+    doc_ids = []
+    contributions = []
+    for postings, factor in terms:
+        ids = as_ndarray(postings.doc_ids, np.int32)
+        tfs = as_ndarray(postings.tfs, np.uint32).astype(np.float64)
+        denominators = tfs + k1 * (1 - b + b * (lengths[ids] / avg_doc_length))
+        doc_ids.append(ids)
+        contributions.append(factor * ((k1 + 1) * tfs / denominators))
+    candidates, scores = _accumulate(doc_ids, contributions, len(doc_lengths), require_all)
+
+    scores *= recency_weights(as_ndarray(timestamps, np.int64)[candidates], now, half_life_days)
+    return _select(candidates, scores, k)